@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from chat_stream import read_offsets
+from generate_clips import load_chat_histogram, merge_clip_windows, score_clip_windows
+from hype_engine import find_hype_peaks, message_histogram
+
+# Parsing and peak detection are CPU bound, so batches fan out over processes
+BATCH_WORKERS = int(os.getenv("BATCH_ANALYSIS_WORKERS", "0")) or os.cpu_count() or 1
+# Workers are spawned, not forked: the server already runs threads, and a
+# forked child would inherit whatever locks they held at that moment
+_SPAWN = multiprocessing.get_context("spawn")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The pool shared by every batch, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=_SPAWN)
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def rank_windows(counts):
+    """Hype windows of a histogram as dicts, best first."""
+    peaks = find_hype_peaks(counts)
+    scored = score_clip_windows(merge_clip_windows(peaks), peaks)
+    scored.sort(key=lambda w: (-w[2], w[0]))
+    return [{"start": start, "end": end, "score": score} for start, end, score in scored]
+
+
+def analyze_chat_file(chat_path):
+    offsets = read_offsets(chat_path)
+    return {
+        "source": chat_path,
+        "messages": int(len(offsets)),
+        "windows": rank_windows(message_histogram(offsets)),
+    }
+
+
+def analyze_vod(twitch_url, start_time="00:00:00", end_time="00:00:00"):
+    # Downloads (only the uncovered chat) through the shared chat cache
+    with tempfile.TemporaryDirectory(prefix="batch-") as workspace:
+        counts = load_chat_histogram(twitch_url, start_time, end_time, workspace=workspace,
+                                     progress=lambda message, **_: None)
+    return {
+        "source": twitch_url,
+        "messages": int(counts.sum()),
+        "windows": rank_windows(counts),
+    }
+
+
+def _collect(executor, fn, items, job):
+    results = [None] * len(items)
+    futures = {executor.submit(fn, *item): i for i, item in enumerate(items)}
+    pending = set(futures)
+    try:
+        while pending:
+            if job is not None:
+                job.check()
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    print(f"❌ Batch analysis failed for {items[i][0]}: {e}")
+                    results[i] = {"source": items[i][0], "error": str(e), "windows": []}
+    finally:
+        # Cancelled or failed: don't leave the rest of the batch queued in the pool
+        for future in pending:
+            future.cancel()
+    return results
+
+
+def _run_batch(fn, items, workers=None, job=None):
+    """``fn(*item)`` for every item on the shared pool, or on a pool of its own of ``workers`` processes."""
+    if not workers:
+        return _collect(get_pool(), fn, items, job)
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(items) or 1)), mp_context=_SPAWN) as executor:
+        return _collect(executor, fn, items, job)
+
+
+def analyze_chat_files(chat_paths, workers=None, job=None):
+    """Ranked windows for many saved chat files, one result per file in input order."""
+    return _run_batch(analyze_chat_file, [(path,) for path in chat_paths], workers, job)
+
+
+def analyze_vods(vods, workers=None, job=None):
+    """Ranked windows for many VODs given as (twitch_url, start_time, end_time) tuples.
+
+    With a scheduler ``job``, cancelling it drops the VODs not started yet.
+    """
+    return _run_batch(analyze_vod, list(vods), workers, job)
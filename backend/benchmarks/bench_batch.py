@@ -0,0 +1,71 @@
+"""Batch analysis throughput versus worker count over a directory of synthetic chats.
+
+Usage (from backend/):
+    python -m benchmarks.bench_batch --files 16 --comments 200000
+    python -m benchmarks.bench_batch --dir path/to/chats
+"""
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+
+from batch_analysis import analyze_chat_files
+from benchmarks.synthetic_chat import write_synthetic_chat
+
+
+def worker_counts(max_workers):
+    counts, n = [], 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    return counts + [max_workers]
+
+
+def bench(paths, max_workers):
+    results = []
+    for workers in worker_counts(max_workers):
+        start = time.perf_counter()
+        analyze_chat_files(paths, workers=workers)
+        elapsed = time.perf_counter() - start
+        results.append({"workers": workers, "seconds": elapsed, "files_per_second": len(paths) / elapsed})
+    base = results[0]["seconds"]
+    for r in results:
+        r["speedup"] = base / r["seconds"]
+        r["efficiency"] = r["speedup"] / r["workers"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", help="directory of chat .json files (default: generate synthetic ones)")
+    parser.add_argument("--files", type=int, default=16)
+    parser.add_argument("--comments", type=int, default=200_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.dir:
+            paths = sorted(glob.glob(os.path.join(args.dir, "*.json")))
+        else:
+            paths = []
+            for i in range(args.files):
+                path = os.path.join(tmp, f"vod_{i}.json")
+                write_synthetic_chat(path, args.comments, duration=4 * 3600, bursts=30, seed=i)
+                paths.append(path)
+        results = bench(paths, args.max_workers)
+
+    if args.json:
+        print(json.dumps({"files": len(paths), "results": results}, indent=2))
+        return
+    print(f"{len(paths)} chat files")
+    print(f"{'workers':>8}{'time (s)':>12}{'files/s':>10}{'speedup':>10}{'efficiency':>12}")
+    for r in results:
+        print(f"{r['workers']:>8}{r['seconds']:>12.2f}{r['files_per_second']:>10.2f}"
+              f"{r['speedup']:>9.2f}x{r['efficiency']:>11.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Peak RSS and parse time: json.load versus the streaming parsers in chat_stream.
+
+Each parser runs in a fresh child process so the peak RSS numbers don't leak
+into each other.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chat_parse                      # synthetic 100k and 1M comment files
+    python -m benchmarks.bench_chat_parse --file chat.json     # an existing chat download
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_chat import write_synthetic_chat
+
+MODES = ["baseline", "json.load", "read_offsets", "read_chat_signals"]
+
+
+def run_mode(mode, path):
+    start = time.perf_counter()
+    if mode == "json.load":
+        with open(path, "r", encoding="utf-8") as f:
+            chat = json.load(f)
+        count = len([int(c["content_offset_seconds"]) for c in chat["comments"]])
+    elif mode == "read_offsets":
+        from chat_stream import read_offsets
+        count = len(read_offsets(path))
+    elif mode == "read_chat_signals":
+        from chat_stream import read_chat_signals
+        count = len(read_chat_signals(path, commenters=True, emotes=True)["offsets"])
+    else:
+        # Interpreter + numpy import, subtracted from the others when reading the table
+        import numpy  # noqa: F401
+        count = 0
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"mode": mode, "comments": count, "seconds": elapsed, "peak_rss_mb": peak_kb / 1024}
+
+
+def measure(path):
+    results = []
+    for mode in MODES:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_chat_parse", "--child", mode, path],
+            check=True, capture_output=True, text=True,
+        )
+        results.append(json.loads(out.stdout))
+    return results
+
+
+def print_table(path, results):
+    size_mb = os.path.getsize(path) / (1 << 20)
+    print(f"\n{path} ({size_mb:.1f} MB)")
+    print(f"{'mode':<20}{'comments':>12}{'time (s)':>12}{'peak RSS (MB)':>16}")
+    for r in results:
+        print(f"{r['mode']:<20}{r['comments']:>12}{r['seconds']:>12.3f}{r['peak_rss_mb']:>16.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", action="append", help="chat file to parse (repeatable)")
+    parser.add_argument("--sizes", default="100000,1000000", help="synthetic comment counts")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(*args.child)))
+        return
+
+    all_results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = list(args.file or [])
+        if not paths:
+            for size in (int(s) for s in args.sizes.split(",")):
+                path = os.path.join(tmp, f"chat_{size}.json")
+                write_synthetic_chat(path, size, duration=max(3600, size // 50))
+                paths.append(path)
+        for path in paths:
+            results = measure(path)
+            all_results[os.path.basename(path)] = results
+            if not args.json:
+                print_table(path, results)
+    if args.json:
+        print(json.dumps(all_results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Timings: hype_engine versus the original per-second loops.
+
+That both produce the same peaks is checked in tests/test_hype_engine.py.
+
+Usage (from backend/):
+    python -m benchmarks.bench_hype_engine                 # 10k, 1M and 10M messages
+    python -m benchmarks.bench_hype_engine --sizes 10000
+"""
+import argparse
+import json
+import time
+from collections import defaultdict
+
+import numpy as np
+from scipy.signal import find_peaks
+
+from benchmarks.synthetic_chat import per_second_counts
+from hype_engine import find_hype_peaks, message_histogram
+
+
+# The loop based analysis exactly as generate_clips shipped it, kept as the reference
+def legacy_hybrid_peaks(offsets):
+    msg_count = defaultdict(int)
+    for offset in offsets:
+        msg_count[int(offset)] += 1
+
+    max_sec = max(msg_count.keys())
+    counts = [msg_count[i] for i in range(max_sec + 1)]
+    derivative = np.diff(counts, prepend=0)
+    peaks, _ = find_peaks(derivative, height=7)
+    global_peak_list = sorted([(p, derivative[p].item()) for p in peaks], key=lambda x: x[1], reverse=True)[:5]
+
+    local_peaks = []
+    for start in range(0, max_sec, 600):
+        end = min(start + 600, max_sec)
+        seg_counts = [msg_count[i] for i in range(start, end + 1)]
+        seg_derivative = np.diff(seg_counts, prepend=0)
+        seg_peaks, _ = find_peaks(seg_derivative, height=7)
+        heights = [(p + start, seg_derivative[p].item()) for p in seg_peaks]
+        local_peaks.extend(sorted(heights, key=lambda x: x[1], reverse=True)[:2])
+
+    peak_dict = {}
+    for sec, height in global_peak_list + local_peaks:
+        if sec not in peak_dict or height > peak_dict[sec]:
+            peak_dict[sec] = height
+    return sorted([(int(sec), peak_dict[sec]) for sec in peak_dict], key=lambda x: x[1], reverse=True)
+
+
+def synthetic_offsets(n_messages, seed=0):
+    duration = max(600, min(n_messages // 20, 12 * 3600))
+    counts = per_second_counts(n_messages, duration, bursts=max(3, duration // 900), seed=seed)
+    offsets = np.repeat(np.arange(duration, dtype=np.float64), counts)
+    return offsets + 0.5  # offsets are fractional seconds in newer chat downloads
+
+
+def bench(n_messages):
+    offsets = synthetic_offsets(n_messages)
+    start = time.perf_counter()
+    new = find_hype_peaks(message_histogram(offsets))
+    new_s = time.perf_counter() - start
+    start = time.perf_counter()
+    old = legacy_hybrid_peaks(offsets)
+    old_s = time.perf_counter() - start
+    assert new == old
+    return {"messages": n_messages, "legacy_s": old_s, "vectorized_s": new_s, "speedup": old_s / new_s}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,1000000,10000000")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = [bench(int(size)) for size in args.sizes.split(",")]
+    if args.json:
+        print(json.dumps({"results": results}, indent=2))
+        return
+    print(f"{'messages':>12}{'legacy (s)':>14}{'vectorized (s)':>16}{'speedup':>10}")
+    for r in results:
+        print(f"{r['messages']:>12}{r['legacy_s']:>14.3f}{r['vectorized_s']:>16.4f}{r['speedup']:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
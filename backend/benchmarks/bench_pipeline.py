@@ -0,0 +1,265 @@
+"""Timings of the chat analysis steps and of whole get_clips runs, with regression checks.
+
+Micro-benchmarks run build_msg_count, hybrid_analyze_chat and
+merge_clip_windows on synthetic chat files. The end-to-end run calls
+get_clips against stand-in TwitchDownloaderCLI and yt-dlp executables: chat
+comes from synthetic_chat and video sections are cut from a locally generated
+test video, so no network is involved. It is skipped when ffmpeg isn't on PATH.
+
+Usage (from backend/):
+    python -m benchmarks.bench_pipeline                          # 10k, 100k and 1M comments
+    python -m benchmarks.bench_pipeline --sizes 10000,10000000 --pattern clustered
+    python -m benchmarks.bench_pipeline --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_pipeline --baseline benchmarks/baseline.json   # exits 1 on a regression
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_chat import BURST_PATTERNS, write_synthetic_chat
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VOD_ID = "1000000000"
+
+TWITCH_DOWNLOADER_STANDIN = """#!{python}
+# TwitchDownloaderCLI stand-in: chatdownload writes a synthetic chat for -b..-e
+import os, sys
+sys.path.insert(0, {backend!r})
+from benchmarks.synthetic_chat import write_synthetic_chat
+
+args = sys.argv[1:]
+def opt(name):
+    return args[args.index(name) + 1]
+def seconds(value):
+    h, m, s = (int(part) for part in value.split(":"))
+    return h * 3600 + m * 60 + s
+
+start, end = seconds(opt("-b")), seconds(opt("-e"))
+write_synthetic_chat(opt("-o"), int(float(os.environ["BENCH_CHAT_RATE"]) * (end - start)), end - start, start,
+                     bursts=max(1, (end - start) // 600), seed=start, video_id=opt("--id"),
+                     pattern=os.environ.get("BENCH_BURST_PATTERN", "random"))
+"""
+
+YTDLP_STANDIN = """#!{python}
+# yt-dlp stand-in: --download-sections cuts the range out of a looped local test video
+import os, subprocess, sys
+
+args = sys.argv[1:]
+def opt(name):
+    return args[args.index(name) + 1]
+def seconds(value):
+    h, m, s = (float(part) for part in value.split(":"))
+    return h * 3600 + m * 60 + s
+
+if "--download-sections" not in args:
+    sys.exit("stand-in only supports --download-sections")
+start, end = (seconds(t) for t in opt("--download-sections").lstrip("*").split("-"))
+source, length = os.environ["BENCH_SOURCE_VIDEO"], float(os.environ["BENCH_SOURCE_SECONDS"])
+output = opt("-o")
+cmd = [os.environ.get("FFMPEG_BIN", "ffmpeg"), "-v", "error", "-y", "-stream_loop", "-1",
+       "-ss", f"{{start % length:.3f}}", "-i", source, "-t", f"{{end - start:.3f}}", "-c", "copy"]
+cmd += ["-f", "mpegts", "pipe:1"] if output == "-" else [output]
+sys.exit(subprocess.run(cmd).returncode)
+"""
+
+
+def timed(fn, repeat):
+    """(result of the last call, timings) for ``repeat`` calls of ``fn``."""
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        runs.append(time.perf_counter() - started)
+    return result, {"seconds": min(runs), "median_seconds": statistics.median(runs), "runs": len(runs)}
+
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def quiet(message, **_):
+    pass
+
+
+def chat_duration(n_comments):
+    # About 20 messages a second, between 10 minutes and 12 hours of VOD
+    return max(600, min(n_comments // 20, 12 * 3600))
+
+
+def micro_benchmarks(sizes, pattern, repeat, workdir):
+    from generate_clips import build_msg_count, hybrid_analyze_chat, merge_clip_windows
+    from hype_engine import find_hype_peaks
+
+    results = {}
+    for size in sizes:
+        chat_path = os.path.join(workdir, f"chat_{size}.json")
+        duration = chat_duration(size)
+        write_synthetic_chat(chat_path, size, duration, bursts=max(3, duration // 900), pattern=pattern)
+        counts, results[f"build_msg_count/{size}"] = timed(lambda: build_msg_count(chat_path), repeat)
+        _, results[f"hybrid_analyze_chat/{size}"] = timed(
+            lambda: hybrid_analyze_chat(progress=quiet, counts=counts), repeat)
+        peaks = find_hype_peaks(counts)
+        _, results[f"merge_clip_windows/{size}"] = timed(lambda: merge_clip_windows(peaks), repeat)
+        os.remove(chat_path)
+
+    # Far more peaks than a real VOD produces, to show how the merge scales
+    rng = np.random.default_rng(0)
+    many = [(int(sec), int(height)) for sec, height in zip(rng.integers(0, 12 * 3600, 100_000),
+                                                           rng.integers(7, 500, 100_000))]
+    _, results["merge_clip_windows/100000_peaks"] = timed(lambda: merge_clip_windows(many), repeat)
+    return results
+
+
+def install_standins(bindir, source, source_seconds, chat_rate, pattern):
+    """Put the stand-in tools on PATH and point the pipeline at them."""
+    os.makedirs(bindir, exist_ok=True)
+    tdcli = os.path.join(bindir, "TwitchDownloaderCLI")
+    for path, template in ((tdcli, TWITCH_DOWNLOADER_STANDIN), (os.path.join(bindir, "yt-dlp"), YTDLP_STANDIN)):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(template.format(python=sys.executable, backend=BACKEND_DIR))
+        os.chmod(path, 0o755)
+    os.environ.update({
+        "PATH": bindir + os.pathsep + os.environ.get("PATH", ""),
+        "TWITCH_DOWNLOADER_CLI": tdcli,
+        "BENCH_CHAT_RATE": str(chat_rate),
+        "BENCH_BURST_PATTERN": pattern,
+        "BENCH_SOURCE_VIDEO": source,
+        "BENCH_SOURCE_SECONDS": str(source_seconds),
+        # The stand-in yt-dlp has no HLS playlists to hand out
+        "USE_FRAGMENT_CACHE": "0",
+    })
+
+
+def end_to_end(vod_seconds, workdir):
+    """A cold get_clips run (chat downloaded) and a warm one (chat histogram cached)."""
+    from chat_download import format_timestamp
+    from generate_clips import get_clips
+
+    results = {}
+    for label in ("cold", "warm"):
+        output_dir = os.path.join(workdir, f"out_{label}")
+        cpu_before = children_cpu_seconds()
+        result, timing = timed(lambda: get_clips(
+            f"https://www.twitch.tv/videos/{VOD_ID}", "00:00:00", format_timestamp(vod_seconds),
+            project_id=f"bench-{label}", output_dir=output_dir, progress=quiet), 1)
+        timing["tool_cpu_seconds"] = children_cpu_seconds() - cpu_before
+        timing["clips"] = len(result.clips)
+        timing["failed"] = len(result.failed)
+        results[f"get_clips/{label}/{vod_seconds}s"] = timing
+    return results
+
+
+def compare(results, baseline, tolerance, min_seconds):
+    """Rows of (name, baseline s, current s, ratio, regressed) for metrics in both runs."""
+    rows = []
+    for name, current in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        ratio = current["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+        # Sub-millisecond timings are mostly noise
+        regressed = ratio > 1 + tolerance and current["seconds"] - before["seconds"] > min_seconds
+        rows.append((name, before["seconds"], current["seconds"], ratio, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comments per synthetic chat")
+    parser.add_argument("--pattern", choices=BURST_PATTERNS, default="random", help="burst placement")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per micro-benchmark (the fastest counts)")
+    parser.add_argument("--vod-seconds", type=int, default=3600, help="range of the end-to-end run")
+    parser.add_argument("--chat-rate", type=float, default=20, help="messages per second in the end-to-end run")
+    parser.add_argument("--media-height", type=int, default=720, help="height of the generated test video")
+    parser.add_argument("--no-e2e", action="store_true", help="only run the micro-benchmarks")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--baseline", help="compare against a results file saved earlier")
+    parser.add_argument("--save-baseline", help="write the results to this file as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing")
+    parser.add_argument("--min-seconds", type=float, default=0.005, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    # The pipeline creates its caches relative to the working directory on import;
+    # keep them, and the chat cache, out of the real ones
+    cwd = os.getcwd()
+    os.environ["CHAT_CACHE_DIR"] = os.path.join(workdir, "chat_cache")
+    ffmpeg = shutil.which(os.getenv("FFMPEG_BIN", "ffmpeg"))
+    run_e2e = not args.no_e2e and ffmpeg is not None
+    try:
+        if run_e2e:
+            from benchmarks.bench_smart_cut import make_test_video
+
+            source_seconds = 60
+            source = os.path.join(workdir, "source.mp4")
+            make_test_video(source, source_seconds, args.media_height, 30, 60)
+            install_standins(os.path.join(workdir, "bin"), source, source_seconds, args.chat_rate, args.pattern)
+        os.chdir(workdir)
+
+        results = micro_benchmarks([int(size) for size in args.sizes.split(",")], args.pattern,
+                                   args.repeat, workdir)
+        if run_e2e:
+            results.update(end_to_end(args.vod_seconds, workdir))
+        elif not args.no_e2e:
+            print("ffmpeg not found; skipping the end-to-end run", file=sys.stderr)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "pattern": args.pattern,
+            "clip_pipeline": os.getenv("CLIP_PIPELINE", "0"),
+            "clip_encode_mode": os.getenv("CLIP_ENCODE_MODE", "smart"),
+        },
+        "results": results,
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    rows = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            rows = compare(results, json.load(f), args.tolerance, args.min_seconds)
+
+    if args.json:
+        report["comparison"] = [
+            {"name": name, "baseline_seconds": before, "seconds": now, "ratio": ratio, "regressed": regressed}
+            for name, before, now, ratio, regressed in rows
+        ]
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'benchmark':<40}{'best (s)':>12}{'median (s)':>12}")
+        for name, r in results.items():
+            extra = f"  {r['clips']} clips, {r['tool_cpu_seconds']:.1f}s tool CPU" if "clips" in r else ""
+            print(f"{name:<40}{r['seconds']:>12.4f}{r['median_seconds']:>12.4f}{extra}")
+        if rows:
+            print(f"\n{'vs baseline':<40}{'before (s)':>12}{'now (s)':>12}{'change':>9}")
+            for name, before, now, ratio, regressed in rows:
+                print(f"{name:<40}{before:>12.4f}{now:>12.4f}{(ratio - 1) * 100:>8.0f}%"
+                      f"{'  REGRESSION' if regressed else ''}")
+    if any(row[4] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
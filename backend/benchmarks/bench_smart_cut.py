@@ -0,0 +1,84 @@
+"""CPU cost of smart-cut versus full re-encode on a locally generated test video.
+
+Needs ffmpeg and ffprobe on PATH. Usage (from backend/):
+    python -m benchmarks.bench_smart_cut
+    python -m benchmarks.bench_smart_cut --seconds 120 --height 1080 --fps 60 --gop 120
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+
+from smart_cut import FFMPEG, full_reencode, probe_video, smart_cut
+
+
+def make_test_video(path, seconds, height, fps, gop):
+    width = height * 16 // 9
+    subprocess.run([
+        FFMPEG, "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-c:v", "libx264", "-preset", "veryfast", "-g", str(gop), "-keyint_min", str(gop),
+        "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "128k", "-shortest", path,
+    ], check=True)
+
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def quiet_run(cmd):
+    return subprocess.run(cmd[:1] + ["-v", "error"] + cmd[1:], check=True)
+
+
+def measure(label, fn):
+    cpu_before, wall_before = children_cpu_seconds(), time.perf_counter()
+    fn()
+    return {
+        "mode": label,
+        "cpu_seconds": children_cpu_seconds() - cpu_before,
+        "wall_seconds": time.perf_counter() - wall_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=60, help="length of the generated source")
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--gop", type=int, default=120, help="keyframe interval in frames")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.mp4")
+        make_test_video(source, args.seconds, args.height, args.fps, args.gop)
+        # A clip that starts and ends mid-GOP, like a hype window does
+        start, end = args.seconds * 0.1 + 0.37, args.seconds * 0.9 - 0.41
+        full_out, smart_out = os.path.join(tmp, "full.mp4"), os.path.join(tmp, "smart.mp4")
+        results = [
+            measure("full", lambda: full_reencode(source, full_out, start, end, run=quiet_run)),
+            measure("smart", lambda: smart_cut(source, smart_out, start, end, workdir=tmp, run=quiet_run)),
+        ]
+        for r, path in zip(results, (full_out, smart_out)):
+            r["output_seconds"] = probe_video(path)["duration"]
+            r["output_mb"] = os.path.getsize(path) / (1 << 20)
+
+    ratio = results[0]["cpu_seconds"] / max(results[1]["cpu_seconds"], 1e-9)
+    if args.json:
+        print(json.dumps({"clip_seconds": end - start, "cpu_ratio": ratio, "results": results}, indent=2))
+        return
+    print(f"{args.height}p{args.fps} source, {end - start:.1f}s clip, keyframe every {args.gop} frames")
+    print(f"{'mode':<8}{'cpu (s)':>10}{'wall (s)':>10}{'clip (s)':>10}{'size (MB)':>11}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['cpu_seconds']:>10.2f}{r['wall_seconds']:>10.2f}"
+              f"{r['output_seconds']:>10.2f}{r['output_mb']:>11.1f}")
+    print(f"smart cut uses {ratio:.1f}x less CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Synthetic TwitchDownloaderCLI chat files for benchmarks.
+
+Usage (from backend/):
+    python -m benchmarks.synthetic_chat out.json --comments 1000000 --duration 36000 --bursts 40
+    python -m benchmarks.synthetic_chat out.json --comments 10000000 --bursts 12 --pattern clustered
+"""
+import argparse
+import json
+import uuid
+
+import numpy as np
+
+COMMENT_TEMPLATE = (
+    '{{"_id":"{id}","created_at":"2025-07-10T01:58:07.144Z","channel_id":"{channel_id}",'
+    '"content_type":"video","content_id":"{video_id}","content_offset_seconds":{offset},'
+    '"commenter":{{"display_name":"viewer{user}","_id":"{user}","name":"viewer{user}","bio":null,'
+    '"created_at":"2024-02-22T06:46:45.464082Z","updated_at":"2025-07-10T01:38:28.182854Z","logo":null}},'
+    '"message":{{"body":{body},"bits_spent":0,"fragments":{fragments},"user_badges":[],'
+    '"user_color":"#1E90FF","emoticons":[]}}}}'
+)
+
+MESSAGES = ["LUL", "W", "no way", "POG", "clip it", "!time", "KEKW", "that was insane", "GG", "?"]
+EMOTES = {"LUL", "POG", "KEKW"}
+# Where a count of bursts is placed:
+#   random    - uniformly over the VOD
+#   periodic  - evenly spaced, like a recurring segment
+#   clustered - in a few tight groups, like a tense stretch of gameplay
+BURST_PATTERNS = ("random", "periodic", "clustered")
+
+
+def burst_centers(count, duration, pattern="random", rng=None):
+    rng = rng if rng is not None else np.random.default_rng(0)
+    if not duration or not count:
+        return []
+    if pattern == "random":
+        return rng.integers(0, duration, size=count)
+    if pattern == "periodic":
+        return (np.arange(count) + 0.5) * duration / count
+    if pattern == "clustered":
+        groups = rng.integers(0, duration, size=max(1, count // 4))
+        return np.clip(rng.choice(groups, size=count) + rng.integers(0, 120, size=count), 0, duration - 1)
+    raise ValueError(f"unknown burst pattern {pattern!r}")
+
+
+def per_second_counts(n_comments, duration, bursts=0, burst_width=20, burst_strength=25.0, seed=0,
+                      pattern="random"):
+    """Spread ``n_comments`` over ``duration`` seconds with ``bursts`` hype spikes.
+
+    ``bursts`` is either a count (placed according to ``pattern``) or a list of seconds.
+    """
+    rng = np.random.default_rng(seed)
+    rate = np.ones(duration, dtype=np.float64)
+    # Slow drift so the baseline isn't perfectly flat
+    rate += 0.5 * np.sin(np.linspace(0, 12 * np.pi, duration)) ** 2
+    if isinstance(bursts, int):
+        bursts = burst_centers(bursts, duration, pattern, rng)
+    for center in bursts:
+        lo = max(0, int(center))
+        hi = min(duration, lo + burst_width)
+        # Sharp onset, exponential decay: the shape chat spikes have in practice
+        rate[lo:hi] += burst_strength * np.exp(-np.arange(hi - lo) / (burst_width / 4))
+    return rng.multinomial(n_comments, rate / rate.sum()) if duration else np.zeros(0, dtype=np.int64)
+
+
+def write_synthetic_chat(path, n_comments, duration=3600, start=0, bursts=10, seed=0,
+                         video_id="1000000000", channel_id="100000", pattern="random"):
+    counts = per_second_counts(n_comments, duration, bursts, seed=seed, pattern=pattern)
+    rng = np.random.default_rng(seed + 1)
+    users = rng.integers(1, 5_000_000, size=min(n_comments, 1_000_000) or 1)
+    picks = rng.integers(0, len(MESSAGES), size=min(n_comments, 1_000_000) or 1)
+
+    header = {
+        "FileInfo": {"Version": {"Major": 1, "Minor": 4, "Patch": 0}},
+        "streamer": {"name": "synthetic", "login": "synthetic", "id": int(channel_id)},
+        "clipper": None,
+        "video": {"title": "Synthetic VOD", "id": video_id, "start": start, "end": start + duration,
+                  "length": start + duration},
+    }
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header)[:-1])
+        f.write(',"comments":[')
+        for sec, count in enumerate(counts):
+            for _ in range(int(count)):
+                i = written % len(users)
+                body = MESSAGES[picks[i]]
+                emoticon = '{"emoticon_id":"425618"}' if body in EMOTES else "null"
+                if written:
+                    f.write(",")
+                f.write(COMMENT_TEMPLATE.format(
+                    id=uuid.UUID(int=written + (seed << 64)),
+                    channel_id=channel_id,
+                    video_id=video_id,
+                    offset=start + sec,
+                    user=int(users[i]),
+                    body=json.dumps(body),
+                    fragments=f'[{{"text":{json.dumps(body)},"emoticon":{emoticon}}}]',
+                ))
+                written += 1
+        f.write('],"embeddedData":null}')
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic TwitchDownloaderCLI chat file")
+    parser.add_argument("output")
+    parser.add_argument("--comments", type=int, default=100_000)
+    parser.add_argument("--duration", type=int, default=3600, help="VOD length in seconds")
+    parser.add_argument("--start", type=int, default=0, help="offset of the first second")
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--pattern", choices=BURST_PATTERNS, default="random")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    n = write_synthetic_chat(args.output, args.comments, args.duration, args.start, args.bursts, args.seed,
+                             pattern=args.pattern)
+    print(f"Wrote {n} comments to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import contextlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within the process
+    fcntl = None
+
+# Per-VOD chat histograms, keyed by Twitch video id:
+#
+#   chat_cache/<video_id>/counts.npy   messages per second, indexed by VOD second
+#   chat_cache/<video_id>/<signal>.npy any other per-second signal stored alongside
+#   chat_cache/<video_id>/meta.json    covered ranges and size
+#
+# Arrays are memory-mapped on load, so a repeat analysis of a VOD costs a few
+# page faults instead of a chat download and a JSON parse. The meta file's
+# mtime doubles as the last-access time used for LRU eviction.
+
+CHAT_CACHE_DIR = os.getenv("CHAT_CACHE_DIR", "chat_cache")
+CHAT_CACHE_MAX_BYTES = int(os.getenv("CHAT_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+COUNTS = "counts"
+
+
+def merge_ranges(ranges):
+    """Union of half-open [start, end) ranges, sorted, with touching ranges joined."""
+    merged = []
+    for start, end in sorted(ranges):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def subtract_ranges(start, end, covered):
+    """Parts of [start, end) not inside any of the ``covered`` ranges."""
+    missing = []
+    cursor = start
+    for c_start, c_end in merge_ranges(covered):
+        if c_end <= cursor:
+            continue
+        if c_start >= end:
+            break
+        if c_start > cursor:
+            missing.append((cursor, c_start))
+        cursor = max(cursor, c_end)
+    if cursor < end:
+        missing.append((cursor, end))
+    return missing
+
+
+class ChatHistogramCache:
+    """Size-bounded on-disk cache of per-second chat signals.
+
+    Writes go through a temporary file and ``os.replace`` so readers that
+    already memory-mapped the old array keep a consistent view. Writers of
+    one VOD are serialized across threads with a lock and across processes
+    (batch analysis workers, other server workers) with a ``flock`` on
+    ``.<video_id>.lock``, held for the whole read-modify-write so two
+    writers of different ranges both end up in the merged arrays.
+    """
+
+    def __init__(self, cache_dir=CHAT_CACHE_DIR, max_bytes=CHAT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, video_id):
+        return os.path.join(self.cache_dir, str(video_id))
+
+    def _meta_path(self, video_id):
+        return os.path.join(self._entry_dir(video_id), "meta.json")
+
+    def _read_meta(self, video_id):
+        try:
+            with open(self._meta_path(video_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_meta(self, video_id, meta):
+        path = self._meta_path(video_id)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    @contextlib.contextmanager
+    def _entry_lock(self, video_id):
+        # Kept outside the entry directory so removing the entry doesn't drop the lock
+        with self._lock:
+            lock_file = open(os.path.join(self.cache_dir, f".{video_id}.lock"), "w")
+            try:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def _touch(self, video_id):
+        try:
+            os.utime(self._meta_path(video_id))
+        except FileNotFoundError:
+            pass
+
+    def coverage(self, video_id):
+        meta = self._read_meta(video_id)
+        return [tuple(r) for r in meta["coverage"]] if meta else []
+
+    def missing_ranges(self, video_id, start, end):
+        return subtract_ranges(start, end, self.coverage(video_id))
+
+    def covers(self, video_id, start, end):
+        return not self.missing_ranges(video_id, start, end)
+
+    def load(self, video_id, signal=COUNTS):
+        """Memory-mapped array for one signal of a VOD, or None if not cached."""
+        path = os.path.join(self._entry_dir(video_id), f"{signal}.npy")
+        try:
+            array = np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        self._touch(video_id)
+        return array
+
+    def histogram(self, video_id, start, end, signal=COUNTS):
+        """Per-second values for [start, end) laid out from second 0, or None on a miss.
+
+        Seconds before ``start`` are zero and trailing empty seconds are
+        trimmed, so the result matches a histogram built from a chat download
+        of exactly that range.
+        """
+        if not self.covers(video_id, start, end):
+            return None
+        mapped = self.load(video_id, signal)
+        if mapped is None:
+            return None
+        end = min(end, len(mapped))
+        values = np.zeros(max(end, 0), dtype=np.int64)
+        values[start:end] = mapped[start:end]
+        nonzero = np.flatnonzero(values)
+        return values[:nonzero[-1] + 1] if len(nonzero) else values[:0]
+
+    def store(self, video_id, start, end, signals):
+        """Record the per-second ``signals`` (name -> array indexed by VOD second) for [start, end).
+
+        Values inside the range replace what was cached before; everything
+        outside it is kept.
+        """
+        with self._entry_lock(video_id):
+            entry_dir = self._entry_dir(video_id)
+            os.makedirs(entry_dir, exist_ok=True)
+            meta = self._read_meta(video_id) or {"coverage": [], "signals": []}
+            for name, values in signals.items():
+                path = os.path.join(entry_dir, f"{name}.npy")
+                try:
+                    existing = np.load(path)
+                except FileNotFoundError:
+                    existing = np.zeros(0, dtype=np.int32)
+                merged = np.zeros(max(len(existing), end), dtype=np.int32)
+                merged[:len(existing)] = existing
+                new_values = np.asarray(values)[start:end]
+                merged[start:start + len(new_values)] = new_values
+                merged[start + len(new_values):end] = 0
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+                np.save(tmp, merged)
+                os.replace(tmp, path)
+                if name not in meta["signals"]:
+                    meta["signals"].append(name)
+            meta["coverage"] = [list(r) for r in merge_ranges(meta["coverage"] + [[start, end]])]
+            meta["bytes"] = sum(
+                os.path.getsize(os.path.join(entry_dir, f"{name}.npy")) for name in meta["signals"]
+            )
+            self._write_meta(video_id, meta)
+        self.evict(keep=video_id)
+
+    def remove(self, video_id):
+        with self._entry_lock(video_id):
+            shutil.rmtree(self._entry_dir(video_id), ignore_errors=True)
+
+    def entries(self):
+        """(video_id, bytes, last_access) for every cached VOD."""
+        result = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith("."):
+                continue
+            meta_path = os.path.join(self.cache_dir, name, "meta.json")
+            try:
+                last_access = os.path.getmtime(meta_path)
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    size = json.load(f).get("bytes", 0)
+            except (FileNotFoundError, NotADirectoryError, json.JSONDecodeError):
+                continue
+            result.append((name, size, last_access))
+        return result
+
+    def evict(self, keep=None):
+        """Drop least recently used VODs until the cache fits in ``max_bytes``."""
+        with self._lock:
+            entries = sorted(self.entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for video_id, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                if video_id == str(keep):
+                    continue
+                self.remove(video_id)
+                total -= size
+            return total
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "vods": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "oldest_access": min((e[2] for e in entries), default=None),
+        }
+
+
+chat_cache = ChatHistogramCache()
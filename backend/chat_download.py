@@ -0,0 +1,147 @@
+import heapq
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chat_stream import iter_comments
+
+TWITCH_DOWNLOADER_CLI = os.getenv("TWITCH_DOWNLOADER_CLI", "./TwitchDownloaderCLI")
+# Chunks of a long chat range downloaded at the same time
+CHAT_DOWNLOAD_WORKERS = int(os.getenv("CHAT_DOWNLOAD_WORKERS", "4"))
+# Ranges longer than this are split into chunks of about this many seconds
+CHAT_CHUNK_SECONDS = int(os.getenv("CHAT_CHUNK_SECONDS", "1800"))
+# Extra attempts per chunk before the whole download fails
+CHAT_DOWNLOAD_RETRIES = int(os.getenv("CHAT_DOWNLOAD_RETRIES", "2"))
+
+_COMMENTS_KEY_RE = re.compile(r'"comments"\s*:\s*\[')
+
+
+def format_timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def split_range(start, end, chunk_seconds=CHAT_CHUNK_SECONDS):
+    """Split [start, end) into consecutive chunks of at most ``chunk_seconds``."""
+    chunk_seconds = max(1, chunk_seconds)
+    return [(s, min(s + chunk_seconds, end)) for s in range(start, end, chunk_seconds)]
+
+
+def run_chat_download(video_id, start, end, output_path, run=None, retries=CHAT_DOWNLOAD_RETRIES):
+    """One TwitchDownloaderCLI chatdownload call, retried with backoff."""
+    cmd = [
+        TWITCH_DOWNLOADER_CLI,
+        "chatdownload",
+        "--id", str(video_id),
+        "-o", output_path,
+        "-b", format_timestamp(start),
+        "-e", format_timestamp(end),
+        "--collision", "Overwrite",
+    ]
+    run = run or (lambda c: subprocess.run(c, check=True))
+    for attempt in range(retries + 1):
+        try:
+            run(cmd)
+            return output_path
+        except subprocess.CalledProcessError as e:
+            if attempt == retries:
+                raise
+            delay = 2 ** attempt
+            print(f"⚠️ Chat chunk {format_timestamp(start)}-{format_timestamp(end)} failed ({e}), retrying in {delay}s...")
+            time.sleep(delay)
+
+
+def iter_merged_comments(chunk_paths):
+    """Comments of several chunk files as one stream ordered by offset, without duplicates.
+
+    Neighbouring chunks can both contain the comments at their shared
+    boundary; those are dropped by comment ``_id``. Duplicates always share an
+    offset, so only the ids of the current second are remembered.
+    """
+    streams = [iter_comments(path) for path in chunk_paths]
+    merged = heapq.merge(*streams, key=lambda c: c["content_offset_seconds"])
+    current_second = None
+    seen = set()
+    for comment in merged:
+        second = int(comment["content_offset_seconds"])
+        if second != current_second:
+            current_second = second
+            seen.clear()
+        comment_id = comment.get("_id")
+        if comment_id is not None:
+            if comment_id in seen:
+                continue
+            seen.add(comment_id)
+        yield comment
+
+
+def _read_header(path, chunk_size=1 << 16):
+    # Everything before the comments array, e.g. '{"FileInfo":...,"video":{...},"comments":['
+    buf = ""
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return '{"comments":['
+            buf += chunk
+            match = _COMMENTS_KEY_RE.search(buf)
+            if match:
+                return buf[:match.end()]
+
+
+def merge_chunk_files(chunk_paths, output_path):
+    """Write the chunks as one chat file in TwitchDownloaderCLI's format. Returns the comment count."""
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as out:
+        out.write(_read_header(chunk_paths[0]))
+        for comment in iter_merged_comments(chunk_paths):
+            if count:
+                out.write(",")
+            out.write(json.dumps(comment, ensure_ascii=False, separators=(",", ":")))
+            count += 1
+        out.write('],"embeddedData":null}')
+    return count
+
+
+def download_chat_range(video_id, start, end, output_path, run=None, workers=CHAT_DOWNLOAD_WORKERS,
+                        chunk_seconds=CHAT_CHUNK_SECONDS, retries=CHAT_DOWNLOAD_RETRIES, on_chunk_done=None):
+    """Download the chat of [start, end) seconds into ``output_path``.
+
+    Long ranges are split into chunks that are downloaded in parallel (at most
+    ``workers`` at a time), each retried on its own, then merged in order.
+    ``run`` executes a command (defaults to subprocess.run with check=True).
+    """
+    chunks = split_range(start, end, chunk_seconds)
+    if len(chunks) <= 1:
+        run_chat_download(video_id, start, end, output_path, run, retries)
+        return output_path
+
+    base, ext = os.path.splitext(output_path)
+    chunk_paths = [f"{base}.part{i}{ext}" for i in range(len(chunks))]
+    done = 0
+    done_lock = threading.Lock()
+
+    def fetch(i):
+        nonlocal done
+        chunk_start, chunk_end = chunks[i]
+        run_chat_download(video_id, chunk_start, chunk_end, chunk_paths[i], run, retries)
+        with done_lock:
+            done += 1
+            finished = done
+        if on_chunk_done:
+            on_chunk_done(finished, len(chunks))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            # list() re-raises the first chunk failure once retries are used up
+            list(executor.map(fetch, range(len(chunks))))
+        merge_chunk_files(chunk_paths, output_path)
+    finally:
+        for path in chunk_paths:
+            if os.path.exists(path):
+                os.remove(path)
+    return output_path
@@ -0,0 +1,132 @@
+import json
+import re
+from array import array
+
+import numpy as np
+
+# TwitchDownloaderCLI output is a single JSON document:
+#   {"FileInfo": {...}, "streamer": {...}, "video": {...}, "comments": [{...}, ...], "embeddedData": ...}
+# Full VODs from big channels are hundreds of MB, so nothing in here loads the
+# whole document. Memory use is one read chunk (plus one comment) on top of
+# the compact arrays that are returned.
+
+CHUNK_SIZE = 1 << 20
+
+_OFFSET_RE = re.compile(rb'"content_offset_seconds"\s*:\s*(-?[0-9]+(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)')
+# Longest possible `"content_offset_seconds": <number>` match we need to carry between chunks
+_OFFSET_TAIL = 128
+_NUMBER_END = frozenset(b",}] \t\r\n")
+_COMMENTS_KEY_RE = re.compile(r'"comments"\s*:\s*\[')
+_WHITESPACE = " \t\r\n"
+
+
+def read_offsets(chat_path, chunk_size=CHUNK_SIZE):
+    """Return every comment's ``content_offset_seconds`` as a float64 array.
+
+    Scans the raw bytes instead of decoding JSON; the key only ever appears on
+    comment objects (message text is escaped, so it can't forge the pattern).
+    """
+    offsets = array("d")
+    tail = b""
+    with open(chat_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            at_eof = not chunk
+            buf = tail + chunk
+            consumed = 0
+            for match in _OFFSET_RE.finditer(buf):
+                # A number not followed by a delimiter may continue in the next chunk
+                if not at_eof and (match.end() == len(buf) or buf[match.end()] not in _NUMBER_END):
+                    break
+                offsets.append(float(match.group(1)))
+                consumed = match.end()
+            if at_eof:
+                break
+            tail = buf[max(consumed, len(buf) - _OFFSET_TAIL):]
+    return np.frombuffer(offsets, dtype=np.float64) if offsets else np.zeros(0, dtype=np.float64)
+
+
+def iter_comments(chat_path, chunk_size=CHUNK_SIZE):
+    """Yield the comment objects of a chat file one at a time."""
+    decoder = json.JSONDecoder()
+    with open(chat_path, "r", encoding="utf-8") as f:
+        buf = ""
+        # Skip ahead to the start of the comments array
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buf += chunk
+            match = _COMMENTS_KEY_RE.search(buf)
+            if match:
+                buf = buf[match.end():]
+                break
+            # Keep enough to find a key split across two chunks
+            buf = buf[-32:]
+
+        pos = 0
+        eof = False
+        while True:
+            # Skip separators between comments
+            while pos < len(buf) and (buf[pos] in _WHITESPACE or buf[pos] == ","):
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                if pos >= len(buf):
+                    raise ValueError("need more data")
+                comment, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    if pos >= len(buf):
+                        return
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield comment
+            pos = end
+
+
+def _commenter_id(comment):
+    commenter = comment.get("commenter") or {}
+    try:
+        return int(commenter.get("_id") or -1)
+    except (TypeError, ValueError):
+        return -1
+
+
+def _emote_count(comment):
+    message = comment.get("message") or {}
+    fragments = message.get("fragments") or []
+    return sum(1 for fragment in fragments if fragment.get("emoticon"))
+
+
+def read_chat_signals(chat_path, commenters=False, emotes=False, chunk_size=CHUNK_SIZE):
+    """Offsets plus optional per-comment commenter ids and emote counts.
+
+    Returns a dict of parallel numpy arrays: ``offsets`` (float64) and, when
+    requested, ``commenters`` (int64, -1 for anonymous) and ``emotes`` (int32).
+    Without extra signals this is the fast ``read_offsets`` scan.
+    """
+    if not commenters and not emotes:
+        return {"offsets": read_offsets(chat_path, chunk_size)}
+
+    offsets = array("d")
+    commenter_ids = array("q")
+    emote_counts = array("l")
+    for comment in iter_comments(chat_path, chunk_size):
+        offsets.append(float(comment["content_offset_seconds"]))
+        if commenters:
+            commenter_ids.append(_commenter_id(comment))
+        if emotes:
+            emote_counts.append(_emote_count(comment))
+
+    signals = {"offsets": np.array(offsets, dtype=np.float64)}
+    if commenters:
+        signals["commenters"] = np.array(commenter_ids, dtype=np.int64)
+    if emotes:
+        signals["emotes"] = np.array(emote_counts, dtype=np.int32)
+    return signals
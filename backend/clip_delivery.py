@@ -0,0 +1,250 @@
+import math
+import mimetypes
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+from resource_scheduler import resources
+from smart_cut import FFMPEG, has_audio, probe_video
+
+# Serving finished clips, and the previews built next to them once a job is
+# done:
+#
+#   clips/<user>/<project>/<clip>.mp4
+#   clips/<user>/<project>/<clip>.assets/hls/master.m3u8        (CLIP_HLS=1)
+#   clips/<user>/<project>/<clip>.assets/hls/<360p|720p|source>/index.m3u8
+#   clips/<user>/<project>/<clip>.assets/sprite.jpg             (CLIP_SPRITES=1)
+#   clips/<user>/<project>/<clip>.assets/sprite.vtt
+#
+# Nothing under clips/ is rewritten once its project's job has finished
+# (previews are built in a temporary directory and renamed in), so from then
+# on every file is served with a strong ETag and as immutable. While the job
+# runs a clip may still be partly written, so it is only served for
+# revalidation.
+
+CLIP_HLS = os.getenv("CLIP_HLS", "0") == "1"
+CLIP_SPRITES = os.getenv("CLIP_SPRITES", "0") == "1"
+# Renditions below the source height; the source itself is always included (stream-copied)
+CLIP_HLS_RENDITIONS = [int(h) for h in os.getenv("CLIP_HLS_RENDITIONS", "360,720").split(",") if h.strip()]
+HLS_SEGMENT_SECONDS = 4
+RENDITION_BITRATES = {240: "400k", 360: "800k", 480: "1400k", 720: "2800k", 1080: "5000k"}
+SPRITE_COLUMNS = 10
+SPRITE_THUMB_WIDTH = 160
+# At most this many thumbnails per clip, and no more than one a second
+SPRITE_MAX_FRAMES = 100
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+mimetypes.add_type("text/vtt", ".vtt")
+
+_lock = threading.Lock()
+counters = {
+    "requests": 0, "range_requests": 0, "not_modified": 0, "not_final": 0,
+    "hls_built": 0, "sprites_built": 0, "postprocess_failures": 0, "postprocess_seconds": 0.0,
+}
+
+
+def _count(key, value=1):
+    with _lock:
+        counters[key] += value
+
+
+def assets_dir(clip_path):
+    return os.path.splitext(clip_path)[0] + ".assets"
+
+
+def resolve(root, relative_path):
+    """Absolute path of a file inside ``root``, or None if it's outside or missing."""
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, relative_path))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+
+def etag(stat_result):
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def file_response(path, request: Request, immutable=True):
+    """Serve a clip file with Range support and ETag caching headers.
+
+    Only final files are marked ``immutable``; anything else must be
+    revalidated (a cheap 304 while it's unchanged).
+    """
+    st = os.stat(path)
+    tag = etag(st)
+    headers = {"ETag": tag, "Cache-Control": CACHE_CONTROL if immutable else REVALIDATE, "Accept-Ranges": "bytes"}
+    _count("requests")
+    if not immutable:
+        _count("not_final")
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or tag in [t.strip() for t in if_none_match.split(",")]):
+        _count("not_modified")
+        return Response(status_code=304, headers=headers)
+    if "range" in request.headers:
+        _count("range_requests")
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
+
+
+def previews(clip_path, exists=os.path.isfile):
+    """URL paths (relative to the server root) of a clip's finished previews."""
+    base = assets_dir(clip_path)
+    found = {}
+    for name, rel in (("hls", os.path.join("hls", "master.m3u8")), ("sprite", "sprite.vtt")):
+        path = os.path.join(base, rel)
+        found[name] = path.replace(os.sep, "/") if exists(path) else None
+    return found
+
+
+def hls_variants(source_height):
+    """Names of the renditions built for a source of this height, smallest first."""
+    return [f"{h}p" for h in sorted(h for h in CLIP_HLS_RENDITIONS if h < source_height)] + ["source"]
+
+
+def hls_command(source, out_dir, source_height, audio=True, threads=None):
+    """One ffmpeg pass writing every rendition plus a master playlist into ``out_dir``."""
+    names = hls_variants(source_height)
+    heights = [int(name[:-1]) for name in names[:-1]]
+    cmd = [FFMPEG, "-y", "-i", source]
+    if heights:
+        split = f"[0:v]split={len(heights)}" + "".join(f"[v{i}]" for i in range(len(heights)))
+        scales = [f"[v{i}]scale=-2:{h}[v{i}o]" for i, h in enumerate(heights)]
+        cmd += ["-filter_complex", ";".join([split] + scales)]
+    for i in range(len(heights)):
+        cmd += ["-map", f"[v{i}o]"] + (["-map", "0:a:0"] if audio else [])
+    cmd += ["-map", "0:v:0"] + (["-map", "0:a:0"] if audio else [])
+    for i, h in enumerate(heights):
+        bitrate = RENDITION_BITRATES.get(h) or f"{max(400, h * 4)}k"
+        cmd += [f"-c:v:{i}", "libx264", f"-b:v:{i}", bitrate, f"-maxrate:v:{i}", bitrate,
+                f"-bufsize:v:{i}", bitrate]
+    cmd += [f"-c:v:{len(heights)}", "copy"]
+    if heights:
+        # Segment boundaries of the encoded renditions line up
+        cmd += ["-preset", "veryfast",
+                "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})"]
+    if audio:
+        cmd += ["-c:a", "aac", "-b:a", "128k"]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    stream_map = " ".join(
+        f"v:{i},a:{i},name:{name}" if audio else f"v:{i},name:{name}" for i, name in enumerate(names)
+    )
+    cmd += [
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(out_dir, "%v", "seg_%03d.ts"),
+        "-master_pl_name", "master.m3u8",
+        "-var_stream_map", stream_map,
+        os.path.join(out_dir, "%v", "index.m3u8"),
+    ]
+    return cmd
+
+
+def sprite_layout(duration, width, height):
+    """(interval seconds, thumbnail count, thumb width, thumb height, columns, rows)."""
+    interval = max(1.0, duration / SPRITE_MAX_FRAMES)
+    count = max(1, math.ceil(duration / interval))
+    thumb_h = 2 * round(SPRITE_THUMB_WIDTH * height / width / 2) if width and height else 90
+    columns = min(SPRITE_COLUMNS, count)
+    return interval, count, SPRITE_THUMB_WIDTH, thumb_h, columns, math.ceil(count / columns)
+
+
+def sprite_command(source, output, interval, thumb_w, thumb_h, columns, rows, threads=None):
+    cmd = [FFMPEG, "-y", "-i", source,
+           "-vf", f"fps={1 / interval:.6f},scale={thumb_w}:{thumb_h},tile={columns}x{rows}",
+           "-frames:v", "1", "-q:v", "5"]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    return cmd + [output]
+
+
+def _timestamp(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+
+def sprite_vtt(image_name, duration, interval, count, thumb_w, thumb_h, columns):
+    """WebVTT thumbnail track pointing each time range at its tile of the sprite."""
+    lines = ["WEBVTT", ""]
+    for i in range(count):
+        start, end = i * interval, min((i + 1) * interval, duration)
+        x, y = (i % columns) * thumb_w, (i // columns) * thumb_h
+        lines += [f"{_timestamp(start)} --> {_timestamp(end)}", f"{image_name}#xywh={x},{y},{thumb_w},{thumb_h}", ""]
+    return "\n".join(lines)
+
+
+def _run(cmd, job=None):
+    if job is not None:
+        return job.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def _files(directory):
+    return [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+
+
+def postprocess_clip(clip_path, job=None, hls=CLIP_HLS, sprites=CLIP_SPRITES):
+    """Build the enabled previews for a finished clip; returns the files written.
+
+    Previews already in place are kept. Errors are left to the caller; a
+    failed preview leaves nothing behind.
+    """
+    if not (hls or sprites):
+        return []
+    started = time.monotonic()
+    base = assets_dir(clip_path)
+    tmp = f"{base}.{os.getpid()}.{os.urandom(4).hex()}.tmp"
+    written = []
+    try:
+        info = probe_video(clip_path)
+        width, height, duration = int(info.get("width") or 0), int(info.get("height") or 0), info["duration"]
+        os.makedirs(tmp)
+        with resources.cpu(job) as threads:
+            if hls and not os.path.exists(os.path.join(base, "hls")):
+                out_dir = os.path.join(tmp, "hls")
+                for name in hls_variants(height):
+                    os.makedirs(os.path.join(out_dir, name))
+                _run(hls_command(clip_path, out_dir, height, has_audio(clip_path), threads), job)
+                _count("hls_built")
+            if sprites and duration > 0 and not os.path.exists(os.path.join(base, "sprite.vtt")):
+                interval, count, thumb_w, thumb_h, columns, rows = sprite_layout(duration, width, height)
+                _run(sprite_command(clip_path, os.path.join(tmp, "sprite.jpg"), interval,
+                                    thumb_w, thumb_h, columns, rows, threads), job)
+                with open(os.path.join(tmp, "sprite.vtt"), "w", encoding="utf-8") as f:
+                    f.write(sprite_vtt("sprite.jpg", duration, interval, count, thumb_w, thumb_h, columns))
+                _count("sprites_built")
+        os.makedirs(base, exist_ok=True)
+        # The playlist/VTT is moved last so a reader never finds it before what it points at
+        for name in ("hls", "sprite.jpg", "sprite.vtt"):
+            src = os.path.join(tmp, name)
+            if os.path.exists(src):
+                os.replace(src, os.path.join(base, name))
+                dest = os.path.join(base, name)
+                written += _files(dest) if os.path.isdir(dest) else [dest]
+    except Exception:
+        _count("postprocess_failures")
+        raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+        _count("postprocess_seconds", time.monotonic() - started)
+    return written
+
+
+def stats():
+    with _lock:
+        result = dict(counters)
+    result["hls_enabled"] = CLIP_HLS
+    result["sprites_enabled"] = CLIP_SPRITES
+    result["hls_renditions"] = [f"{h}p" for h in CLIP_HLS_RENDITIONS] + ["source"]
+    return result
@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+
+# In-process index of the clip files on disk, so listing a user's projects
+# doesn't stat every clip. It is built by walking the clips directory once,
+# updated by the code that writes and deletes clips, and re-walked in the
+# background every CLIP_INDEX_RESCAN_SECONDS to pick up changes made
+# outside this process.
+
+CLIPS_DIR = "clips"
+CLIP_INDEX_RESCAN_SECONDS = float(os.getenv("CLIP_INDEX_RESCAN_SECONDS", "300"))
+
+
+def _key(path):
+    return os.path.abspath(path)
+
+
+class ClipIndex:
+    def __init__(self, root=CLIPS_DIR, rescan_seconds=CLIP_INDEX_RESCAN_SECONDS):
+        self.root = root
+        self.rescan_seconds = rescan_seconds
+        self._paths = set()
+        self._lock = threading.Lock()
+        self._built_at = None
+        self._rescanning = False
+        # Paths removed or added while a walk is running; the walk may have
+        # seen the directory before either happened
+        self._removed_during_scan = set()
+        self._added_during_scan = set()
+
+    def _walk(self):
+        found = set()
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                found.add(_key(os.path.join(root, name)))
+        return found
+
+    def build(self):
+        with self._lock:
+            if not self._rescanning:
+                self._rescanning = True
+                self._removed_during_scan.clear()
+                self._added_during_scan.clear()
+        found = self._walk()
+        with self._lock:
+            self._paths = (found - self._removed_during_scan) | self._added_during_scan
+            self._removed_during_scan.clear()
+            self._added_during_scan.clear()
+            self._built_at = time.monotonic()
+            self._rescanning = False
+
+    def _ensure_fresh(self):
+        with self._lock:
+            built_at = self._built_at
+            stale = built_at is not None and time.monotonic() - built_at > self.rescan_seconds
+            if stale and not self._rescanning:
+                self._rescanning = True
+                self._removed_during_scan.clear()
+                self._added_during_scan.clear()
+                threading.Thread(target=self.build, daemon=True).start()
+        if built_at is None:
+            # First use: nothing to serve until the directory has been walked
+            self.build()
+
+    def exists(self, path):
+        self._ensure_fresh()
+        with self._lock:
+            return _key(path) in self._paths
+
+    def add(self, path):
+        with self._lock:
+            self._paths.add(_key(path))
+            if self._rescanning:
+                self._added_during_scan.add(_key(path))
+                self._removed_during_scan.discard(_key(path))
+
+    def discard(self, path):
+        with self._lock:
+            self._paths.discard(_key(path))
+            if self._rescanning:
+                self._removed_during_scan.add(_key(path))
+                self._added_during_scan.discard(_key(path))
+
+    def discard_tree(self, directory):
+        """Forget every indexed file under ``directory``."""
+        prefix = _key(directory) + os.sep
+        with self._lock:
+            removed = {path for path in self._paths if path.startswith(prefix)}
+            self._paths -= removed
+            if self._rescanning:
+                self._removed_during_scan |= removed
+                self._added_during_scan -= removed
+
+    def __len__(self):
+        with self._lock:
+            return len(self._paths)
+
+
+clip_index = ClipIndex()
@@ -0,0 +1,130 @@
+import os
+import subprocess
+from contextlib import contextmanager
+from datetime import timedelta
+
+import requests
+
+from hls_fetcher import FRAGMENT_WORKERS, HLS_FORMAT, USE_FRAGMENT_CACHE, iter_range, vod_playlist
+from smart_cut import FFMPEG
+
+# Pipelined clipping: media flows from the downloader straight into ffmpeg
+# through a pipe, so encoding overlaps the download and no temporary copy of
+# the section is written to (and read back from) disk. ffmpeg can't seek in a
+# pipe, which rules out smart cuts; each clip is re-encoded while it streams.
+#
+#   fragment cache on:  cached/fetched HLS fragments -> ffmpeg stdin
+#   fragment cache off: yt-dlp -o - -> ffmpeg stdin
+CLIP_PIPELINE = os.getenv("CLIP_PIPELINE", "0") == "1"
+
+
+@contextmanager
+def _process(cmd, job=None, **kwargs):
+    if job is not None:
+        with job.process(cmd, **kwargs) as proc:
+            yield proc
+        return
+    proc = subprocess.Popen(cmd, **kwargs)
+    try:
+        yield proc
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+def encode_command(outputs, threads=None):
+    """ffmpeg reading the stream from stdin and writing one MP4 per (path, start, end).
+
+    ``start``/``end`` are seconds into the stream. Seeking is done on the
+    output side, so the frames before each clip are decoded and dropped.
+    """
+    cmd = [FFMPEG, "-y", "-i", "pipe:0"]
+    for path, start, end in outputs:
+        cmd += [
+            "-ss", f"{start:.3f}",
+            "-t", f"{end - start:.3f}",
+            "-map", "0:v:0",
+            "-map", "0:a:0?",
+            "-c:v", "libx264",
+            "-preset", "ultrafast",
+            "-c:a", "aac",
+            "-b:a", "128k",
+            "-movflags", "+faststart",
+        ]
+        if threads:
+            cmd += ["-threads", str(threads)]
+        cmd.append(path)
+    return cmd
+
+
+def _check(proc, cmd):
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def _pipe_fragments(chunks, cmd, job):
+    with _process(cmd, job, stdin=subprocess.PIPE) as ffmpeg:
+        try:
+            for data in chunks:
+                ffmpeg.stdin.write(data)
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its return code says why
+        finally:
+            try:
+                ffmpeg.stdin.close()
+            except BrokenPipeError:
+                pass
+        ffmpeg.wait()
+    if job is not None:
+        job.check()
+    _check(ffmpeg, cmd)
+
+
+def _pipe_ytdlp(twitch_url, start, end, cmd, job, workers=FRAGMENT_WORKERS):
+    download_cmd = [
+        "yt-dlp",
+        twitch_url,
+        "-f", HLS_FORMAT,
+        "--download-sections", f"*{timedelta(seconds=int(start))}-{timedelta(seconds=int(end))}",
+        "--concurrent-fragments", str(workers),
+        "--fragment-retries", "1",
+        "--no-cache-dir",
+        "--quiet",
+        "-o", "-",
+    ]
+    with _process(download_cmd, job, stdout=subprocess.PIPE) as downloader:
+        with _process(cmd, job, stdin=downloader.stdout) as ffmpeg:
+            # Only ffmpeg holds the read end now, so yt-dlp sees a broken
+            # pipe instead of blocking if ffmpeg dies
+            downloader.stdout.close()
+            ffmpeg.wait()
+        downloader.wait()
+    if job is not None:
+        job.check()
+    _check(downloader, download_cmd)
+    _check(ffmpeg, cmd)
+
+
+def pipe_section(twitch_url, vod_id, start, end, clips, job=None, threads=None, workers=FRAGMENT_WORKERS):
+    """Stream [start, end) of the VOD through one ffmpeg run that writes every clip.
+
+    ``clips`` is a list of (output path, clip start, clip end) in VOD seconds,
+    all inside [start, end). Raises CalledProcessError if a tool fails.
+    """
+    chunks = None
+    lead_in = 0.0
+    if USE_FRAGMENT_CACHE:
+        try:
+            lead_in, chunks = iter_range(vod_playlist(twitch_url, job), vod_id, start, end,
+                                        workers=workers, job=job)
+        except (subprocess.SubprocessError, requests.RequestException, OSError, ValueError) as e:
+            print(f"⚠️ Fragment cache unavailable ({e}), streaming with yt-dlp")
+    cmd = encode_command(
+        [(path, lead_in + s - start, lead_in + e - start) for path, s, e in clips], threads
+    )
+    if chunks is not None:
+        _pipe_fragments(chunks, cmd, job)
+    else:
+        _pipe_ytdlp(twitch_url, start, end, cmd, job, workers)
+    return [path for path, _, _ in clips]
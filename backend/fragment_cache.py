@@ -0,0 +1,132 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: eviction is only serialized within the process
+    fcntl = None
+
+# On-disk cache of HLS media fragments shared by every clip job (and every
+# worker process) on the box:
+#
+#   fragment_cache/<vod id>/<rendition>/<sequence>.ts
+#
+# Files are written to a temporary name and renamed into place, so readers
+# never see a partial fragment. A fragment's mtime is its last access time;
+# eviction removes the least recently used fragments once the cache grows
+# past its byte budget.
+
+FRAGMENT_CACHE_DIR = os.getenv("FRAGMENT_CACHE_DIR", "fragment_cache")
+FRAGMENT_CACHE_MAX_BYTES = int(os.getenv("FRAGMENT_CACHE_MAX_BYTES", str(10 * 1024 ** 3)))
+
+
+class FragmentCache:
+    def __init__(self, cache_dir=FRAGMENT_CACHE_DIR, max_bytes=FRAGMENT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._approx_bytes = None
+        self.counters = {"hits": 0, "misses": 0, "bytes_served": 0, "bytes_stored": 0, "evictions": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, vod_id, rendition, sequence):
+        return os.path.join(self.cache_dir, str(vod_id), str(rendition), f"{sequence}.ts")
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self.counters[key] += value
+
+    def get(self, vod_id, rendition, sequence):
+        """Cached fragment bytes, or None on a miss."""
+        path = self.path(vod_id, rendition, sequence)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Never cached, or evicted by another worker between lookups
+            self._count(misses=1)
+            return None
+        self._count(hits=1, bytes_served=len(data))
+        return data
+
+    def put(self, vod_id, rendition, sequence, data):
+        path = self.path(vod_id, rendition, sequence)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._count(bytes_stored=len(data))
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self._scan_bytes()
+            else:
+                self._approx_bytes += len(data)
+            over_budget = self._approx_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def get_or_fetch(self, vod_id, rendition, sequence, fetch):
+        """Read through the cache: ``fetch()`` is only called on a miss."""
+        data = self.get(vod_id, rendition, sequence)
+        if data is None:
+            data = fetch()
+            self.put(vod_id, rendition, sequence, data)
+        return data
+
+    def _files(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".ts"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _scan_bytes(self):
+        return sum(size for _, size, _ in self._files())
+
+    def evict(self, target_ratio=0.9):
+        """Delete least recently used fragments until the cache is under ``target_ratio`` of its budget."""
+        lock_file = open(os.path.join(self.cache_dir, ".evict.lock"), "w")
+        try:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            files = sorted(self._files(), key=lambda f: f[2])
+            total = sum(size for _, size, _ in files)
+            target = self.max_bytes * target_ratio
+            evicted = 0
+            for path, size, _ in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted += 1
+            with self._lock:
+                self._approx_bytes = total
+            self._count(evictions=evicted)
+            return total
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            approx = self._approx_bytes
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else None
+        counters["bytes"] = approx if approx is not None else self._scan_bytes()
+        counters["max_bytes"] = self.max_bytes
+        return counters
+
+
+fragment_cache = FragmentCache()
@@ -1,53 +1,98 @@
 import subprocess
-import json
 import os
-from collections import defaultdict
+import requests
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from uuid import uuid4
 import numpy as np
-from scipy.signal import find_peaks
 from datetime import timedelta
 from progress_state import current_progress
+from chat_stream import read_offsets
+from hype_engine import find_hype_peaks, message_histogram
+from chat_cache import chat_cache, COUNTS, subtract_ranges
+from chat_download import TWITCH_DOWNLOADER_CLI, download_chat_range, format_timestamp
+from smart_cut import encode_clip
+from span_planner import plan_download_spans, plan_summary
+from hls_fetcher import USE_FRAGMENT_CACHE, fetch_vod_section
+from clip_pipeline import CLIP_PIPELINE, pipe_section
+from resource_scheduler import resources
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
-def download_chat(twitch_url, start_str, end_str):
-    video_id = twitch_url.strip().split("/")[-1]
-    
-    print("[1] Downloading vod data...")
+@dataclass
+class GeneratedClip:
+    index: int          # 1-based position of the window in the VOD
+    path: str
+    start: int          # seconds into the VOD
+    end: int
+    score: int          # strongest chat spike (messages/sec jump) inside the window
 
-    current_progress["message"] = "Downloading vod data..."
-    subprocess.run([
-        "./TwitchDownloaderCLI",
-        "chatdownload",
-        "--id", video_id,
-        "-o", "chat.json",
-        "-b", start_str,
-        "-e", end_str,
-        "--collision", "Overwrite"
-    ], check=True)
-    current_progress["message"] = "Vod data downloaded successfully."
-
-def analyze_chat():
-    print("[2] Analyzing chat activity...")
 
-    current_progress["message"] = "Finding hype moments..."
+@dataclass
+class ClipResult:
+    clips: list = field(default_factory=list)
+    windows: list = field(default_factory=list)   # (start, end, score) for every detected window
+    failed: list = field(default_factory=list)    # 1-based indices of windows that could not be clipped
+
+    @property
+    def clip_paths(self):
+        return [clip.path for clip in self.clips]
+
 
-    with open("chat.json", "r", encoding="utf-8") as f:
-        chat = json.load(f)
+def report_global_progress(message, stage=None, fraction=None):
+    current_progress["message"] = message
 
-    msg_count = defaultdict(int)
-    for comment in chat["comments"]:
-        sec = int(comment["content_offset_seconds"])
-        msg_count[sec] += 1
+def run_command(cmd, job=None):
+    # Route through the scheduler job when there is one so cancellation kills the tool
+    if job is not None:
+        return job.run(cmd)
+    return subprocess.run(cmd, check=True)
 
-    max_sec = max(msg_count.keys())
-    counts = [msg_count[i] for i in range(max_sec + 1)]
+def video_id_from_url(twitch_url):
+    return twitch_url.strip().split("/")[-1]
 
-    derivative = np.diff(counts, prepend=0)
-    peaks, _ = find_peaks(derivative, height=7)
+def parse_timestamp(value):
+    # "HH:MM:SS" (or plain seconds) -> seconds
+    seconds = 0
+    for part in str(value).strip().split(":"):
+        seconds = seconds * 60 + int(float(part))
+    return seconds
 
-    # Sort peaks by intensity
-    peak_heights = [(p, derivative[p].item()) for p in peaks]
-    peak_heights_sorted = sorted(peak_heights, key=lambda x: x[1], reverse=True)
+def download_chat(twitch_url, start_str, end_str, job, chat_path, progress=report_global_progress):
+    video_id = video_id_from_url(twitch_url)
+    
+    print("[1] Downloading vod data...")
+
+    progress("Downloading vod data...", stage="chat")
+    start, end = parse_timestamp(start_str), parse_timestamp(end_str)
+    if end > start:
+        # Long ranges are fetched as parallel chunks and merged into chat_path
+        download_chat_range(
+            video_id, start, end, chat_path,
+            run=lambda cmd: run_command(cmd, job),
+            on_chunk_done=lambda done, total: progress(f"Downloading vod data ({done}/{total})...",
+                                                      fraction=done / total),
+        )
+    else:
+        run_command([
+            TWITCH_DOWNLOADER_CLI,
+            "chatdownload",
+            "--id", video_id,
+            "-o", chat_path,
+            "-b", start_str,
+            "-e", end_str,
+            "--collision", "Overwrite"
+        ], job)
+    progress("Vod data downloaded successfully.", stage="chat", fraction=1.0)
+
+def analyze_chat(chat_path, progress=report_global_progress):
+    print("[2] Analyzing chat activity...")
+
+    progress("Finding hype moments...", stage="analysis")
+
+    # Global spikes only, no per-segment picks
+    peak_heights_sorted = find_hype_peaks(build_msg_count(chat_path), segment_top=0)
 
     print("\nTop hype spikes:")
     for sec, height in peak_heights_sorted[:5]:
@@ -55,67 +100,102 @@ def analyze_chat():
 
     clip_windows = merge_clip_windows(peak_heights_sorted[:5])
 
-    current_progress["message"] = "Hype moments found. Preparing clips..."
+    progress("Hype moments found. Preparing clips...", stage="analysis", fraction=1.0)
     return clip_windows
 
-def segment_vod(msg_count, segment_length=600):  # 10 min = 600 sec
-    max_sec = max(msg_count.keys())
-    segments = []
-    for start in range(0, max_sec, segment_length):
-        end = min(start + segment_length, max_sec)
-        segments.append((start, end))
-    return segments
-
-def analyze_segment(msg_count, start, end):
-    counts = [msg_count[i] for i in range(start, end + 1)]
-    derivative = np.diff(counts, prepend=0)
-    peaks, _ = find_peaks(derivative, height=7)
-    # Offset peaks by segment start
-    peaks = [p + start for p in peaks]
-    peak_heights = [(p, derivative[p - start].item()) for p in peaks]
-    return sorted(peak_heights, key=lambda x: x[1], reverse=True)[:2]  # top 2 per segment
-
-def build_msg_count():
-    with open("chat.json", "r", encoding="utf-8") as f:
-        chat = json.load(f)
-    msg_count = defaultdict(int)
-    for comment in chat["comments"]:
-        sec = int(comment["content_offset_seconds"])
-        msg_count[sec] += 1
-    return msg_count
-
-def global_peaks(msg_count):
-    max_sec = max(msg_count.keys())
-    counts = [msg_count[i] for i in range(max_sec + 1)]
-    derivative = np.diff(counts, prepend=0)
-    peaks, _ = find_peaks(derivative, height=7)
-    peak_heights = [(p, derivative[p].item()) for p in peaks]
-    return sorted(peak_heights, key=lambda x: x[1], reverse=True)[:5]  # top 5 global
-
-def hybrid_analyze_chat():
+def build_msg_count(chat_path):
+    # Stream just the offsets; the full chat JSON can be hundreds of MB
+    return message_histogram(read_offsets(chat_path))
+
+# Covered stretches shorter than this between two missing ranges are fetched
+# again rather than paying for another chat download
+MIN_FETCH_GAP = 60
+
+def coalesce_ranges(ranges, min_gap=MIN_FETCH_GAP):
+    merged = []
+    for start, end in ranges:
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def load_chat_histogram(twitch_url, start_time, end_time, job=None, workspace=".", progress=report_global_progress):
+    """Messages per second for the requested range.
+
+    Only the parts of the range that aren't in the VOD's chat cache yet are
+    downloaded; they're merged into the cache and the whole range is then
+    read back from it.
+    """
+    video_id = video_id_from_url(twitch_url)
+    start, end = parse_timestamp(start_time), parse_timestamp(end_time)
+    if end <= start:
+        chat_path = os.path.join(workspace, "chat.json")
+        download_chat(twitch_url, start_time, end_time, job, chat_path, progress)
+        return build_msg_count(chat_path)
+
+    missing = coalesce_ranges(chat_cache.missing_ranges(video_id, start, end))
+    if not missing:
+        print("[1] Using cached chat histogram...")
+        progress("Vod data loaded from cache.", stage="chat", fraction=1.0)
+    downloaded = np.zeros(end, dtype=np.int64)
+    for part_start, part_end in missing:
+        chat_path = os.path.join(workspace, f"chat_{part_start}_{part_end}.json")
+        download_chat(twitch_url, format_timestamp(part_start), format_timestamp(part_end), job, chat_path, progress)
+        counts = build_msg_count(chat_path)
+        part = counts[part_start:part_end]
+        downloaded[part_start:part_start + len(part)] = part
+        try:
+            chat_cache.store(video_id, part_start, part_end, {COUNTS: counts})
+        except OSError as e:
+            # Can't merge into the cache; analyze this download on its own
+            print(f"⚠️ Could not cache chat histogram for {video_id}: {e}")
+            if (part_start, part_end) == (start, end):
+                return clip_histogram(counts, start, end)
+            raise
+        os.remove(chat_path)
+    histogram = chat_cache.histogram(video_id, start, end)
+    if histogram is None:
+        # Evicted (or replaced) by another job since it was stored; what was
+        # just downloaded still answers the request if it spans the range
+        if not subtract_ranges(start, end, missing):
+            return clip_histogram(downloaded, start, end)
+        print(f"⚠️ Cached chat histogram for {video_id} was evicted while in use, downloading the range again")
+        chat_path = os.path.join(workspace, "chat.json")
+        download_chat(twitch_url, start_time, end_time, job, chat_path, progress)
+        histogram = clip_histogram(build_msg_count(chat_path), start, end)
+    return histogram
+
+def clip_histogram(counts, start, end):
+    # Zero everything outside [start, end) and trim trailing empty seconds
+    counts = counts[:end].copy()
+    counts[:start] = 0
+    nonzero = counts.nonzero()[0]
+    return counts[:nonzero[-1] + 1] if len(nonzero) else counts[:0]
+
+def hybrid_find_peaks(chat_path=None, counts=None):
+    """Global top-5 plus per-segment top-2 spikes as (second, height), strongest first."""
+    if counts is None:
+        if chat_path is None:
+            raise ValueError("hybrid_find_peaks needs a chat file or a histogram")
+        counts = build_msg_count(chat_path)
+    return find_hype_peaks(counts)
+
+def hybrid_analyze_chat(chat_path=None, progress=report_global_progress, counts=None):
     print("[2] Analyzing chat activity (hybrid)...")
-    current_progress["message"] = "Finding hype moments (hybrid)..."
-    msg_count = build_msg_count()
-    # Global peaks
-    global_peak_list = global_peaks(msg_count)
-    # Local peaks
-    segments = segment_vod(msg_count)
-    local_peaks = []
-    for start, end in segments:
-        local_peaks.extend(analyze_segment(msg_count, start, end))
-    # Merge and deduplicate
-    all_peaks = global_peak_list + local_peaks
-    # Remove duplicate seconds (keep highest intensity)
-    peak_dict = {}
-    for sec, height in all_peaks:
-        if sec not in peak_dict or height > peak_dict[sec]:
-            peak_dict[sec] = height
-    all_peaks_dedup = [(sec, peak_dict[sec]) for sec in peak_dict]
-    all_peaks_sorted = sorted(all_peaks_dedup, key=lambda x: x[1], reverse=True)
-    clip_windows = merge_clip_windows(all_peaks_sorted)
-    current_progress["message"] = "Hype moments found. Preparing clips..."
+    progress("Finding hype moments (hybrid)...", stage="analysis")
+    clip_windows = merge_clip_windows(hybrid_find_peaks(chat_path, counts))
+    progress("Hype moments found. Preparing clips...", stage="analysis", fraction=1.0)
     return clip_windows
 
+def score_clip_windows(windows, peaks):
+    # Score each merged window by the strongest peak that produced it
+    scored = []
+    for start, end in windows:
+        heights = [height for sec, height in peaks if start <= sec <= end]
+        scored.append((int(start), int(end), int(max(heights, default=0))))
+    return scored
+
 
 def merge_clip_windows(peaks, margin=30):
     # Create [start, end] windows around each peak
@@ -140,79 +220,197 @@ def merge_clip_windows(peaks, margin=30):
 
     return merged
 
-def download_clip(twitch_url, start_sec, end_sec, index):
+def download_section(twitch_url, start_sec, end_sec, output_file, job=None):
+    """Download [start_sec, end_sec) of the VOD into ``output_file``.
+
+    Returns how many seconds into the file ``start_sec`` lies. Fragments come
+    from the shared fragment cache when possible, and that file starts at a
+    fragment boundary; yt-dlp's own section download starts exactly at
+    ``start_sec`` (offset 0) and is used when the cache path fails.
+    """
+    # Connections are budgeted across all jobs (see resource_scheduler)
+    with resources.network(job) as slots:
+        if USE_FRAGMENT_CACHE:
+            try:
+                return fetch_vod_section(twitch_url, video_id_from_url(twitch_url), start_sec, end_sec,
+                                         output_file, job, workers=slots)
+            except (subprocess.SubprocessError, requests.RequestException, OSError, ValueError) as e:
+                print(f"⚠️ Fragment cache fetch failed ({e}), falling back to yt-dlp")
+        start_str = str(timedelta(seconds=int(start_sec)))
+        end_str = str(timedelta(seconds=int(end_sec)))
+        run_command([
+            "yt-dlp",
+            twitch_url,
+            "-f", "bestvideo[height=1080][fps=60]+bestaudio/best",
+            "--download-sections", f"*{start_str}-{end_str}",
+            "--concurrent-fragments", str(slots),
+            "--fragment-retries", "1",
+            "--no-cache-dir",
+            "--force-overwrites",
+            "-o", output_file
+        ], job)
+    return 0.0
+
+def _pipe_clips(twitch_url, start_sec, end_sec, clips, job=None):
+    # Stream the section into ffmpeg; False means use the download-then-cut path instead
+    try:
+        with resources.network(job) as slots, resources.cpu(job) as threads:
+            pipe_section(twitch_url, video_id_from_url(twitch_url), start_sec, end_sec, clips, job,
+                         threads=threads, workers=slots)
+        return True
+    except (subprocess.CalledProcessError, requests.RequestException, OSError) as e:
+        print(f"⚠️ Pipelined clipping failed ({e}), downloading the section first")
+        return False
+
+def download_clip(twitch_url, start_sec, end_sec, index, job=None, workspace=".", output_dir="clips", progress=report_global_progress):
     start_str = str(timedelta(seconds=int(start_sec)))
     end_str = str(timedelta(seconds=int(end_sec)))
-    temp_file = f"clips/temp_clip{index + 1}.mp4"
-    output_file = f"clips/clip_{index + 1}.mp4"
+    temp_file = os.path.join(workspace, f"temp_clip{index + 1}.mp4")
+    output_file = os.path.join(output_dir, f"clip_{index + 1}.mp4")
 
     print(f"⬇️  Downloading clip {index + 1}: {start_str} to {end_str}...")
 
-    current_progress["message"] = f"Downloading clip {index + 1}..."
-
-    subprocess.run([
-        "yt-dlp",
-        twitch_url,
-        "-f", "bestvideo[height=1080][fps=60]+bestaudio/best",
-        "--download-sections", f"*{start_str}-{end_str}",
-        "--concurrent-fragments", "5",
-        "--fragment-retries", "1",
-        "--no-cache-dir",
-        "--force-overwrites",
-        "-o", temp_file
-    ], check=True)
-
-    current_progress["message"] = f"Clip {index + 1} downloaded. Processing..."
-
-    # Re-encode the clip to smooth playback and enable faststart
-    subprocess.run([
-        "ffmpeg",
-        "-y",  # Overwrite if exists
-        "-i", temp_file,
-        "-ss", "00:00:00",  # Trim start cleanly (just in case)
-        "-movflags", "faststart",
-        "-preset", "ultrafast",
-        "-c:v", "libx264",  # Re-encode video
-        "-c:a", "aac",      # Re-encode audio
-        "-b:a", "128k",
-        output_file
-    ], check=True)
-
-    current_progress["message"] = f"Clip {index + 1} processed successfully."
+    progress(f"Downloading clip {index + 1}...")
+
+    if CLIP_PIPELINE and _pipe_clips(twitch_url, start_sec, end_sec, [(output_file, start_sec, end_sec)], job):
+        progress(f"Clip {index + 1} processed successfully.")
+        return output_file
+
+    lead_in = download_section(twitch_url, start_sec, end_sec, temp_file, job)
+
+    progress(f"Clip {index + 1} downloaded. Processing...")
+
+    # Copy the keyframe-aligned middle, re-encode only the ends (or everything
+    # when the source can't be smart-cut), and write a faststart MP4
+    with resources.cpu(job) as threads:
+        encode_clip(temp_file, output_file, lead_in, lead_in + (end_sec - start_sec),
+                    workdir=workspace, run=lambda cmd: run_command(cmd, job), threads=threads)
+
+    progress(f"Clip {index + 1} processed successfully.")
 
     os.remove(temp_file)  # Clean up temporary file
+    return output_file
+
+def download_span_clips(twitch_url, span, span_index, job=None, workspace=".", output_dir="clips", progress=report_global_progress):
+    """Download one span of the VOD and cut each of its windows out locally.
+
+    Returns {window index: clip path}; a window that fails to cut doesn't
+    affect the others.
+    """
+    if len(span.windows) == 1:
+        index, start, end = span.windows[0]
+        return {index: download_clip(twitch_url, start, end, index, job, workspace, output_dir, progress)}
+
+    span_file = os.path.join(workspace, f"span_{span_index + 1}.mp4")
+    labels = ", ".join(str(index + 1) for index, _, _ in span.windows)
+    print(f"⬇️  Downloading span {span_index + 1} (clips {labels}): "
+          f"{timedelta(seconds=int(span.start))} to {timedelta(seconds=int(span.end))}...")
+    progress(f"Downloading clips {labels}...")
+    outputs = {index: os.path.join(output_dir, f"clip_{index + 1}.mp4") for index, _, _ in span.windows}
+    if CLIP_PIPELINE and _pipe_clips(twitch_url, span.start, span.end,
+                                     [(outputs[index], start, end) for index, start, end in span.windows], job):
+        progress(f"Clips {labels} processed successfully.")
+        return outputs
+
+    lead_in = download_section(twitch_url, span.start, span.end, span_file, job)
+
+    clip_paths = {}
+    try:
+        for index, start, end in span.windows:
+            output_file = os.path.join(output_dir, f"clip_{index + 1}.mp4")
+            progress(f"Clip {index + 1} downloaded. Processing...")
+            try:
+                with resources.cpu(job) as threads:
+                    encode_clip(span_file, output_file, *span.clip_range(start, end, lead_in),
+                                workdir=workspace, run=lambda cmd: run_command(cmd, job), threads=threads)
+            except subprocess.CalledProcessError as e:
+                print(f"❌ Error cutting clip {index + 1}: {e}")
+                continue
+            clip_paths[index] = output_file
+            progress(f"Clip {index + 1} processed successfully.")
+    finally:
+        os.remove(span_file)
+    return clip_paths
+
 
+def clip_hype_moments(windows, twitch_url, job=None, workspace=".", output_dir="clips", progress=report_global_progress):
+    """Clip every window in parallel. Returns {window index: clip path} for the clips that succeeded.
 
-def clip_hype_moments(windows, twitch_url):
+    Windows close together are fetched as one download span (see
+    span_planner) and cut locally, instead of one yt-dlp run per window.
+    """
     print("\n[3] Clipping hype moments (parallel)...")
-    current_progress["message"] = "Clipping hype moments..."
-    with ThreadPoolExecutor(max_workers=10) as executor:  # Adjust max_workers as needed
-        futures = []
-        for i, (start, end) in enumerate(windows):
-            if end <= start:
-                print(f"⚠️ Skipping clip_{i + 1}: invalid range.")
-                continue
-            futures.append(executor.submit(download_clip, twitch_url, start, end, i))
+    progress("Clipping hype moments...", stage="clipping")
+    for i, (start, end) in enumerate(windows):
+        if end <= start:
+            print(f"⚠️ Skipping clip_{i + 1}: invalid range.")
+    spans = plan_download_spans(windows)
+    summary = plan_summary(spans)
+    print(f"Planned {summary['requests']} downloads for {summary['windows']} clips "
+          f"({summary['requests_saved']} saved, ~{summary['wasted_bytes'] / 1e6:.0f} MB outside clips)")
+    clip_paths = {}
+    # One thread per span; how many actually download or encode at once is
+    # decided by the shared CPU and network budgets, not by this pool
+    with ThreadPoolExecutor(max_workers=max(1, len(spans))) as executor:
+        futures = [
+            executor.submit(download_span_clips, twitch_url, span, k, job, workspace, output_dir, progress)
+            for k, span in enumerate(spans)
+        ]
+        finished = 0
         for future in as_completed(futures):
             try:
-                future.result()
+                clip_paths.update(future.result())
             except Exception as e:
                 print(f"❌ Error downloading clip: {e}")
+            finished += 1
+            progress(f"Clipped {finished} of {len(spans)} download spans...", fraction=finished / len(spans))
     print("✅ All clips downloaded.")
-    current_progress["message"] = "All clips downloaded successfully."
-
-def get_clips(twitch_url: str, start_time="00:00:00", end_time="00:00:30", project_id: str | None = None):
-    if not os.path.exists("clips"):
-        os.makedirs("clips")
-        
-    print(f"start time: {start_time}, end time: {end_time}")
-    download_chat(twitch_url, start_time, end_time)
-
-    clip_windows = hybrid_analyze_chat()
-
-    clip_hype_moments(clip_windows, twitch_url)
-
-    clip_files = [f"clips/clip_{i + 1}.mp4" for i in range(len(clip_windows))]
+    progress("All clips downloaded successfully.", stage="clipping", fraction=1.0)
+    return clip_paths
+
+def get_clips(twitch_url: str, start_time="00:00:00", end_time="00:00:30", project_id: str | None = None, job=None,
+              output_dir: str | None = None, workspace: str | None = None, progress=report_global_progress) -> ClipResult:
+    """Run the whole pipeline for one VOD range.
+
+    Every invocation works in its own scratch ``workspace`` (a fresh temporary
+    directory unless one is given, removed afterwards) and writes finished clips
+    to ``output_dir``, so several pipelines can run side by side in one process.
+    """
+    if output_dir is None:
+        output_dir = os.path.join("clips", project_id or uuid4().hex)
+    os.makedirs(output_dir, exist_ok=True)
+    owns_workspace = workspace is None
+    if owns_workspace:
+        workspace = tempfile.mkdtemp(prefix=f"clipjob-{project_id or ''}")
+    else:
+        os.makedirs(workspace, exist_ok=True)
+
+    try:
+        print(f"start time: {start_time}, end time: {end_time}")
+        counts = load_chat_histogram(twitch_url, start_time, end_time, job, workspace, progress)
+
+        print("[2] Analyzing chat activity (hybrid)...")
+        progress("Finding hype moments (hybrid)...", stage="analysis")
+        peaks = hybrid_find_peaks(counts=counts)
+        clip_windows = merge_clip_windows(peaks)
+        scored_windows = score_clip_windows(clip_windows, peaks)
+        progress("Hype moments found. Preparing clips...", stage="analysis", fraction=1.0)
+
+        if job is not None:
+            job.check()
+        clip_paths = clip_hype_moments(clip_windows, twitch_url, job, workspace, output_dir, progress)
+        if job is not None:
+            job.check()
+    finally:
+        if owns_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    result = ClipResult(windows=scored_windows)
+    for i, (start, end, score) in enumerate(scored_windows):
+        if i in clip_paths:
+            result.clips.append(GeneratedClip(i + 1, clip_paths[i], start, end, score))
+        else:
+            result.failed.append(i + 1)
 
-    current_progress["message"] = "Clips generated successfully."
-    return clip_files
\ No newline at end of file
+    progress("Clips generated successfully.")
+    return result
@@ -0,0 +1,146 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from contextlib import contextmanager
+
+# Client-side token bucket for Twitch Helix requests. Helix gives an app a
+# bucket of points (Ratelimit-Limit, 800/minute by default) that refills
+# continuously, and reports what's left on every response
+# (Ratelimit-Remaining, Ratelimit-Reset). Requests wait here for a point
+# instead of being sent into a 429; interactive requests are always granted
+# before background ones.
+HELIX_RATE_LIMIT = int(os.getenv("HELIX_RATE_LIMIT", "800"))
+HELIX_RATE_WINDOW = 60.0
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+# Attempts a request gets after a 429 before the error is raised
+HELIX_THROTTLE_RETRIES = int(os.getenv("HELIX_THROTTLE_RETRIES", "5"))
+
+helix_priority = contextvars.ContextVar("helix_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def background():
+    """Run the Helix calls made inside the block (prefetching, batch work) at background priority."""
+    token = helix_priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        helix_priority.reset(token)
+
+
+class HelixRateLimiter:
+    def __init__(self, limit=HELIX_RATE_LIMIT, window=HELIX_RATE_WINDOW):
+        self.limit = limit
+        self.window = window
+        self.tokens = float(limit)
+        self._refilled_at = time.monotonic()
+        # While Helix says the bucket is empty, nothing is granted before this
+        self._blocked_until = 0.0
+        self._cond = asyncio.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self.counters = {
+            name: {"granted": 0, "waited": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+        self.throttled = 0
+
+    def _refill(self, now):
+        if self._blocked_until and now >= self._blocked_until:
+            # Helix's reset time is when the bucket is full again
+            self._blocked_until = 0.0
+            self.tokens = float(self.limit)
+        rate = self.limit / self.window
+        self.tokens = min(float(self.limit), self.tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _delay(self, now):
+        # Seconds until the head of the queue could be granted
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        return max(0.0, (1 - self.tokens) * self.window / self.limit)
+
+    async def acquire(self, priority=INTERACTIVE):
+        """Wait for one request's worth of budget."""
+        entry = (priority, next(self._seq))
+        started = time.monotonic()
+        async with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiting[0] == entry and now >= self._blocked_until and self.tokens >= 1:
+                        break
+                    timeout = self._delay(now) if self._waiting[0] == entry else None
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                # The next in line may be grantable now
+                self._cond.notify_all()
+            self.tokens -= 1
+        waited = time.monotonic() - started
+        stats = self.counters[PRIORITY_NAMES[priority]]
+        stats["granted"] += 1
+        stats["total_wait"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+        if waited > 0.001:
+            stats["waited"] += 1
+
+    async def update(self, headers, throttled=False):
+        """Sync the bucket with the Ratelimit-* headers of a Helix response."""
+        try:
+            limit = int(headers["Ratelimit-Limit"])
+            remaining = int(headers["Ratelimit-Remaining"])
+            reset = float(headers["Ratelimit-Reset"])
+        except (KeyError, ValueError):
+            return
+        async with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self.limit = limit
+            # Other requests granted meanwhile may not be counted in
+            # ``remaining`` yet, so never raise the local estimate
+            self.tokens = min(self.tokens, float(remaining))
+            if throttled or remaining <= 0:
+                self.throttled += throttled
+                # Ratelimit-Reset is a Unix time; wait for it on our own clock
+                self._blocked_until = max(self._blocked_until, now + max(0.0, reset - time.time()))
+            self._cond.notify_all()
+
+    def retry_after(self):
+        """Seconds until a request queued now could be granted, ignoring the queue ahead of it."""
+        now = time.monotonic()
+        self._refill(now)
+        return self._delay(now)
+
+    def stats(self):
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _ in self._waiting:
+            depth[PRIORITY_NAMES[priority]] += 1
+        classes = {}
+        for name, counters in self.counters.items():
+            classes[name] = {
+                "queued": depth[name],
+                "granted": counters["granted"],
+                "waited": counters["waited"],
+                "avg_wait_seconds": counters["total_wait"] / counters["granted"] if counters["granted"] else 0.0,
+                "max_wait_seconds": counters["max_wait"],
+            }
+        return {
+            "limit": self.limit,
+            "tokens": round(self.tokens, 2),
+            "blocked_for_seconds": max(0.0, self._blocked_until - time.monotonic()),
+            "throttled_responses": self.throttled,
+            "classes": classes,
+        }
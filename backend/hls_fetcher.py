@@ -0,0 +1,171 @@
+import os
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import urljoin
+
+import requests
+
+from fragment_cache import fragment_cache
+from ttl_cache import TTLCache
+
+# Fetch a time range of a VOD straight from its HLS media playlist, reading
+# every fragment through the shared fragment cache. Used instead of
+# yt-dlp --download-sections so re-clips of a VOD don't download the same
+# fragments again.
+
+USE_FRAGMENT_CACHE = os.getenv("USE_FRAGMENT_CACHE", "1") == "1"
+FRAGMENT_WORKERS = int(os.getenv("FRAGMENT_WORKERS", "5"))
+FRAGMENT_TIMEOUT = float(os.getenv("FRAGMENT_TIMEOUT", "20"))
+FRAGMENT_RETRIES = int(os.getenv("FRAGMENT_RETRIES", "2"))
+# Twitch renditions carry their own audio, so a single format is picked (a
+# video+audio selection would resolve to two playlists)
+HLS_FORMAT = os.getenv("HLS_FORMAT", "best[height<=1080]/best")
+# yt-dlp lookups of a VOD's playlist URL give up after this many seconds
+RESOLVE_TIMEOUT = float(os.getenv("HLS_RESOLVE_TIMEOUT", "60"))
+# Resolved playlists are reused for this long (the signed URLs expire), at most this many
+PLAYLIST_TTL = float(os.getenv("HLS_PLAYLIST_TTL", "600"))
+PLAYLIST_CACHE_SIZE = int(os.getenv("HLS_PLAYLIST_CACHE_SIZE", "256"))
+
+_session = requests.Session()
+
+
+@dataclass
+class Segment:
+    sequence: int
+    start: float      # seconds from the start of the VOD
+    duration: float
+    url: str
+
+
+@dataclass
+class MediaPlaylist:
+    url: str
+    rendition: str
+    segments: list
+    init_url: str | None = None
+
+
+def resolve_playlist(twitch_url, fmt=HLS_FORMAT, job=None):
+    """(rendition name, media playlist URL) for the format yt-dlp would pick.
+
+    Runs through ``job`` when given, so cancelling the job stops the lookup.
+    """
+    cmd = ["yt-dlp", "-f", fmt, "--print", "format_id", "--print", "url", twitch_url]
+    if job is not None:
+        out = job.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    else:
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=RESOLVE_TIMEOUT)
+    lines = [line.strip() for line in out.stdout.splitlines() if line.strip()]
+    if len(lines) < 2 or "m3u8" not in lines[1]:
+        raise ValueError(f"No HLS playlist for {twitch_url}")
+    return lines[0], lines[1]
+
+
+def parse_media_playlist(text, base_url):
+    """Segments of an HLS media playlist, plus the EXT-X-MAP init segment if any."""
+    segments = []
+    sequence = 0
+    position = 0.0
+    duration = None
+    init_url = None
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",", 1)[0])
+        elif line.startswith("#EXT-X-MAP:"):
+            attrs = line.split(":", 1)[1]
+            for attr in attrs.split(","):
+                key, _, value = attr.partition("=")
+                if key.strip() == "URI":
+                    init_url = urljoin(base_url, value.strip().strip('"'))
+        elif not line.startswith("#") and duration is not None:
+            segments.append(Segment(sequence, position, duration, urljoin(base_url, line)))
+            position += duration
+            sequence += 1
+            duration = None
+    return segments, init_url
+
+
+def load_playlist(url, rendition, session=_session):
+    resp = session.get(url, timeout=FRAGMENT_TIMEOUT)
+    resp.raise_for_status()
+    segments, init_url = parse_media_playlist(resp.text, url)
+    return MediaPlaylist(url, rendition, segments, init_url)
+
+
+def _fetch_bytes(url, session):
+    for attempt in range(FRAGMENT_RETRIES + 1):
+        try:
+            resp = session.get(url, timeout=FRAGMENT_TIMEOUT)
+            resp.raise_for_status()
+            return resp.content
+        except requests.RequestException:
+            if attempt == FRAGMENT_RETRIES:
+                raise
+
+
+def iter_range(playlist, vod_id, start, end, cache=fragment_cache, session=_session,
+               workers=FRAGMENT_WORKERS, job=None):
+    """(lead-in, iterator of fragment bytes) for the fragments covering [start, end) seconds.
+
+    The lead-in is how far into the concatenated fragments ``start`` lies,
+    since they begin at the first covering fragment's boundary. At most
+    ``workers`` fragments are fetched ahead of the consumer.
+    """
+    needed = [s for s in playlist.segments if s.start + s.duration > start and s.start < end]
+    if not needed:
+        raise ValueError(f"No fragments between {start}s and {end}s")
+
+    def fetch(segment):
+        if job is not None:
+            job.check()
+        return cache.get_or_fetch(vod_id, playlist.rendition, segment.sequence,
+                                  lambda: _fetch_bytes(segment.url, session))
+
+    def chunks():
+        if playlist.init_url:
+            yield cache.get_or_fetch(vod_id, playlist.rendition, "init",
+                                     lambda: _fetch_bytes(playlist.init_url, session))
+        workers_ = max(1, workers)
+        with ThreadPoolExecutor(max_workers=workers_) as executor:
+            pending = deque()
+            for segment in needed:
+                pending.append(executor.submit(fetch, segment))
+                if len(pending) >= workers_:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    return start - needed[0].start, chunks()
+
+
+def fetch_range(playlist, vod_id, start, end, output_path, cache=fragment_cache, session=_session,
+                workers=FRAGMENT_WORKERS, job=None):
+    """Write the fragments covering [start, end) seconds to ``output_path``. Returns the lead-in."""
+    lead_in, chunks = iter_range(playlist, vod_id, start, end, cache, session, workers, job)
+    with open(output_path, "wb") as out:
+        for data in chunks:
+            out.write(data)
+    return lead_in
+
+
+_playlists = TTLCache(maxsize=PLAYLIST_CACHE_SIZE, ttl=PLAYLIST_TTL, name="hls_playlists")
+
+
+def vod_playlist(twitch_url, job=None):
+    """Media playlist of a Twitch VOD URL, resolved at most once per ``PLAYLIST_TTL``."""
+    def load():
+        rendition, url = resolve_playlist(twitch_url, job=job)
+        return load_playlist(url, rendition)
+    return _playlists.get_or_load(twitch_url, load)
+
+
+def fetch_vod_section(twitch_url, vod_id, start, end, output_path, job=None, workers=FRAGMENT_WORKERS):
+    """fetch_range for a Twitch VOD URL."""
+    return fetch_range(vod_playlist(twitch_url, job), vod_id, start, end, output_path, workers=workers, job=job)
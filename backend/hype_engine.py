@@ -0,0 +1,114 @@
+import numpy as np
+
+# Vectorized version of the hybrid analysis in generate_clips: global top-5
+# spikes plus the top-2 spikes of every 10 minute segment, where a spike is a
+# peak of the per-second message count derivative.
+#
+# The original per-segment code diffs each segment on its own (so the first
+# value of a segment is its raw count, not a difference) and only finds peaks
+# strictly inside the segment. To reproduce that exactly in one pass, the
+# global derivative and every segment's local derivative are laid out in one
+# array separated by sentinels, and peaks are found on that array once.
+
+SEGMENT_LENGTH = 600
+GLOBAL_TOP = 5
+SEGMENT_TOP = 2
+MIN_HEIGHT = 7
+
+# Bigger than any derivative, so no plateau can be a peak next to it
+_SENTINEL = np.iinfo(np.int64).max
+
+
+def message_histogram(offsets):
+    """Messages per second, indexed by whole second of the VOD."""
+    offsets = np.asarray(offsets)
+    if offsets.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.bincount(offsets.astype(np.int64))
+
+
+def plateau_peaks(x, min_height=MIN_HEIGHT):
+    """Same peaks as ``scipy.signal.find_peaks(x, height=min_height)``.
+
+    A peak is a maximal run of equal values with a strictly smaller value on
+    both sides; flat peaks are reported at their (rounded down) middle.
+    Returns (positions, heights).
+    """
+    n = len(x)
+    if n < 3:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    run_starts = np.concatenate(([0], np.flatnonzero(x[1:] != x[:-1]) + 1))
+    run_ends = np.concatenate((run_starts[1:] - 1, [n - 1]))
+    values = x[run_starts]
+    # Runs touching either end of the array are never peaks
+    inner = slice(1, len(values) - 1)
+    is_peak = (values[:-2] < values[inner]) & (values[2:] < values[inner])
+    is_peak &= (values[inner] >= min_height) & (values[inner] != _SENTINEL)
+    idx = np.flatnonzero(is_peak) + 1
+    positions = (run_starts[idx] + run_ends[idx]) // 2
+    return positions, values[idx]
+
+
+def _top_k_per_group(groups, positions, heights, k_by_group):
+    # Order by group, then height (descending), then position: the order
+    # Python's stable sort produced for each list of peaks
+    order = np.lexsort((positions, -heights, groups))
+    groups, positions, heights = groups[order], positions[order], heights[order]
+    rank = np.arange(len(groups)) - np.searchsorted(groups, groups, side="left")
+    keep = rank < k_by_group[groups]
+    return positions[keep], heights[keep]
+
+
+def find_hype_peaks(counts, segment_length=SEGMENT_LENGTH, global_top=GLOBAL_TOP,
+                    segment_top=SEGMENT_TOP, min_height=MIN_HEIGHT):
+    """Hype spikes as (second, height) pairs, strongest first.
+
+    ``counts`` is the per-second message histogram. Returns the same list as
+    the loop based ``hybrid_find_peaks`` did: the global top ``global_top``
+    peaks plus the top ``segment_top`` peaks of each segment, deduplicated.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    if counts.size == 0:
+        return []
+    max_sec = len(counts) - 1
+    derivative = np.diff(counts, prepend=0)
+
+    seg_starts = np.arange(0, max_sec, segment_length, dtype=np.int64)
+    if segment_top <= 0:
+        seg_starts = seg_starts[:0]
+    seg_ends = np.minimum(seg_starts + segment_length, max_sec)
+    seg_lengths = seg_ends - seg_starts + 1
+
+    # Layout: [global derivative] S [segment 0] S [segment 1] S ... where each
+    # segment is counts[start], derivative[start + 1 .. end]
+    region_lengths = np.concatenate(([len(derivative)], seg_lengths))
+    region_starts = np.concatenate(([0], np.cumsum(region_lengths + 1)[:-1]))
+    stacked = np.full(int(region_lengths.sum() + len(region_lengths) - 1), _SENTINEL, dtype=np.int64)
+    stacked[:len(derivative)] = derivative
+    if len(seg_starts):
+        slot_region = np.repeat(np.arange(len(seg_starts)), seg_lengths)
+        slot_offset = np.arange(len(slot_region)) - np.repeat(np.cumsum(seg_lengths) - seg_lengths, seg_lengths)
+        slots = region_starts[1:][slot_region] + slot_offset
+        stacked[slots] = derivative[seg_starts[slot_region] + slot_offset]
+        stacked[region_starts[1:]] = counts[seg_starts]
+
+    positions, heights = plateau_peaks(stacked, min_height)
+    if len(positions) == 0:
+        return []
+
+    # Map stacked positions back to seconds; group 0 is the global pass
+    groups = np.searchsorted(region_starts, positions, side="right") - 1
+    region_seconds = np.concatenate(([0], seg_starts))
+    seconds = region_seconds[groups] + positions - region_starts[groups]
+    k_by_group = np.full(len(region_lengths), segment_top, dtype=np.int64)
+    k_by_group[0] = global_top
+    seconds, heights = _top_k_per_group(groups, seconds, heights, k_by_group)
+
+    # Keep the first occurrence of each second (global list first, then
+    # segments in order), then sort strongest first keeping that order on ties
+    _, first = np.unique(seconds, return_index=True)
+    first.sort()
+    seconds, heights = seconds[first], heights[first]
+    order = np.argsort(-heights, kind="stable")
+    return [(int(sec), int(height)) for sec, height in zip(seconds[order], heights[order])]
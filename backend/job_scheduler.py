@@ -0,0 +1,258 @@
+import heapq
+import itertools
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+# Number of clip pipelines that may run at the same time. Everything past this
+# limit waits in the queue with the "In queue" status.
+MAX_CONCURRENT_JOBS = int(os.getenv("CLIP_MAX_CONCURRENT_JOBS", "2"))
+# Hard limit for a single pipeline run, in seconds (0 disables the timeout)
+JOB_TIMEOUT_SECONDS = float(os.getenv("CLIP_JOB_TIMEOUT", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """A unit of work handed to the scheduler.
+
+    The job function is called as ``fn(job, *args)`` on a worker thread. Long
+    running work should call ``job.check()`` between steps and launch external
+    tools through ``job.run()`` so that cancellation and timeouts can stop it.
+    """
+
+    def __init__(self, job_id, fn, args, priority=0, timeout=None):
+        self.id = job_id
+        self.fn = fn
+        self.args = args
+        self.priority = priority
+        self.timeout = timeout
+        self.status = QUEUED
+        self.error = None
+        self.result = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self._processes = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} was {self.status}")
+
+    def cancel(self, status=CANCELLED):
+        with self._lock:
+            if self.status in (DONE, FAILED, CANCELLED, TIMED_OUT):
+                return False
+            self.status = status
+            self._cancel_event.set()
+            processes = list(self._processes)
+        for proc in processes:
+            if proc.poll() is None:
+                proc.kill()
+        return True
+
+    @contextmanager
+    def process(self, cmd, **kwargs):
+        """subprocess.Popen(cmd, **kwargs) that is killed when the job is cancelled.
+
+        For tools that are fed or drained while they run; the process is
+        killed if the block exits while it is still running.
+        """
+        self.check()
+        proc = subprocess.Popen(cmd, **kwargs)
+        with self._lock:
+            self._processes.add(proc)
+            # A cancel() between check() and here didn't see this process
+            cancelled = self._cancel_event.is_set()
+        if cancelled:
+            proc.kill()
+        try:
+            yield proc
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            with self._lock:
+                self._processes.discard(proc)
+
+    def run(self, cmd, **kwargs):
+        """subprocess.run(cmd, check=True) that is killed when the job is cancelled."""
+        with self.process(cmd, **kwargs) as proc:
+            stdout, stderr = proc.communicate()
+        self.check()
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": str(self.error) if self.error else None,
+        }
+
+
+class JobScheduler:
+    """Bounded pool of worker threads fed from a priority queue.
+
+    Lower priority values run first; jobs with equal priority run in FIFO order.
+    The pipelines spend nearly all of their time waiting on subprocesses and
+    HTTP calls, so threads keep the event loop free without pickling jobs.
+    """
+
+    def __init__(self, max_workers=MAX_CONCURRENT_JOBS, default_timeout=JOB_TIMEOUT_SECONDS):
+        self.max_workers = max(1, max_workers)
+        self.default_timeout = default_timeout
+        self._queue = []
+        self._counter = itertools.count()
+        self._jobs = {}
+        self._cond = threading.Condition()
+        self._workers = []
+        self._running = 0
+        self._shutdown = False
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"clip-worker-{len(self._workers) + 1}",
+                daemon=True,
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def submit(self, job_id, fn, *args, priority=0, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        job = Job(job_id, fn, args, priority=priority, timeout=timeout)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Scheduler is shut down")
+            self._jobs[job_id] = job
+            heapq.heappush(self._queue, (priority, next(self._counter), job))
+            self._ensure_workers()
+            self._cond.notify()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        return job.cancel()
+
+    def queue_position(self, job_id):
+        with self._cond:
+            queued = sorted(entry for entry in self._queue if entry[2].status == QUEUED)
+        for position, (_, _, job) in enumerate(queued):
+            if job.id == job_id:
+                return position + 1
+        return None
+
+    def stats(self):
+        with self._cond:
+            queued = sum(1 for _, _, job in self._queue if job.status == QUEUED)
+            return {
+                "max_workers": self.max_workers,
+                "running": self._running,
+                "queued": queued,
+            }
+
+    def shutdown(self, cancel_pending=True):
+        """Stop handing out jobs; returns the queued jobs that were cancelled.
+
+        Those never reach their function, so whatever status they report is
+        up to the caller.
+        """
+        with self._cond:
+            self._shutdown = True
+            pending = [job for _, _, job in self._queue if job.status == QUEUED]
+            self._cond.notify_all()
+        if not cancel_pending:
+            return []
+        return [job for job in pending if job.cancel()]
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                while self._queue:
+                    _, _, job = heapq.heappop(self._queue)
+                    # Under the job's lock, so a concurrent cancel() either wins or sees RUNNING
+                    with job._lock:
+                        start = job.status == QUEUED
+                        if start:
+                            job.status = RUNNING
+                            job.started_at = time.time()
+                    if start:
+                        self._running += 1
+                        return job
+                    # Cancelled while waiting in the queue
+                    self._jobs.pop(job.id, None)
+                if self._shutdown:
+                    return None
+                self._cond.wait()
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._run_job(job)
+
+    def _run_job(self, job):
+        timer = None
+        if job.timeout:
+            timer = threading.Timer(job.timeout, job.cancel, kwargs={"status": TIMED_OUT})
+            timer.daemon = True
+            timer.start()
+        try:
+            job.result = job.fn(job, *job.args)
+            with job._lock:
+                if job.status == RUNNING:
+                    job.status = DONE
+        except JobCancelled as e:
+            job.error = e
+            with job._lock:
+                # cancel() already set CANCELLED/TIMED_OUT; this covers a JobCancelled
+                # raised without it (e.g. by work the job waited on)
+                if job.status == RUNNING:
+                    job.status = CANCELLED
+        except Exception as e:
+            job.error = e
+            with job._lock:
+                if job.status == RUNNING:
+                    job.status = FAILED
+            print(f"Job {job.id} failed: {e}")
+        finally:
+            if timer:
+                timer.cancel()
+            job.finished_at = time.time()
+            with self._cond:
+                self._running -= 1
+                self._jobs.pop(job.id, None)
+
+
+scheduler = JobScheduler()
@@ -0,0 +1,190 @@
+"""Incremental hype detection for live chat or a chat download still in progress.
+
+The offline analysis waits for the whole chat, builds the per-second message
+histogram and runs peak detection on its derivative. StreamingHypeDetector
+does the same thing one message at a time: each message is O(1) work, and a
+hype window is emitted as soon as no later peak can be merged into it.
+
+Replay a saved chat at 600x speed:
+    python live_detector.py chat.json --speed 600
+"""
+import argparse
+import math
+import time
+
+from chat_stream import iter_comments
+
+MIN_HEIGHT = 7
+HALF_WIDTH = 15    # seconds kept on each side of a peak, as in merge_clip_windows
+MERGE_MARGIN = 30  # windows closer than this are merged, as in merge_clip_windows
+
+
+class StreamingHypeDetector:
+    """Finds peaks of the messages-per-second derivative while chat is arriving.
+
+    Peaks are the same ones ``scipy.signal.find_peaks(derivative, height=min_height)``
+    reports on the finished histogram (flat peaks at their middle second), and
+    the emitted windows are what ``merge_clip_windows`` would build from them.
+
+    ``sensitivity`` optionally raises the threshold to ``mean + sensitivity * std``
+    of the derivative (exponentially weighted, ``ewma_seconds`` memory), which
+    keeps busy channels from emitting a window for every small bump.
+    ``on_window(window, score)`` is called with each finished (start, end) window.
+    """
+
+    def __init__(self, min_height=MIN_HEIGHT, half_width=HALF_WIDTH, margin=MERGE_MARGIN,
+                 sensitivity=None, ewma_seconds=300, on_window=None):
+        self.min_height = min_height
+        self.half_width = half_width
+        self.margin = margin
+        self.sensitivity = sensitivity
+        self.alpha = 2 / (ewma_seconds + 1)
+        self.on_window = on_window
+        self.windows = []
+        self.peaks = []
+        self.late_messages = 0
+
+        self._second = None      # second currently being counted
+        self._count = 0
+        self._prev_count = 0
+        # Current run of equal derivative values
+        self._run_value = None
+        self._run_start = None
+        self._run_rising = False
+        self._run_threshold = min_height
+        # Window waiting for later peaks that could still merge into it
+        self._pending = None
+        self._pending_score = 0
+        self._mean = 0.0
+        self._var = 0.0
+
+    def add(self, offset):
+        """Count one message at ``offset`` seconds. Offsets must not go backwards."""
+        second = int(offset)
+        if self._second is None:
+            self._start(second)
+        if second < self._second:
+            # Already closed; counting it now would change a settled derivative
+            self.late_messages += 1
+            return
+        while self._second < second:
+            self._close_second()
+        self._count += 1
+
+    def advance(self, offset):
+        """Tell the detector time has moved on to ``offset`` without new messages."""
+        if self._second is None:
+            return
+        while self._second < int(offset):
+            self._close_second()
+
+    def flush(self):
+        """End of stream: emit the window still waiting for neighbours."""
+        if self._second is not None and self._count:
+            self._close_second()
+        self._emit_pending()
+        return self.windows
+
+    def _start(self, second):
+        self._second = second
+        if second > 0:
+            # Everything before the first message was silence, a derivative of 0
+            self._run_value = 0
+            self._run_start = second - 1
+
+    def _close_second(self):
+        derivative = self._count - self._prev_count
+        self._push_derivative(self._second, derivative)
+        self._prev_count = self._count
+        self._count = 0
+        self._second += 1
+
+    def _threshold(self):
+        if self.sensitivity is None:
+            return self.min_height
+        return max(self.min_height, self._mean + self.sensitivity * math.sqrt(self._var))
+
+    def _push_derivative(self, second, value):
+        if self._run_value is None:
+            # First sample of the stream can never be a peak
+            self._run_value, self._run_start, self._run_rising = value, second, False
+        elif value != self._run_value:
+            if self._run_rising and value < self._run_value and self._run_value >= self._run_threshold:
+                self._on_peak((self._run_start + second - 1) // 2, self._run_value)
+            self._run_rising = value > self._run_value
+            self._run_value, self._run_start = value, second
+            self._run_threshold = self._threshold()
+
+        delta = value - self._mean
+        self._mean += self.alpha * delta
+        self._var = (1 - self.alpha) * (self._var + self.alpha * delta * delta)
+
+        # A later peak sits at or after the current run's start; once even that
+        # can't reach the pending window, the window is final
+        if self._pending and self._run_start - self.half_width > self._pending[1] + self.margin:
+            self._emit_pending()
+
+    def _on_peak(self, second, height):
+        self.peaks.append((second, height))
+        window = (max(0, second - self.half_width), second + self.half_width)
+        if self._pending and window[0] <= self._pending[1] + self.margin:
+            self._pending = (self._pending[0], max(self._pending[1], window[1]))
+            self._pending_score = max(self._pending_score, height)
+        else:
+            self._emit_pending()
+            self._pending, self._pending_score = window, height
+
+    def _emit_pending(self):
+        if self._pending is None:
+            return
+        window, score = self._pending, self._pending_score
+        self._pending, self._pending_score = None, 0
+        self.windows.append(window)
+        if self.on_window:
+            self.on_window(window, score)
+
+
+def replay_chat(chat_path, speed=None):
+    """Yield comment offsets from a saved chat, paced in real time divided by ``speed``.
+
+    ``speed=None`` replays as fast as the file can be read.
+    """
+    first = None
+    started = time.monotonic()
+    for comment in iter_comments(chat_path):
+        offset = float(comment["content_offset_seconds"])
+        if speed:
+            if first is None:
+                first = offset
+            delay = (offset - first) / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        yield offset
+
+
+def detect_from_replay(chat_path, speed=None, **detector_kwargs):
+    detector = StreamingHypeDetector(**detector_kwargs)
+    for offset in replay_chat(chat_path, speed):
+        detector.add(offset)
+    return detector.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a chat download through the live hype detector")
+    parser.add_argument("chat_path")
+    parser.add_argument("--speed", type=float, default=None, help="replay speed multiplier (default: no pacing)")
+    parser.add_argument("--sensitivity", type=float, default=None)
+    args = parser.parse_args()
+
+    started = time.monotonic()
+
+    def report(window, score):
+        elapsed = time.monotonic() - started
+        print(f"[{elapsed:7.2f}s] hype window {window[0]}-{window[1]} (spike {score})")
+
+    windows = detect_from_replay(args.chat_path, args.speed, sensitivity=args.sensitivity, on_window=report)
+    print(f"{len(windows)} windows")
+
+
+if __name__ == "__main__":
+    main()
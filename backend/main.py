@@ -1,38 +1,53 @@
-from fastapi import FastAPI, Request, HTTPException, status
+from fastapi import FastAPI, Request, Response, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
-from typing import AsyncGenerator
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 import os
-import shutil
+import json
+import math
+import base64
 import subprocess
 import asyncio
-import requests
-import time
-import concurrent.futures
 from uuid import uuid4
 from supabase import create_client, Client
-
-from pydantic import BaseModel
-from generate_clips import get_clips
-
-from progress_state import current_progress
 from dotenv import load_dotenv
+# Before the local imports below, which read their settings from the environment
 load_dotenv()
 
-CLIENT_ID = "j6hsb1u060lxdhbyz8n5lmwgl2rxq0"
-CLIENT_SECRET = "7du2zywv9ioy5fsah9r6vm29loy5yy"
+from pydantic import BaseModel
+from generate_clips import get_clips
+from job_scheduler import scheduler, JobCancelled, TIMED_OUT, QUEUED, RUNNING, DONE
+import batch_analysis
+from fragment_cache import fragment_cache
+from trim_cache import trim_cache, start_trim
+from resource_scheduler import resources
+from clip_index import clip_index
+from storage_janitor import storage_janitor
+import clip_delivery
+from write_behind import WriteBehind
+import project_cache
+from ttl_cache import TTLCache
+from twitch_client import twitch, sized_thumbnail, HelixThrottled, VODS_PAGE_SIZE
+
+from progress_state import current_progress, progress_hub, ProjectProgress
 
 # Supabase configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL", "your_supabase_url")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY", "your_service_key")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Pipeline writes (clip rows, status changes) are batched through this
+def invalidate_after_write(table, rows=None, where=None):
+    # Keep the read caches in step with what the pipeline just wrote
+    if table == "project_clips":
+        for project_id in {row["project_id"] for row in rows or []}:
+            project_cache.invalidate_project(project_id)
+    elif table == "user_projects" and where and where[0] == "id":
+        project_cache.invalidate_project(where[1])
 
-# Token caching
-_cached_token = None
-_token_expiry = 0
+write_behind = WriteBehind(supabase, on_write=invalidate_after_write)
 
 # todo: MAKE PAGE THAT SHOW VODS LOOK BETTER
 #       ADD ACCOUNT FUNCTIONALITY
@@ -49,7 +64,23 @@ _token_expiry = 0
 # 'offline_image_url': 'https://static-cdn.jtvnw.net/jtv_user_pictures/4abb162b-687a-4173-bc4e-054b4d4fb3f3-channel_offline_image-1920x1080.jpeg', 
 # 'view_count': 0, 'created_at': '2018-06-22T14:48:00Z'}
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    storage_janitor.on_evict = remove_expired_project
+    storage_janitor.is_busy = project_job_active
+    storage_janitor.start()
+    yield
+    # Stop handing out queued pipelines; running ones are killed with the process
+    for job in scheduler.shutdown():
+        if job.fn is process_clips:
+            # Never started; don't leave it "In queue" forever
+            write_behind.update("user_projects", {"status": "Cancelled"}, job.id)
+    batch_analysis.shutdown_pool()
+    write_behind.close()
+    storage_janitor.close()
+    await twitch.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow requests from frontend
 app.add_middleware(
@@ -57,6 +88,7 @@ app.add_middleware(
     allow_origins=["http://localhost:5173"],  # or wherever your React dev server runs
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 class VODRequest(BaseModel):
@@ -74,10 +106,21 @@ class VODRequest(BaseModel):
 clips_dir = os.path.join(os.getcwd(), "clips")
 # Create clips directory if it doesn't exist (don't delete existing clips)
 os.makedirs(clips_dir, exist_ok=True)
-app.mount("/clips", StaticFiles(directory=clips_dir), name="clips") 
+
+@app.api_route("/clips/{clip_path:path}", methods=["GET", "HEAD"])
+def get_clip_file(clip_path: str, request: Request):
+    # Clips and their previews: byte ranges, ETags and immutable caching
+    path = clip_delivery.resolve(clips_dir, clip_path)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    storage_janitor.touch_path(path)
+    # clips/<user>/<project>/...: while the project's job runs, a clip may be half written
+    parts = clip_path.split("/")
+    final = len(parts) < 3 or not project_job_active(parts[1])
+    return clip_delivery.file_response(path, request, immutable=final)
 
 @app.post("/clips")
-async def process_vod(data: VODRequest):
+def process_vod(data: VODRequest):
     # Generate a unique project ID
     project_id = str(uuid4())
     
@@ -85,6 +128,7 @@ async def process_vod(data: VODRequest):
     user_dir = os.path.join("clips", data.user_id)
     project_dir = os.path.join(user_dir, project_id)
     os.makedirs(project_dir, exist_ok=True)
+    storage_janitor.track(data.user_id, project_id)
 
     # Save project to Supabase immediately with "In queue" status
     project_data = {
@@ -103,48 +147,165 @@ async def process_vod(data: VODRequest):
         print(f"Creating project in Supabase: {project_id}")
         result = supabase.table("user_projects").insert(project_data).execute()
         print(f"Project created successfully: {result.data}")
+        project_cache.invalidate_user(data.user_id)
+        project_cache.remember_owner(project_id, data.user_id)
     except Exception as e:
         print(f"Error creating project in Supabase: {e}")
         raise HTTPException(status_code=500, detail="Failed to create project")
 
-    # Start async processing
-    asyncio.create_task(process_clips_async(project_id, data, project_dir))
+    # Queue the pipeline; it stays "In queue" until a worker picks it up
+    progress = ProjectProgress(project_id)
+    progress("In queue", stage="queued")
+    scheduler.submit(project_id, process_clips, project_id, data, project_dir, progress)
     
     return {"project_id": project_id, "status": "In queue"}
 
-async def process_clips_async(project_id: str, data: VODRequest, project_dir: str):
+def process_clips(job, project_id: str, data: VODRequest, project_dir: str, progress=None):
+    progress = progress or ProjectProgress(project_id)
+    # Its writes invalidate the owner's listings, even if nothing has read the row yet
+    project_cache.remember_owner(project_id, data.user_id)
     try:
         # Update status to "Processing"
-        supabase.table("user_projects").update({"status": "Processing"}).eq("id", project_id).execute()
-        
-        # Generate clips
-        clips = get_clips(data.twitch_url, data.start_time, data.end_time, project_id)
+        write_behind.update("user_projects", {"status": "Processing"}, project_id, owner=project_id)
         
-        # Move clips to user/project directory
-        saved_clips = []
-        for i, clip_path in enumerate(clips):
-            dest = os.path.join(project_dir, f"clip_{i+1}.mp4")
-            os.rename(clip_path, dest)
-            saved_clips.append(dest)
-
-        # Insert clips into project_clips table
-        for i, clip_path in enumerate(saved_clips):
+        # Generate clips straight into the project directory, using a private scratch dir
+        result = get_clips(data.twitch_url, data.start_time, data.end_time, project_id, job=job,
+                           output_dir=project_dir, progress=progress)
+
+        job.check()
+        progress("Saving clips...", stage="saving")
+
+        # Insert clips into project_clips table (sent as one bulk insert)
+        for clip in result.clips:
             clip_data = {
                 "project_id": project_id,
-                "clip_url": clip_path,
-                "clip_index": i + 1
+                "clip_url": clip.path,
+                # The window's position, which is also what the file is named after
+                "clip_index": clip.index
             }
-            print(f"Saving clip {i+1}: {clip_path}")
-            clip_response = supabase.table("project_clips").insert(clip_data).execute()
-            print(f"Clip saved successfully: {clip_response.data}")
+            print(f"Saving clip {clip.index}: {clip.path}")
+            write_behind.insert("project_clips", clip_data, owner=project_id)
+            clip_index.add(clip.path)
+            storage_janitor.record(clip.path)
         
         # Update status to "Expires in 7 days"
-        supabase.table("user_projects").update({"status": "Expires in 7 days"}).eq("id", project_id).execute()
+        write_behind.update("user_projects", {"status": "Expires in 7 days"}, project_id, owner=project_id)
+        # The job is done once its rows are written; other projects' writes don't count
+        if not write_behind.flush_retrying(owner=project_id, check=job.check):
+            raise RuntimeError("Clip rows could not be saved to Supabase")
+        build_previews(job, result.clips, progress)
+        progress(f"{len(result.clips)} clips ready", stage="done")
         
+    except JobCancelled:
+        status_text = "Timed out" if job.status == TIMED_OUT else "Cancelled"
+        print(f"Clip job {project_id} stopped: {status_text}")
+        write_behind.update("user_projects", {"status": status_text}, project_id, owner=project_id)
+        if not write_behind.flush(project_id):
+            print(f"⚠️ Status of {project_id} not saved yet; left queued for the next flush")
+        progress(status_text, stage="timed_out" if job.status == TIMED_OUT else "cancelled")
+        raise
     except Exception as e:
         print(f"Error processing clips: {e}")
         # Update status to "Failed to generate clips"
-        supabase.table("user_projects").update({"status": "Failed to generate clips"}).eq("id", project_id).execute()
+        write_behind.update("user_projects", {"status": "Failed to generate clips"}, project_id, owner=project_id)
+        if not write_behind.flush(project_id):
+            print(f"⚠️ Status of {project_id} not saved yet; left queued for the next flush")
+        progress("Failed to generate clips", stage="failed")
+        raise
+
+def build_previews(job, clips, progress):
+    # The clips are already playable; previews only make them cheaper to preview
+    if not (clip_delivery.CLIP_HLS or clip_delivery.CLIP_SPRITES):
+        return
+    for i, clip in enumerate(clips):
+        job.check()
+        progress(f"Preparing previews {i + 1}/{len(clips)}...", stage="saving", fraction=i / len(clips))
+        try:
+            for path in clip_delivery.postprocess_clip(clip.path, job=job):
+                clip_index.add(path)
+                storage_janitor.record(path)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"⚠️ Previews for {clip.path} failed: {e}")
+
+@app.post("/projects/{project_id}/cancel")
+def cancel_project(project_id: str):
+    job = scheduler.get(project_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No queued or running job for this project")
+    was_queued = job.status == QUEUED
+    if not scheduler.cancel(project_id):
+        raise HTTPException(status_code=409, detail="Job already finished")
+    if was_queued:
+        # Running jobs record their own status when they notice the cancellation
+        write_behind.update("user_projects", {"status": "Cancelled"}, project_id)
+        write_behind.flush()
+        ProjectProgress(project_id)("Cancelled", stage="cancelled")
+    return {"project_id": project_id, "status": "Cancelled"}
+
+@app.get("/jobs/stats")
+def get_job_stats():
+    return scheduler.stats()
+
+@app.get("/metrics/fragment-cache")
+def get_fragment_cache_stats():
+    return fragment_cache.stats()
+
+@app.get("/metrics/resources")
+def get_resource_stats():
+    return resources.stats()
+
+@app.get("/metrics/trim-cache")
+def get_trim_cache_stats():
+    return trim_cache.stats()
+
+class BatchVOD(BaseModel):
+    twitch_url: str
+    start_time: str = "00:00:00"
+    end_time: str = "00:00:00"
+
+class BatchAnalyzeRequest(BaseModel):
+    vods: list[BatchVOD]
+
+# Finished batch jobs stay pollable for an hour (the scheduler forgets them)
+batch_jobs = TTLCache(maxsize=1000, ttl=3600, name="batch_jobs")
+
+def run_batch_analysis(job, items):
+    return batch_analysis.analyze_vods(items, job=job)
+
+@app.post("/batch-analyze", status_code=status.HTTP_202_ACCEPTED)
+def batch_analyze(data: BatchAnalyzeRequest):
+    # Queued behind interactive clip jobs; chat parsing and peak detection fan
+    # out over the shared process pool, and VODs whose chat is already cached
+    # skip the download entirely
+    job_id = f"batch-{uuid4()}"
+    items = [(vod.twitch_url, vod.start_time, vod.end_time) for vod in data.vods]
+    job = scheduler.submit(job_id, run_batch_analysis, items, priority=1)
+    batch_jobs.set(job_id, job)
+    return {"job_id": job_id, "status": job.status}
+
+@app.get("/batch-analyze/{job_id}")
+def get_batch_analysis(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    result = job.to_dict()
+    position = scheduler.queue_position(job_id)
+    if position is not None:
+        result["queue_position"] = position
+    if job.status == DONE:
+        result["results"] = job.result
+    return result
+
+@app.post("/batch-analyze/{job_id}/cancel")
+def cancel_batch_analysis(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    if not job.cancel():
+        raise HTTPException(status_code=409, detail=f"Batch job already {job.status}")
+    return {"job_id": job_id, "status": job.status}
 
 class ClipDownloadRequest(BaseModel):
     filename: str
@@ -152,91 +313,204 @@ class ClipDownloadRequest(BaseModel):
     end_time: str
 
 @app.post("/download_clip")
-def download_clip(data: ClipDownloadRequest):
+async def download_clip(data: ClipDownloadRequest):
     input_path = f"./clips/{data.filename}"
-    temp_path = f"./clips/temp_{data.filename}"
-    output_path = f"./clips/cropped_{data.filename}"
+    download_name = f"cropped_{os.path.basename(data.filename)}"
 
     if not os.path.exists(input_path):
         raise HTTPException(status_code=404, detail="Clip file not found")
+    storage_janitor.touch_path(input_path)
 
-    # Step 1: Crop the clip using ffmpeg
-    try:
-        subprocess.run([
-            "ffmpeg",
-            "-y",
-            "-ss", data.start_time,
-            "-to", data.end_time,
-            "-i", input_path,
-            "-c", "copy",
-            temp_path
-        ], check=True)
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"FFmpeg cropping error: {e}")
+    # The same range of an unchanged clip is only encoded once
+    key = trim_cache.key(input_path, data.start_time, data.end_time)
+    cached_path = trim_cache.get(key)
+    if cached_path:
+        return FileResponse(cached_path, media_type="video/mp4", filename=download_name)
 
-    # Step 2: Remux to improve playback smoothness and enable faststart
+    # One ffmpeg pass, streamed to the client as fragmented MP4 while it encodes
     try:
-        subprocess.run([
-            "ffmpeg",
-            "-y",
-            "-i", temp_path,
-            "-ss", "00:00:00",
-            "-movflags", "faststart",
-            "-preset", "ultrafast",
-            "-c:v", "libx264",
-            "-c:a", "aac",
-            "-b:a", "128k",
-            output_path
-        ], check=True)
+        body = await start_trim(input_path, data.start_time, data.end_time, key)
     except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"FFmpeg remuxing error: {e}")
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-
-    return FileResponse(output_path, filename=f"cropped_{data.filename}")
+        raise HTTPException(status_code=500, detail=f"FFmpeg cropping error: {e}")
+    return StreamingResponse(
+        body,
+        media_type="video/mp4",
+        # Runs even if the client leaves before the body is streamed
+        background=BackgroundTask(body.close),
+        headers={"Content-Disposition": f'attachment; filename="{download_name}"'},
+    )
 
 @app.get("/status")
 def get_status():
     return {"status": current_progress["message"]}
 
+@app.get("/project-events/{project_id}")
+async def project_events(project_id: str, request: Request):
+    """Server-sent events with the project's stage and percent, until it finishes."""
+    async def event_stream():
+        async for event in progress_hub.subscribe(project_id):
+            if await request.is_disconnected():
+                break
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics/storage")
+def get_storage_stats():
+    return storage_janitor.stats()
+
+@app.get("/metrics/clip-delivery")
+def get_clip_delivery_stats():
+    return clip_delivery.stats()
+
+@app.get("/metrics/supabase-writes")
+def get_write_behind_stats():
+    return write_behind.stats()
+
+@app.get("/metrics/project-cache")
+def get_project_cache_stats():
+    return project_cache.stats()
+
+@app.get("/metrics/progress")
+def get_progress_stats():
+    return progress_hub.stats()
+
 @app.get("/project-status/{project_id}")
 def get_project_status(project_id: str):
     try:
-        response = supabase.table("user_projects").select("status").eq("id", project_id).single().execute()
-        if response.data:
-            return {"status": response.data["status"]}
+        project = get_project_row(project_id)
+        if project:
+            result = {"status": project["status"]}
+            position = scheduler.queue_position(project_id)
+            if position is not None:
+                result["queue_position"] = position
+            return result
         else:
             raise HTTPException(status_code=404, detail="Project not found")
     except Exception as e:
         print(f"Error fetching project status: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch project status")
 
+def get_project_row(project_id):
+    """The user_projects row, from the cache when possible."""
+    project = project_cache.project_rows.get(project_id)
+    if project is None:
+        # A write landing while this query runs must not be papered over by its result
+        since = project_cache.token()
+        project = supabase.table("user_projects").select("*").eq("id", project_id).single().execute().data
+        if project:
+            project_cache.remember_rows([project], since)
+    return project
+
+# Projects per .in_() clip query, and clip rows per page of it; PostgREST caps
+# a response at 1000 rows by default
+CLIP_QUERY_PROJECTS = 50
+CLIP_QUERY_PAGE = 1000
+
+def encode_cursor(project):
+    raw = json.dumps({"created_at": project["created_at"], "id": project["id"]})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return value["created_at"], value["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def fetch_clips_by_project(project_ids):
+    """{project_id: [clip_url, ...]} in clip_index order.
+
+    Cached clip lists are used as they are; the rest come from a few batched
+    queries and are cached.
+    """
+    clips = {}
+    for project_id in project_ids:
+        cached = project_cache.project_clips.get(project_id)
+        if cached is not None:
+            clips[project_id] = cached
+    project_ids = [project_id for project_id in project_ids if project_id not in clips]
+    since = project_cache.token()
+    clips.update({project_id: [] for project_id in project_ids})
+    for i in range(0, len(project_ids), CLIP_QUERY_PROJECTS):
+        batch = project_ids[i:i + CLIP_QUERY_PROJECTS]
+        offset = 0
+        while True:
+            rows = supabase.table("project_clips").select("project_id, clip_url, clip_index") \
+                .in_("project_id", batch).order("project_id").order("clip_index") \
+                .range(offset, offset + CLIP_QUERY_PAGE - 1).execute().data or []
+            for row in rows:
+                clips[row["project_id"]].append(row["clip_url"])
+            if len(rows) < CLIP_QUERY_PAGE:
+                break
+            offset += CLIP_QUERY_PAGE
+    for project_id in project_ids:
+        project_cache.remember_clips(project_id, clips[project_id], since)
+    return clips
+
+def fetch_project_page(user_id, limit=None, cursor=None):
+    """(project rows, next cursor or None), newest first."""
+    # Fetch ALL projects for the user, including 'In queue', 'Processing', and completed
+    query = supabase.table("user_projects").select("*").eq("user_id", user_id) \
+        .order("created_at", desc=True).order("id", desc=True)
+    if cursor:
+        created_at, project_id = decode_cursor(cursor)
+        # Keyset pagination: strictly after the last project of the previous page
+        query = query.or_(f'created_at.lt."{created_at}",'
+                          f'and(created_at.eq."{created_at}",id.lt."{project_id}")')
+    if limit:
+        query = query.limit(limit + 1)
+    projects = query.execute().data or []
+    if limit and len(projects) > limit:
+        projects = projects[:limit]
+        return projects, encode_cursor(projects[-1])
+    return projects, None
+
 @app.get("/projects/{user_id}")
-def get_user_projects(user_id: str):
+def get_user_projects(user_id: str, response: Response, limit: int | None = Query(None, ge=1, le=500),
+                      cursor: str | None = None):
+    """The user's projects, newest first, each with its clips that exist on disk.
+
+    With ``limit``, one page is returned and the cursor for the next page
+    (if any) is sent in the X-Next-Cursor header.
+    """
     try:
-        # Fetch ALL projects for the user, including 'In queue', 'Processing', and completed
-        response = supabase.table("user_projects").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-        projects = response.data
-        
-        
-        # For each project, fetch its clips
+        listings = project_cache.user_listings.get(user_id) or {}
+        page = listings.get((limit, cursor))
+        if page is None:
+            since = project_cache.token()
+            page = fetch_project_page(user_id, limit, cursor)
+            project_cache.remember_rows(page[0], since)
+            project_cache.remember_listing(user_id, {**listings, (limit, cursor): page}, since)
+        # Copies: the cached rows must not pick up this response's fields
+        projects = [dict(project) for project in page[0]]
+        if page[1]:
+            response.headers["X-Next-Cursor"] = page[1]
+
+        # One batched clip query instead of one per project
+        clips_by_project = fetch_clips_by_project([project["id"] for project in projects])
         for project in projects:
-            clips_response = supabase.table("project_clips").select("clip_url").eq("project_id", project["id"]).order("clip_index").execute()
             # Only include clips that actually exist on the file system
             existing_clips = []
-            if clips_response.data:
-                for clip in clips_response.data:
-                    clip_path = clip["clip_url"]
-                    if os.path.exists(clip_path):
-                        existing_clips.append(clip_path)
-                    else:
-                        print(f"Warning: Clip file not found: {clip_path}")
+            for clip_path in clips_by_project.get(project["id"], []):
+                if clip_index.exists(clip_path):
+                    existing_clips.append(clip_path)
+                else:
+                    print(f"Warning: Clip file not found: {clip_path}")
             project["clips"] = existing_clips
             # Add project_id field for frontend compatibility
             project["project_id"] = project["id"]
         
         return projects
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching projects from Supabase: {e}")
         return []
@@ -245,20 +519,18 @@ def get_user_projects(user_id: str):
 def get_project_clips(user_id: str, project_id: str):
     try:
         # Fetch project details
-        project_response = supabase.table("user_projects").select("*").eq("id", project_id).eq("user_id", user_id).single().execute()
+        project = get_project_row(project_id)
         
-        if not project_response.data:
+        if not project or project["user_id"] != user_id:
             return {"clips": [], "status": "Not found"}
-        
-        project = project_response.data
+        storage_janitor.touch(user_id, project_id)
         
         # Fetch clips for this project
-        clips_response = supabase.table("project_clips").select("*").eq("project_id", project_id).order("clip_index").execute()
-        
-        clips = [clip["clip_url"] for clip in clips_response.data] if clips_response.data else []
+        clips = list(fetch_clips_by_project([project_id])[project_id])
         
         return {
             "clips": clips, 
+            "previews": {clip: clip_delivery.previews(clip, exists=clip_index.exists) for clip in clips},
             "status": project["status"], 
             "vod_title": project["vod_title"], 
             "vod_thumbnail": project["vod_thumbnail"], 
@@ -268,294 +540,114 @@ def get_project_clips(user_id: str, project_id: str):
         print(f"Error fetching project clips from Supabase: {e}")
         return {"clips": [], "status": "Not found"}
 
+def delete_project_rows(project_id, user_id):
+    # Send queued writes first so none of them lands after the delete
+    write_behind.flush()
+    # Delete all associated clips from project_clips
+    supabase.table("project_clips").delete().eq("project_id", project_id).execute()
+    # Delete the project from user_projects
+    supabase.table("user_projects").delete().eq("id", project_id).execute()
+    project_cache.invalidate_project(project_id, user_id)
+
+def project_job_active(project_id):
+    job = scheduler.get(project_id)
+    return job is not None and job.status in (QUEUED, RUNNING)
+
+def remove_expired_project(user_id, project_id, reason):
+    # Called on the janitor thread once an expired or evicted project's files are gone
+    print(f"Removing {reason} project {project_id}")
+    clip_index.discard_tree(os.path.join("clips", str(user_id), str(project_id)))
+    delete_project_rows(project_id, user_id)
+
 @app.delete("/projects/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_project(project_id: str):
+    # Stop the pipeline first so it doesn't keep writing into the project
+    scheduler.cancel(project_id)
     try:
         # Fetch project to get user_id and project_dir
-        project_response = supabase.table("user_projects").select("*").eq("id", project_id).single().execute()
-        if not project_response.data:
+        project = get_project_row(project_id)
+        if not project:
             raise HTTPException(status_code=404, detail="Project not found")
-        project = project_response.data
         user_id = project["user_id"]
-        # Delete all associated clips from project_clips
-        supabase.table("project_clips").delete().eq("project_id", project_id).execute()
-        # Delete the project from user_projects
-        supabase.table("user_projects").delete().eq("id", project_id).execute()
-        # Remove files from disk
-        project_dir = os.path.join("clips", str(user_id), str(project_id))
-        if os.path.exists(project_dir):
-            import shutil
-            shutil.rmtree(project_dir)
+        delete_project_rows(project_id, user_id)
+        # The files are removed by the janitor thread
+        storage_janitor.remove(user_id, project_id)
+        clip_index.discard_tree(os.path.join("clips", str(user_id), str(project_id)))
         return {"message": "Project deleted"}
     except Exception as e:
         print(f"Error deleting project: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete project")
 
-# Get token (cache this in production)
-def get_app_token():
-    global _cached_token, _token_expiry
-    current_time = time.time()
-
-    if _cached_token and current_time < _token_expiry:
-        return _cached_token
-
-    url = "https://id.twitch.tv/oauth2/token"
-    params = {
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "grant_type": "client_credentials"
-    }
-    resp = requests.post(url, params=params)
-    resp.raise_for_status()
-    data = resp.json()
-    if "access_token" not in data:
-        raise RuntimeError("Failed to get Twitch access token")
-    
-    _cached_token = data["access_token"]
-    _token_expiry = current_time + data["expires_in"] - 60 # Expire 60 seconds before the actual expiry
-    return _cached_token
-
-@app.get("/api/get-channel-vods")
-def get_channel_vods(username: str):
-    token = get_app_token()
-    headers = {
-        "Client-ID": CLIENT_ID,
-        "Authorization": f"Bearer {token}"
-    }
-
-    # Get user ID
-    user_url = "https://api.twitch.tv/helix/users"
-    params = {"login": username}
-    user_resp = requests.get(user_url, headers=headers, params=params)
-    user_data = user_resp.json()["data"]
-
-    if not user_data:
-        return {"error": "User not found"}
-
-    user_id = user_data[0]["id"]
-    profile_image = user_data[0]["profile_image_url"]
-    display_name = user_data[0]["display_name"]
-    
-    # Parallelize user info and follower count fetches
-    def get_followers():
-        followers_url = "https://api.twitch.tv/helix/channels/followers"
-        followers_params = {"broadcaster_id": user_id, "first": 1}
-        followers_resp = requests.get(followers_url, headers=headers, params=followers_params)
-        return followers_resp.json().get("total", 0)
-
-    def get_vods():
-        vods_url = "https://api.twitch.tv/helix/videos"
-        vod_params = {
-            "user_id": user_id,
-            "type": "archive"
-        }
-        vod_resp = requests.get(vods_url, headers=headers, params=vod_params)
-        return vod_resp.json()["data"]
-
-    # Execute both requests in parallel
-    import concurrent.futures
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        followers_future = executor.submit(get_followers)
-        vods_future = executor.submit(get_vods)
-        
-        follower_count = followers_future.result()
-        vod_data = vods_future.result()
-    
-    # Batch fetch VOD details instead of individual calls
-    detailed_vods = []
-    if vod_data:
-        # Create batches of up to 100 VOD IDs (Twitch API limit)
-        vod_ids = [vod["id"] for vod in vod_data]
-        batched_vods = []
-        
-        for i in range(0, len(vod_ids), 100):
-            batch_ids = vod_ids[i:i+100]
-            video_url = "https://api.twitch.tv/helix/videos"
-            video_params = {"id": batch_ids}
-            video_resp = requests.get(video_url, headers=headers, params=video_params)
-            batch_details = video_resp.json()["data"]
-            batched_vods.extend(batch_details)
-        
-        # Process the detailed VODs
-        for detailed_vod in batched_vods:
-            thumbnail_url = detailed_vod.get('thumbnail_url')
-            
-            # If we have a thumbnail_url, replace the template variables with actual dimensions
-            if thumbnail_url:
-                # The API returns URLs with template variables like %{width}x%{height}
-                # Replace them with actual dimensions
-                thumbnail_url = thumbnail_url.replace('%{width}x%{height}', '320x180')
-                detailed_vod['thumbnail_url'] = thumbnail_url
-            
-            detailed_vods.append(detailed_vod)
-    else:
-        # Fallback to original data if no detailed info available
-        detailed_vods = vod_data
-
-    return {
+async def _channel_vods(username, with_vods=True, cursor=None, first=VODS_PAGE_SIZE):
+    user = await twitch.get_user(username)
+    if not user:
+        return None
+    user_id = user["id"]
+    # Follower count and the VOD page don't depend on each other
+    calls = [twitch.get_follower_count(user_id)]
+    if with_vods:
+        calls.append(twitch.get_archive_page(user_id, cursor, first))
+    follower_count, *rest = await asyncio.gather(*calls)
+    result = {
         "user": {
             "id": user_id,
-            "display_name": display_name,
-            "profile_image": profile_image,
+            "display_name": user["display_name"],
+            "profile_image": user["profile_image_url"],
             "follower_count": follower_count,
-        },
-        "vods": detailed_vods
-    }
-
-@app.get("/api/get-channel-info")
-def get_channel_info(username: str):
-    token = get_app_token()
-    headers = {
-        "Client-ID": CLIENT_ID,
-        "Authorization": f"Bearer {token}"
+        }
     }
+    if with_vods:
+        vods, next_cursor = rest[0]
+        # Copies with sized thumbnails; the cached page keeps the templates
+        result["vods"] = [
+            {**vod, "thumbnail_url": sized_thumbnail(vod["thumbnail_url"])} if vod.get("thumbnail_url") else vod
+            for vod in vods
+        ]
+        result["next_cursor"] = next_cursor
+        if next_cursor:
+            # "Load more" is likely; have the next page ready without holding up this one
+            twitch.prefetch_archive_page(user_id, next_cursor, first)
+    return result
+
+@app.exception_handler(HelixThrottled)
+async def helix_throttled(request: Request, exc: HelixThrottled):
+    # Twitch's rate limit is used up for now: tell the client when to come back instead of a 500
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Twitch rate limit reached, try again shortly"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
 
-    # Get user ID
-    user_url = "https://api.twitch.tv/helix/users"
-    params = {"login": username}
-    user_resp = requests.get(user_url, headers=headers, params=params)
-    user_data = user_resp.json()["data"]
-
-    if not user_data:
-        return {"error": "User not found"}
-
-    user_id = user_data[0]["id"]
-    profile_image = user_data[0]["profile_image_url"]
-    display_name = user_data[0]["display_name"]
-
-    # Get follower count (this is already fast since we only need the count)
-    followers_url = "https://api.twitch.tv/helix/channels/followers"
-    followers_params = {"broadcaster_id": user_id, "first": 1}
-    followers_resp = requests.get(followers_url, headers=headers, params=followers_params)
-    follower_count = followers_resp.json().get("total", 0)
+@app.get("/api/get-channel-vods")
+async def get_channel_vods(username: str, cursor: str | None = None,
+                           first: int = Query(VODS_PAGE_SIZE, ge=1, le=100)):
+    """The channel and one page of its past broadcasts; pass ``next_cursor`` back for the next page."""
+    return await _channel_vods(username, cursor=cursor, first=first) or {"error": "User not found"}
 
-    return {
-        "user": {
-            "id": user_id,
-            "display_name": display_name,
-            "profile_image": profile_image,
-            "follower_count": follower_count,
-        }
-    }
+@app.get("/api/get-channel-info")
+async def get_channel_info(username: str):
+    return await _channel_vods(username, with_vods=False) or {"error": "User not found"}
 
 @app.get("/api/get-channel-data")
-def get_channel_data(username: str):
+async def get_channel_data(username: str, cursor: str | None = None,
+                           first: int = Query(VODS_PAGE_SIZE, ge=1, le=100)):
     """
     Combined endpoint that fetches both channel info and VODs in parallel.
     This can be faster than calling get-channel-info and get-channel-vods separately.
     """
-    token = get_app_token()
-    headers = {
-        "Client-ID": CLIENT_ID,
-        "Authorization": f"Bearer {token}"
-    }
-
-    # Get user ID
-    user_url = "https://api.twitch.tv/helix/users"
-    params = {"login": username}
-    user_resp = requests.get(user_url, headers=headers, params=params)
-    user_data = user_resp.json()["data"]
-
-    if not user_data:
-        return {"error": "User not found"}
-
-    user_id = user_data[0]["id"]
-    profile_image = user_data[0]["profile_image_url"]
-    display_name = user_data[0]["display_name"]
-    
-    # Parallelize all API calls
-    def get_followers():
-        followers_url = "https://api.twitch.tv/helix/channels/followers"
-        followers_params = {"broadcaster_id": user_id, "first": 1}
-        followers_resp = requests.get(followers_url, headers=headers, params=followers_params)
-        return followers_resp.json().get("total", 0)
-
-    def get_vods():
-        vods_url = "https://api.twitch.tv/helix/videos"
-        vod_params = {
-            "user_id": user_id,
-            "type": "archive"
-        }
-        vod_resp = requests.get(vods_url, headers=headers, params=vod_params)
-        return vod_resp.json()["data"]
-
-    # Execute both requests in parallel
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        followers_future = executor.submit(get_followers)
-        vods_future = executor.submit(get_vods)
-        
-        follower_count = followers_future.result()
-        vod_data = vods_future.result()
-    
-    # Batch fetch VOD details instead of individual calls
-    detailed_vods = []
-    if vod_data:
-        # Create batches of up to 100 VOD IDs (Twitch API limit)
-        vod_ids = [vod["id"] for vod in vod_data]
-        batched_vods = []
-        
-        for i in range(0, len(vod_ids), 100):
-            batch_ids = vod_ids[i:i+100]
-            video_url = "https://api.twitch.tv/helix/videos"
-            video_params = {"id": batch_ids}
-            video_resp = requests.get(video_url, headers=headers, params=video_params)
-            batch_details = video_resp.json()["data"]
-            batched_vods.extend(batch_details)
-        
-        # Create a mapping of VOD ID to detailed VOD data to preserve order
-        vod_details_map = {vod["id"]: vod for vod in batched_vods}
-        
-        # Process the detailed VODs in the original order
-        for original_vod in vod_data:
-            vod_id = original_vod["id"]
-            if vod_id in vod_details_map:
-                detailed_vod = vod_details_map[vod_id]
-                thumbnail_url = detailed_vod.get('thumbnail_url')
-                
-                # If we have a thumbnail_url, replace the template variables with actual dimensions
-                if thumbnail_url:
-                    # The API returns URLs with template variables like %{width}x%{height}
-                    # Replace them with actual dimensions
-                    thumbnail_url = thumbnail_url.replace('%{width}x%{height}', '320x180')
-                    detailed_vod['thumbnail_url'] = thumbnail_url
-                
-                detailed_vods.append(detailed_vod)
-            else:
-                # Fallback to original data if detailed info not found
-                detailed_vods.append(original_vod)
-    else:
-        # Fallback to original data if no detailed info available
-        detailed_vods = vod_data
-
-    return {
-        "user": {
-            "id": user_id,
-            "display_name": display_name,
-            "profile_image": profile_image,
-            "follower_count": follower_count,
-        },
-        "vods": detailed_vods
-    }
+    return await _channel_vods(username, cursor=cursor, first=first) or {"error": "User not found"}
 
 @app.get("/api/get-vod-info")
-def get_vod_info(vod_id: str):
-    token = get_app_token()
-    video_url = "https://api.twitch.tv/helix/videos"
-    headers = {
-        "Client-ID": CLIENT_ID,
-        "Authorization": f"Bearer {token}"
-    }
-    params = {"id": vod_id}
-    video_resp = requests.get(video_url, headers=headers, params=params)
-    video_data = video_resp.json()["data"]
+async def get_vod_info(vod_id: str):
+    video_data = await twitch.get_videos(id=vod_id)
 
     if not video_data:
         return {"error": "VOD not found"}
 
     vod = video_data[0]
     # Replace thumbnail template variables
-    thumbnail_url = vod.get('thumbnail_url', '').replace('%{width}x%{height}', '320x180')
-    vod['thumbnail_url'] = thumbnail_url
+    thumbnail_url = sized_thumbnail(vod.get("thumbnail_url", ""))
+    vod["thumbnail_url"] = thumbnail_url
 
     # Return only the fields your frontend expects
     return {
@@ -566,4 +658,8 @@ def get_vod_info(vod_id: str):
         "display_name": vod.get("user_name"),
         "user_login": vod.get("user_login"),
         "user_id": vod.get("user_id"),
-    }
\ No newline at end of file
+    }
+
+@app.get("/metrics/twitch")
+def get_twitch_stats():
+    return twitch.stats()
@@ -1 +1,136 @@
-current_progress = {"message": ""}
\ No newline at end of file
+import asyncio
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+current_progress = {"message": ""}
+
+# Share of the overall progress bar each pipeline stage covers, in percent.
+# Failed, cancelled and timed-out runs keep the percentage they reached.
+STAGE_RANGES = {
+    "queued": (0, 0),
+    "chat": (0, 30),
+    "analysis": (30, 40),
+    "clipping": (40, 95),
+    "saving": (95, 100),
+    "done": (100, 100),
+}
+TERMINAL_STAGES = {"done", "failed", "cancelled", "timed_out"}
+
+
+def _offer(queue, event):
+    # Runs on the subscriber's event loop. A client that stopped reading loses
+    # its oldest events rather than growing the queue without bound.
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class ProgressHub:
+    """Fans out per-project progress events from pipeline threads to asyncio subscribers.
+
+    The latest event of recently active projects is kept so a client that
+    subscribes mid-run (or reconnects) starts from the current state.
+    """
+
+    def __init__(self, history=1024, queue_size=100):
+        self.history = history
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._last = OrderedDict()
+        self.published = 0
+
+    def publish(self, project_id, event):
+        with self._lock:
+            self._last[project_id] = event
+            self._last.move_to_end(project_id)
+            while len(self._last) > self.history:
+                self._last.popitem(last=False)
+            subscribers = list(self._subscribers.get(project_id, ()))
+            self.published += 1
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                pass  # loop already closed; its subscription is going away
+
+    def last_event(self, project_id):
+        with self._lock:
+            return self._last.get(project_id)
+
+    async def subscribe(self, project_id, heartbeat=15.0):
+        """Yield events for ``project_id`` until a terminal one; None every ``heartbeat`` idle seconds."""
+        entry = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers[project_id].add(entry)
+            last = self._last.get(project_id)
+        try:
+            if last is not None:
+                yield last
+                if last["stage"] in TERMINAL_STAGES:
+                    return
+            while True:
+                try:
+                    event = await asyncio.wait_for(entry[1].get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event
+                if event["stage"] in TERMINAL_STAGES:
+                    return
+        finally:
+            with self._lock:
+                self._subscribers[project_id].discard(entry)
+                if not self._subscribers[project_id]:
+                    del self._subscribers[project_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+                "projects_watched": len(self._subscribers),
+                "projects_tracked": len(self._last),
+                "events_published": self.published,
+            }
+
+
+progress_hub = ProgressHub()
+
+
+class ProjectProgress:
+    """Progress callback for one project's pipeline.
+
+    Called like the plain ``progress(message)`` sinks, optionally with the
+    pipeline ``stage`` and the ``fraction`` of that stage done. Every call
+    becomes a structured event on the hub. The global status message served
+    by GET /status is left alone, so concurrent projects don't overwrite
+    each other there; clients follow /project-events/{id} instead.
+    """
+
+    def __init__(self, project_id, hub=progress_hub):
+        self.project_id = project_id
+        self.hub = hub
+        self.stage = "queued"
+        self.percent = 0.0
+        # Parallel clip encodes report from their own threads
+        self._lock = threading.Lock()
+
+    def __call__(self, message, stage=None, fraction=None):
+        with self._lock:
+            if stage is not None and stage != self.stage:
+                self.stage = stage
+                if stage in STAGE_RANGES:
+                    self.percent = max(self.percent, STAGE_RANGES[stage][0])
+            if fraction is not None and self.stage in STAGE_RANGES:
+                low, high = STAGE_RANGES[self.stage]
+                # Never move the bar backwards, e.g. when parallel clips finish out of order
+                self.percent = max(self.percent, low + (high - low) * min(max(fraction, 0.0), 1.0))
+            # Published under the lock too, so events leave in the order their percentages were set
+            self.hub.publish(self.project_id, {
+                "project_id": self.project_id,
+                "stage": self.stage,
+                "percent": round(float(self.percent), 1),
+                "message": message,
+                "timestamp": time.time(),
+            })
@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import OrderedDict
+
+from ttl_cache import TTLCache
+
+# Read-through caches for the dashboard endpoints. Project rows and clip
+# lists only change when the server itself writes them (project creation,
+# pipeline status/clip writes, deletion), and those paths invalidate the
+# affected entries, so the TTL only bounds staleness from edits made
+# outside this process.
+PROJECT_CACHE_TTL = float(os.getenv("PROJECT_CACHE_TTL", "300"))
+PROJECT_CACHE_SIZE = int(os.getenv("PROJECT_CACHE_SIZE", "10000"))
+
+project_rows = TTLCache(PROJECT_CACHE_SIZE, PROJECT_CACHE_TTL, name="project_rows")
+project_clips = TTLCache(PROJECT_CACHE_SIZE, PROJECT_CACHE_TTL, name="project_clips")
+# user_id -> {(limit, cursor): (project rows, next cursor)}
+user_listings = TTLCache(PROJECT_CACHE_SIZE, PROJECT_CACHE_TTL, name="user_listings")
+# project_id -> user_id, to find the listing a project write affects
+project_owners = TTLCache(PROJECT_CACHE_SIZE * 4, PROJECT_CACHE_TTL * 4, name="project_owners")
+
+
+class Generations:
+    """When each key was last invalidated, on one counter shared by all keys.
+
+    A load takes ``token()`` before it queries and passes it to the
+    ``remember_*`` call that caches the result; if the key was invalidated in
+    between, the result may predate the write and isn't cached. Only the
+    most recent ``maxsize`` keys are remembered; older ones count as
+    invalidated at the newest generation forgotten, which can only skip a
+    fill, never let a stale one in.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = max(1, maxsize)
+        self._data = OrderedDict()
+        self._current = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    def token(self):
+        with self._lock:
+            return self._current
+
+    def bump(self, key):
+        with self._lock:
+            self._current += 1
+            self._data[key] = self._current
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                _, generation = self._data.popitem(last=False)
+                self._floor = max(self._floor, generation)
+
+    def changed_since(self, key, token):
+        with self._lock:
+            return self._data.get(key, self._floor) > token
+
+
+generations = Generations(PROJECT_CACHE_SIZE * 4)
+
+
+def token():
+    """Take before loading anything that will be cached."""
+    return generations.token()
+
+
+def remember_owner(project_id, user_id):
+    project_owners.set(project_id, user_id)
+
+
+def remember_rows(rows, since=None):
+    for row in rows:
+        # A project's owner never changes, so even a raced load knows it
+        remember_owner(row["id"], row["user_id"])
+        if since is not None and generations.changed_since(("project", row["id"]), since):
+            continue
+        project_rows.set(row["id"], row)
+
+
+def remember_clips(project_id, clips, since):
+    if not generations.changed_since(("project", project_id), since):
+        project_clips.set(project_id, clips)
+
+
+def remember_listing(user_id, listings, since):
+    if not generations.changed_since(("user", user_id), since):
+        user_listings.set(user_id, listings)
+
+
+def invalidate_user(user_id):
+    generations.bump(("user", user_id))
+    user_listings.delete(user_id)
+
+
+def invalidate_project(project_id, user_id=None):
+    """Forget everything cached about a project, including its owner's listings."""
+    generations.bump(("project", project_id))
+    project_rows.delete(project_id)
+    project_clips.delete(project_id)
+    user_id = user_id or project_owners.get(project_id)
+    if user_id is not None:
+        invalidate_user(user_id)
+
+
+def stats():
+    return {cache.name: cache.stats() for cache in (project_rows, project_clips, user_listings)}
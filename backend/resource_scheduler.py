@@ -0,0 +1,192 @@
+import asyncio
+import bisect
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from span_planner import DOWNLOAD_BANDWIDTH_MBPS
+
+# Machine-wide budgets shared by every clip job:
+#   cpu     - encoder threads; each ffmpeg encode holds ENCODE_THREADS of them
+#             and is started with -threads set to what it was granted
+#   network - parallel media connections; each download holds DOWNLOAD_SLOTS
+#             and uses that many concurrent fragments
+# Work that doesn't fit waits instead of oversubscribing: by priority, then in
+# FIFO order. A user waiting on a response (a trim download) goes ahead of
+# background pipeline work.
+CPU_THREADS = int(os.getenv("RESOURCE_CPU_THREADS", str(os.cpu_count() or 1)))
+ENCODE_THREADS = int(os.getenv("ENCODE_THREADS", str(max(1, CPU_THREADS // 4))))
+# One fragment connection to the Twitch CDN sustains roughly this much
+CONNECTION_MBPS = float(os.getenv("CONNECTION_MBPS", "10"))
+NETWORK_SLOTS = int(os.getenv("RESOURCE_NETWORK_SLOTS", str(max(1, int(DOWNLOAD_BANDWIDTH_MBPS // CONNECTION_MBPS)))))
+DOWNLOAD_SLOTS = int(os.getenv("DOWNLOAD_SLOTS", "5"))
+
+# Lower is served first
+INTERACTIVE = 0
+PIPELINE = 1
+
+
+class ResourcePool:
+    """A counted resource handed out by priority, then first come, first served.
+
+    Requests larger than the pool are clamped to its capacity. Waiting
+    requests block the ones behind them, so a large request can't starve
+    behind smaller ones of the same priority.
+    """
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.in_use = 0
+        self._cond = threading.Condition()
+        self._waiting = []         # sorted (priority, seq) tickets; the head is served next
+        self._seq = itertools.count()
+        self._wakers = []          # (loop, future) of coroutines waiting in acquire_async
+        self._created = time.monotonic()
+        self._busy_integral = 0.0   # sum of in_use * seconds
+        self._last_change = self._created
+        self.peak_in_use = 0
+        self.peak_waiting = 0
+        self.grants = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _account(self, now):
+        self._busy_integral += self.in_use * (now - self._last_change)
+        self._last_change = now
+
+    def _enqueue(self, priority):
+        ticket = (priority, next(self._seq))
+        bisect.insort(self._waiting, ticket)
+        self.peak_waiting = max(self.peak_waiting, len(self._waiting))
+        return ticket
+
+    def _fits(self, ticket, amount):
+        return self._waiting[0] == ticket and self.in_use + amount <= self.capacity
+
+    def _grant(self, amount, started):
+        now = time.monotonic()
+        self._account(now)
+        self.in_use += amount
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        waited = now - started
+        self.grants += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def _notify(self):
+        # Called with the condition held: wake blocked threads and waiting coroutines
+        self._cond.notify_all()
+        for loop, future in self._wakers:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:  # that loop has closed; nothing left to wake
+                pass
+        self._wakers.clear()
+
+    def acquire(self, amount, job=None, priority=PIPELINE):
+        """Block until ``amount`` units are free; returns the units granted."""
+        amount = min(max(1, amount), self.capacity)
+        started = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(priority)
+            try:
+                while not self._fits(ticket, amount):
+                    # Wake up now and then so a cancelled job stops waiting
+                    self._cond.wait(timeout=1.0 if job is not None else None)
+                    if job is not None:
+                        job.check()
+            finally:
+                self._waiting.remove(ticket)
+                # The next request in line may fit in what's left
+                self._notify()
+            self._grant(amount, started)
+        return amount
+
+    async def acquire_async(self, amount, priority=INTERACTIVE):
+        """``acquire`` for the event loop: waits without holding a thread.
+
+        Cancelling the awaiting task (a client that disconnects) gives up its
+        place in line.
+        """
+        amount = min(max(1, amount), self.capacity)
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self._cond:
+                    if self._fits(ticket, amount):
+                        self._grant(amount, started)
+                        return amount
+                    # Registered under the lock, so a release can't slip in unseen
+                    future = loop.create_future()
+                    self._wakers.append((loop, future))
+                await future
+        finally:
+            with self._cond:
+                self._waiting.remove(ticket)
+                self._notify()
+
+    def release(self, amount):
+        with self._cond:
+            self._account(time.monotonic())
+            self.in_use -= amount
+            self._notify()
+
+    @contextmanager
+    def hold(self, amount, job=None, priority=PIPELINE):
+        granted = self.acquire(amount, job, priority)
+        try:
+            yield granted
+        finally:
+            self.release(granted)
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            self._account(now)
+            elapsed = now - self._created
+            return {
+                "capacity": self.capacity,
+                "in_use": self.in_use,
+                "waiting": len(self._waiting),
+                "peak_in_use": self.peak_in_use,
+                "peak_waiting": self.peak_waiting,
+                "grants": self.grants,
+                "avg_wait_seconds": self.total_wait / self.grants if self.grants else 0.0,
+                "max_wait_seconds": self.max_wait,
+                # Average fraction of the pool held since startup
+                "utilization": self._busy_integral / (self.capacity * elapsed) if elapsed else 0.0,
+            }
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ResourceScheduler:
+    def __init__(self, cpu_threads=CPU_THREADS, network_slots=NETWORK_SLOTS,
+                 encode_threads=ENCODE_THREADS, download_slots=DOWNLOAD_SLOTS):
+        self.cpu_pool = ResourcePool("cpu", cpu_threads)
+        self.network_pool = ResourcePool("network", network_slots)
+        self.encode_threads = encode_threads
+        self.download_slots = download_slots
+
+    def cpu(self, job=None, threads=None):
+        """Hold encoder threads; yields how many the encode may use."""
+        return self.cpu_pool.hold(threads or self.encode_threads, job)
+
+    def network(self, job=None, slots=None):
+        """Hold download connections; yields how many the download may open."""
+        return self.network_pool.hold(slots or self.download_slots, job)
+
+    def stats(self):
+        return {"cpu": self.cpu_pool.stats(), "network": self.network_pool.stats()}
+
+
+resources = ResourceScheduler()
@@ -0,0 +1,177 @@
+import json
+import os
+import subprocess
+
+# How finished clips are encoded:
+#   "smart" - stream-copy the keyframe-aligned middle of the clip and re-encode
+#             only the partial GOPs at either end (falls back to "full" when the
+#             source can't be cut that way)
+#   "full"  - re-encode the whole clip with libx264, the original behaviour
+CLIP_ENCODE_MODE = os.getenv("CLIP_ENCODE_MODE", "smart")
+FFMPEG = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE = os.getenv("FFPROBE_BIN", "ffprobe")
+
+# Sources whose partial GOPs libx264 can re-encode into a compatible stream
+SMART_CUT_CODECS = {"h264"}
+SMART_CUT_PIX_FMTS = {"yuv420p", "yuvj420p"}
+X264_PROFILES = {"baseline", "constrained baseline", "main", "high"}
+
+
+def _default_run(cmd):
+    return subprocess.run(cmd, check=True)
+
+
+def _probe_json(args):
+    out = subprocess.run([FFPROBE, "-v", "error", "-of", "json", *args], check=True,
+                         capture_output=True, text=True)
+    return json.loads(out.stdout or "{}")
+
+
+def probe_video(path):
+    """Codec details of the first video stream plus the container duration."""
+    info = _probe_json([
+        "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,profile,pix_fmt,width,height,r_frame_rate:format=duration",
+        path,
+    ])
+    streams = info.get("streams") or [{}]
+    video = dict(streams[0])
+    video["duration"] = float((info.get("format") or {}).get("duration") or 0)
+    return video
+
+
+def probe_keyframes(path):
+    """Times of the video keyframes, read from packet flags (no decoding).
+
+    Packet timestamps are the stream's own; they're shifted by the file's
+    start time so they line up with ``-ss`` and the clip range, which count
+    from the start of the file (an MPEG-TS cut from a live stream can start
+    hours in).
+    """
+    info = _probe_json([
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags:format=start_time",
+        path,
+    ])
+    offset = (info.get("format") or {}).get("start_time")
+    offset = float(offset) if offset not in (None, "N/A") else 0.0
+    keyframes = []
+    for packet in info.get("packets", []):
+        if "K" in packet.get("flags", "") and packet.get("pts_time") not in (None, "N/A"):
+            keyframes.append(float(packet["pts_time"]) - offset)
+    return sorted(keyframes)
+
+
+def has_audio(path):
+    return bool(_probe_json(["-select_streams", "a", "-show_entries", "stream=index", path]).get("streams"))
+
+
+def full_reencode(input_path, output_path, start=None, end=None, run=_default_run, threads=None):
+    cmd = [FFMPEG, "-y"]
+    if start:
+        cmd += ["-ss", f"{start:.3f}"]
+    if end is not None:
+        cmd += ["-t", f"{end - (start or 0):.3f}"]
+    cmd += [
+        "-i", input_path,
+        "-movflags", "faststart",
+        "-preset", "ultrafast",
+        "-c:v", "libx264",
+        "-c:a", "aac",
+        "-b:a", "128k",
+    ]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    run(cmd + [output_path])
+    return output_path
+
+
+def plan_smart_cut(keyframes, start, end):
+    """(first keyframe inside the clip, last keyframe inside it) or None when no full GOP fits."""
+    inside = [k for k in keyframes if start <= k <= end]
+    if len(inside) < 2:
+        return None
+    return inside[0], inside[-1]
+
+
+def _x264_args(video, threads):
+    profile = (video.get("profile") or "").lower()
+    # The edges are a second or two of video, so a preset that keeps CABAC on
+    # (like the source) costs little and keeps the parameter sets close
+    args = ["-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", video.get("pix_fmt") or "yuv420p"]
+    if profile in X264_PROFILES:
+        args += ["-profile:v", "baseline" if "baseline" in profile else profile]
+    if video.get("r_frame_rate") and video["r_frame_rate"] != "0/0":
+        args += ["-r", video["r_frame_rate"]]
+    if threads:
+        args += ["-threads", str(threads)]
+    return args
+
+
+def smart_cut(input_path, output_path, start=0.0, end=None, workdir=None, run=_default_run, threads=None):
+    """Cut [start, end) seconds of ``input_path`` into a faststart MP4.
+
+    Only the frames between ``start`` and the first keyframe, and between the
+    last keyframe and ``end``, are re-encoded; the GOPs in between are copied.
+    Video pieces are joined as MPEG-TS (in-band SPS/PPS, so the encoded and
+    copied parts can carry their own parameter sets) and muxed with the audio,
+    which is re-encoded to AAC because that is cheap. Falls back to a full
+    re-encode when the codec doesn't allow it or a step fails.
+    """
+    try:
+        video = probe_video(input_path)
+        keyframes = probe_keyframes(input_path)
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print(f"Could not probe {input_path} ({e}), re-encoding")
+        return full_reencode(input_path, output_path, start, end, run, threads)
+    if end is None:
+        end = video["duration"]
+    if video.get("codec_name") not in SMART_CUT_CODECS or video.get("pix_fmt") not in SMART_CUT_PIX_FMTS:
+        print(f"Smart cut unsupported for {video.get('codec_name')}/{video.get('pix_fmt')}, re-encoding")
+        return full_reencode(input_path, output_path, start, end, run, threads)
+    plan = plan_smart_cut(keyframes, start, end)
+    if plan is None:
+        return full_reencode(input_path, output_path, start, end, run, threads)
+    copy_start, copy_end = plan
+
+    workdir = workdir or os.path.dirname(os.path.abspath(output_path))
+    base = os.path.join(workdir, os.path.splitext(os.path.basename(output_path))[0])
+    head, body, tail, audio = f"{base}.head.ts", f"{base}.body.ts", f"{base}.tail.ts", f"{base}.audio.m4a"
+    concat_list = f"{base}.parts.txt"
+    x264 = _x264_args(video, threads)
+    parts = []
+    try:
+        if copy_start - start > 0.001:
+            run([FFMPEG, "-y", "-ss", f"{start:.3f}", "-i", input_path, "-t", f"{copy_start - start:.3f}",
+                 "-an", *x264, "-f", "mpegts", head])
+            parts.append(head)
+        run([FFMPEG, "-y", "-ss", f"{copy_start:.3f}", "-i", input_path, "-t", f"{copy_end - copy_start:.3f}",
+             "-an", "-c:v", "copy", "-bsf:v", "h264_mp4toannexb", "-f", "mpegts", body])
+        parts.append(body)
+        if end - copy_end > 0.001:
+            run([FFMPEG, "-y", "-ss", f"{copy_end:.3f}", "-i", input_path, "-t", f"{end - copy_end:.3f}",
+                 "-an", *x264, "-f", "mpegts", tail])
+            parts.append(tail)
+        run([FFMPEG, "-y", "-ss", f"{start:.3f}", "-i", input_path, "-t", f"{end - start:.3f}",
+             "-vn", "-c:a", "aac", "-b:a", "128k", audio])
+        # The concat demuxer shifts each part's timestamps to follow the previous one
+        with open(concat_list, "w", encoding="utf-8") as f:
+            f.writelines(f"file '{os.path.abspath(part)}'\n" for part in parts)
+        run([FFMPEG, "-y", "-f", "concat", "-safe", "0", "-i", concat_list, "-i", audio,
+             "-map", "0:v:0", "-map", "1:a:0?", "-c", "copy", "-movflags", "+faststart", output_path])
+    except subprocess.CalledProcessError as e:
+        print(f"Smart cut failed ({e}), falling back to a full re-encode")
+        return full_reencode(input_path, output_path, start, end, run, threads)
+    finally:
+        for path in (head, body, tail, audio, concat_list):
+            if os.path.exists(path):
+                os.remove(path)
+    return output_path
+
+
+def encode_clip(input_path, output_path, start=0.0, end=None, workdir=None, run=_default_run,
+                mode=None, threads=None):
+    """Turn a downloaded section into the final clip using the configured mode."""
+    if (mode or CLIP_ENCODE_MODE) == "smart":
+        return smart_cut(input_path, output_path, start, end, workdir, run, threads)
+    return full_reencode(input_path, output_path, start, end, run, threads)
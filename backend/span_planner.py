@@ -0,0 +1,77 @@
+import os
+from dataclasses import dataclass, field
+
+# Cost model for grouping nearby hype windows into one media download.
+# Joining two windows downloads the gap between them for nothing; keeping them
+# apart costs another yt-dlp run (playlist resolve, HLS setup, edge fragments).
+# Both are expressed as seconds of transfer time.
+SOURCE_BITRATE_KBPS = float(os.getenv("SOURCE_BITRATE_KBPS", "8000"))      # 1080p60 Twitch source
+DOWNLOAD_BANDWIDTH_MBPS = float(os.getenv("DOWNLOAD_BANDWIDTH_MBPS", "100"))
+REQUEST_OVERHEAD_SECONDS = float(os.getenv("DOWNLOAD_REQUEST_OVERHEAD", "4"))
+# Long spans would serialize clips that could otherwise download in parallel
+MAX_SPAN_SECONDS = int(os.getenv("MAX_DOWNLOAD_SPAN_SECONDS", "600"))
+
+
+@dataclass
+class DownloadSpan:
+    start: int
+    end: int
+    windows: list = field(default_factory=list)   # (window index, start, end)
+
+    @property
+    def length(self):
+        return self.end - self.start
+
+    def clip_range(self, start, end, lead_in=0.0):
+        """Where the window [start, end) of the VOD sits in this span's download.
+
+        ``lead_in`` is how far the download starts before ``self.start``
+        (its keyframe-aligned head).
+        """
+        return lead_in + start - self.start, lead_in + end - self.start
+
+
+def gap_cost_seconds(gap, bitrate_kbps=SOURCE_BITRATE_KBPS, bandwidth_mbps=DOWNLOAD_BANDWIDTH_MBPS):
+    """Transfer time spent on ``gap`` seconds of media nobody asked for."""
+    return gap * bitrate_kbps / (bandwidth_mbps * 1000)
+
+
+def plan_download_spans(windows, request_overhead=REQUEST_OVERHEAD_SECONDS, max_span=MAX_SPAN_SECONDS,
+                        bitrate_kbps=SOURCE_BITRATE_KBPS, bandwidth_mbps=DOWNLOAD_BANDWIDTH_MBPS):
+    """Group (start, end) windows into spans that are each downloaded once.
+
+    Windows are taken in time order; a window joins the previous span when
+    fetching the gap costs less than a separate request and the span stays
+    within ``max_span`` seconds. Invalid windows (end <= start) are skipped.
+    """
+    spans = []
+    indexed = sorted((start, end, i) for i, (start, end) in enumerate(windows) if end > start)
+    for start, end, i in indexed:
+        if spans:
+            span = spans[-1]
+            gap = max(0, start - span.end)
+            joined_length = max(span.end, end) - span.start
+            if gap_cost_seconds(gap, bitrate_kbps, bandwidth_mbps) < request_overhead and joined_length <= max_span:
+                span.end = max(span.end, end)
+                span.windows.append((i, start, end))
+                continue
+        spans.append(DownloadSpan(start, end, [(i, start, end)]))
+    return spans
+
+
+def plan_summary(spans, bitrate_kbps=SOURCE_BITRATE_KBPS):
+    """Requests saved and bytes fetched outside any window, for logging."""
+    windows = sum(len(span.windows) for span in spans)
+    covered = 0
+    for span in spans:
+        cursor = span.start
+        for _, start, end in sorted(span.windows, key=lambda w: w[1]):
+            covered += max(0, end - max(start, cursor))
+            cursor = max(cursor, end)
+    wasted_seconds = sum(span.length for span in spans) - covered
+    return {
+        "windows": windows,
+        "requests": len(spans),
+        "requests_saved": windows - len(spans),
+        "wasted_bytes": int(wasted_seconds * bitrate_kbps * 125),
+    }
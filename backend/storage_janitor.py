@@ -0,0 +1,303 @@
+import os
+import queue
+import shutil
+import threading
+import time
+
+# Keeps the clips/<user id>/<project id> tree bounded. Projects expire
+# STORAGE_TTL_DAYS after their clips were written, and once the tree holds
+# more than STORAGE_QUOTA_BYTES the least recently accessed projects are
+# evicted until it fits again. Sizes are kept in a ledger that is built by
+# walking the tree once at startup and then updated as clips are written and
+# projects removed, so neither the sweeps nor the metrics walk the disk.
+# Directory removal happens on the janitor thread, never in a request.
+#
+# A project directory's mtime is its last access time, so the eviction
+# order survives restarts.
+
+CLIPS_DIR = "clips"
+STORAGE_TTL_DAYS = float(os.getenv("STORAGE_TTL_DAYS", "7"))
+# 0 disables the quota
+STORAGE_QUOTA_BYTES = int(os.getenv("STORAGE_QUOTA_BYTES", str(200 * 1024 ** 3)))
+JANITOR_INTERVAL = float(os.getenv("JANITOR_INTERVAL", "600"))
+# Access times are only written back to disk this often per project
+TOUCH_INTERVAL = 60.0
+
+
+class ProjectUsage:
+    __slots__ = ("bytes", "files", "created", "accessed")
+
+    def __init__(self, created, accessed=None):
+        self.bytes = 0
+        self.files = 0
+        self.created = created
+        self.accessed = accessed if accessed is not None else created
+
+
+class StorageJanitor:
+    """Ledger of disk usage per project plus the thread that removes projects.
+
+    ``on_evict(user_id, project_id, reason)`` is called from the janitor
+    thread for every project it expires or evicts, after its files are gone;
+    ``is_busy(project_id)`` protects projects whose pipeline is still running.
+    """
+
+    def __init__(self, root=CLIPS_DIR, ttl_days=STORAGE_TTL_DAYS, quota_bytes=STORAGE_QUOTA_BYTES,
+                 interval=JANITOR_INTERVAL):
+        self.root = root
+        self.ttl = ttl_days * 86400
+        self.quota_bytes = quota_bytes
+        self.interval = interval
+        self.on_evict = None
+        self.is_busy = lambda project_id: False
+        self._projects = {}          # (user_id, project_id) -> ProjectUsage
+        self._user_bytes = {}        # user_id -> bytes
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._deletions = queue.Queue()
+        self._thread = None
+        self._closed = False
+        self._last_sweep = None
+        self.counters = {
+            "reclaimed_bytes": 0, "deleted": 0, "expired": 0, "evicted": 0, "delete_errors": 0,
+        }
+
+    def _key(self, path):
+        """(user_id, project_id) of a file inside a project directory of the clips tree, or None."""
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))
+        parts = rel.split(os.sep)
+        if len(parts) < 3 or parts[0] == os.pardir:
+            return None
+        return parts[0], parts[1]
+
+    def _project_dir(self, user_id, project_id):
+        return os.path.join(self.root, str(user_id), str(project_id))
+
+    def _add_bytes(self, key, usage, size, files=0):
+        usage.bytes += size
+        usage.files += files
+        self._user_bytes[key[0]] = self._user_bytes.get(key[0], 0) + size
+        self._total_bytes += size
+
+    def _forget(self, key):
+        usage = self._projects.pop(key, None)
+        if usage is None:
+            return 0
+        size = usage.bytes
+        self._add_bytes(key, usage, -size, -usage.files)
+        if not self._user_bytes.get(key[0]):
+            self._user_bytes.pop(key[0], None)
+        return size
+
+    def build(self):
+        """Walk the clips tree once to seed the ledger."""
+        projects = {}
+        if os.path.isdir(self.root):
+            for user_id in os.listdir(self.root):
+                user_dir = os.path.join(self.root, user_id)
+                if not os.path.isdir(user_dir):
+                    continue
+                for project_id in os.listdir(user_dir):
+                    project_dir = os.path.join(user_dir, project_id)
+                    # Only project directories; loose files (e.g. clips/<uuid>/clip_N.mp4
+                    # from older layouts) aren't projects and must never be deleted as one
+                    if not os.path.isdir(project_dir):
+                        continue
+                    try:
+                        accessed = os.stat(project_dir).st_mtime
+                    except OSError:
+                        continue
+                    usage = ProjectUsage(created=None, accessed=accessed)
+                    for dirpath, _, files in os.walk(project_dir):
+                        for name in files:
+                            try:
+                                st = os.stat(os.path.join(dirpath, name))
+                            except OSError:
+                                continue
+                            usage.bytes += st.st_size
+                            usage.files += 1
+                            # Clips aren't rewritten, so the oldest one dates the project
+                            usage.created = st.st_mtime if usage.created is None else min(usage.created, st.st_mtime)
+                    if usage.created is None:
+                        usage.created = accessed
+                    projects[(user_id, project_id)] = usage
+        with self._lock:
+            self._projects = {}
+            self._user_bytes = {}
+            self._total_bytes = 0
+            for key, usage in projects.items():
+                size, files = usage.bytes, usage.files
+                usage.bytes = usage.files = 0
+                self._projects[key] = usage
+                self._add_bytes(key, usage, size, files)
+
+    def track(self, user_id, project_id):
+        """Start the ledger entry for a new project."""
+        now = time.time()
+        with self._lock:
+            self._projects.setdefault((str(user_id), str(project_id)), ProjectUsage(now))
+
+    def record(self, path):
+        """Account for a file just written into a project."""
+        key = self._key(path)
+        if key is None:
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        now = time.time()
+        with self._lock:
+            usage = self._projects.get(key)
+            if usage is None:
+                usage = self._projects[key] = ProjectUsage(now)
+            self._add_bytes(key, usage, size, 1)
+            usage.accessed = now
+        self._maybe_sweep_for_quota()
+
+    def touch(self, user_id, project_id):
+        """Mark a project as just accessed (it moves to the back of the eviction order)."""
+        key = (str(user_id), str(project_id))
+        now = time.time()
+        with self._lock:
+            usage = self._projects.get(key)
+            if usage is None:
+                return
+            persist = now - usage.accessed > TOUCH_INTERVAL
+            usage.accessed = now
+        if persist:
+            try:
+                os.utime(self._project_dir(*key))
+            except OSError:
+                pass
+
+    def touch_path(self, path):
+        key = self._key(path)
+        if key is not None:
+            self.touch(*key)
+
+    def remove(self, user_id, project_id, reason="deleted"):
+        """Drop a project from the ledger and queue its directory for deletion."""
+        key = (str(user_id), str(project_id))
+        with self._lock:
+            size = self._forget(key)
+        self._deletions.put((key, size, reason))
+        self._ensure_thread()
+
+    def _delete(self, key, size, reason):
+        project_dir = self._project_dir(*key)
+        try:
+            if os.path.exists(project_dir):
+                shutil.rmtree(project_dir)
+        except OSError as e:
+            print(f"⚠️ Failed to remove {project_dir}: {e}")
+            with self._lock:
+                self.counters["delete_errors"] += 1
+            return
+        with self._lock:
+            self.counters["reclaimed_bytes"] += size
+            self.counters[reason] += 1
+        if reason != "deleted" and self.on_evict:
+            try:
+                self.on_evict(key[0], key[1], reason)
+            except Exception as e:
+                print(f"⚠️ Cleanup after removing {project_dir} failed: {e}")
+
+    def _candidates(self):
+        """Projects to remove now: expired ones, then the least recently accessed over quota."""
+        now = time.time()
+        chosen = []
+        with self._lock:
+            idle = [(key, usage) for key, usage in self._projects.items() if not self.is_busy(key[1])]
+            remaining = self._total_bytes
+            if self.ttl > 0:
+                for key, usage in idle:
+                    if now - usage.created >= self.ttl:
+                        chosen.append((key, "expired"))
+                        remaining -= usage.bytes
+            if self.quota_bytes and remaining > self.quota_bytes:
+                expired = {key for key, _ in chosen}
+                for key, usage in sorted(idle, key=lambda item: item[1].accessed):
+                    if remaining <= self.quota_bytes:
+                        break
+                    if key not in expired:
+                        chosen.append((key, "evicted"))
+                        remaining -= usage.bytes
+        return chosen
+
+    def sweep(self):
+        """Queue every expired or over-quota project for removal. Returns how many."""
+        self._last_sweep = time.time()
+        chosen = self._candidates()
+        for key, reason in chosen:
+            self.remove(*key, reason=reason)
+        return len(chosen)
+
+    def _maybe_sweep_for_quota(self):
+        with self._lock:
+            over = self.quota_bytes and self._total_bytes > self.quota_bytes
+        if over and self._thread is not None:
+            # Wake the janitor instead of sweeping on the writer's thread
+            self._deletions.put(None)
+
+    def _run(self):
+        next_sweep = time.monotonic()
+        while True:
+            timeout = max(0.0, next_sweep - time.monotonic())
+            try:
+                item = self._deletions.get(timeout=timeout)
+            except queue.Empty:
+                next_sweep = time.monotonic() + self.interval
+                if not self._closed:
+                    self.sweep()
+                continue
+            if item is None:
+                if self._closed:
+                    return
+                self.sweep()
+                continue
+            self._delete(*item)
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="storage-janitor", daemon=True)
+                self._thread.start()
+
+    def start(self):
+        """Seed the ledger and start sweeping every ``interval`` seconds."""
+        self.build()
+        self._ensure_thread()
+
+    def close(self, timeout=10):
+        """Finish the queued deletions and stop the thread."""
+        self._closed = True
+        if self._thread is not None:
+            self._deletions.put(None)
+            self._thread.join(timeout=timeout)
+
+    def usage(self, user_id):
+        with self._lock:
+            return self._user_bytes.get(str(user_id), 0)
+
+    def stats(self, top_users=10):
+        with self._lock:
+            counters = dict(self.counters)
+            counters["total_bytes"] = self._total_bytes
+            counters["projects"] = len(self._projects)
+            counters["users"] = len(self._user_bytes)
+            counters["top_users"] = sorted(self._user_bytes.items(), key=lambda item: -item[1])[:top_users]
+        counters["quota_bytes"] = self.quota_bytes
+        counters["quota_used"] = counters["total_bytes"] / self.quota_bytes if self.quota_bytes else None
+        counters["ttl_days"] = self.ttl / 86400
+        counters["pending_deletions"] = self._deletions.qsize()
+        counters["last_sweep"] = self._last_sweep
+        try:
+            disk = shutil.disk_usage(self.root)
+            counters["disk"] = {"total": disk.total, "used": disk.used, "free": disk.free}
+        except OSError:
+            counters["disk"] = None
+        return counters
+
+
+storage_janitor = StorageJanitor()
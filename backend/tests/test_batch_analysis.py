@@ -0,0 +1,69 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import batch_analysis
+from benchmarks.synthetic_chat import write_synthetic_chat
+from job_scheduler import Job, JobCancelled
+
+
+@pytest.fixture(scope="module", autouse=True)
+def shared_pool():
+    yield
+    batch_analysis.shutdown_pool()
+
+
+def test_analyze_chat_files_on_shared_pool(tmp_path):
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f"vod_{i}.json")
+        write_synthetic_chat(path, 5000, duration=1200, bursts=3, seed=i)
+        paths.append(path)
+    paths.append(str(tmp_path / "missing.json"))
+
+    results = batch_analysis.analyze_chat_files(paths)
+
+    assert [r["source"] for r in results] == paths
+    for result in results[:3]:
+        assert result["messages"] == 5000
+        assert result["windows"]
+    assert results[3]["error"]
+    # Later batches reuse the same workers
+    assert batch_analysis.get_pool() is batch_analysis.get_pool()
+
+
+def test_cancelled_job_stops_the_batch(tmp_path):
+    path = str(tmp_path / "vod.json")
+    write_synthetic_chat(path, 1000, duration=600, bursts=1)
+    job = Job("batch-test", None, ())
+    job.cancel()
+    with pytest.raises(JobCancelled):
+        batch_analysis.analyze_chat_files([path] * 4, job=job)
+
+
+def test_batch_endpoint_returns_a_pollable_job(monkeypatch):
+    import main
+
+    seen = []
+
+    def fake_batch(job, items):
+        seen.append(items)
+        return [{"source": url, "windows": []} for url, _, _ in items]
+
+    monkeypatch.setattr(main, "run_batch_analysis", fake_batch)
+    client = TestClient(main.app)
+    response = client.post("/batch-analyze", json={"vods": [{"twitch_url": "https://www.twitch.tv/videos/1"}]})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    deadline = time.monotonic() + 5
+    while True:
+        body = client.get(f"/batch-analyze/{job_id}").json()
+        if body["status"] == "done" or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert body["status"] == "done"
+    assert body["results"] == [{"source": "https://www.twitch.tv/videos/1", "windows": []}]
+    assert seen == [[("https://www.twitch.tv/videos/1", "00:00:00", "00:00:00")]]
+    assert client.get("/batch-analyze/batch-unknown").status_code == 404
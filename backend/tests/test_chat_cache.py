@@ -0,0 +1,38 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from chat_cache import ChatHistogramCache
+
+
+def store_range(cache_dir, start, end, value):
+    cache = ChatHistogramCache(cache_dir)
+    counts = np.zeros(end, dtype=np.int32)
+    counts[start:end] = value
+    cache.store("123", start, end, {"counts": counts})
+
+
+def test_store_merges_ranges(tmp_path):
+    cache = ChatHistogramCache(str(tmp_path))
+    store_range(str(tmp_path), 0, 10, 1)
+    store_range(str(tmp_path), 20, 30, 2)
+
+    assert cache.coverage("123") == [(0, 10), (20, 30)]
+    assert cache.missing_ranges("123", 0, 30) == [(10, 20)]
+    assert cache.histogram("123", 0, 30) is None
+    assert list(cache.histogram("123", 20, 30)) == [0] * 20 + [2] * 10
+
+
+def test_concurrent_stores_from_processes_keep_every_range(tmp_path):
+    # Without the cross-process lock one worker's counts.npy replaces the other's
+    ranges = [(i * 100, (i + 1) * 100, i + 1) for i in range(8)]
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for future in [pool.submit(store_range, str(tmp_path), *r) for r in ranges]:
+            future.result()
+
+    cache = ChatHistogramCache(str(tmp_path))
+    assert cache.coverage("123") == [(0, 800)]
+    counts = cache.load("123")
+    for start, end, value in ranges:
+        assert (counts[start:end] == value).all()
@@ -0,0 +1,116 @@
+import json
+import os
+import stat
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import chat_download
+from chat_stream import iter_comments
+
+# Stand-in for TwitchDownloaderCLI: writes two comments for every second of
+# -b..-e, both ends included, so neighbouring chunks overlap at their shared
+# second the way real chunk downloads do. Every call is appended to $STUB_LOG;
+# a chunk whose start is listed in $STUB_FAIL_ONCE fails on its first attempt,
+# and one listed in $STUB_FAIL_ALWAYS never succeeds.
+STUB = textwrap.dedent("""\
+    #!{python}
+    import json, os, sys
+    args = sys.argv[1:]
+    def opt(name):
+        return args[args.index(name) + 1]
+    def seconds(value):
+        h, m, s = (int(part) for part in value.split(":"))
+        return h * 3600 + m * 60 + s
+    start, end = seconds(opt("-b")), seconds(opt("-e"))
+    with open(os.environ["STUB_LOG"], "a") as log:
+        log.write(f"{{start}}\\n")
+    marker = f"{{os.environ['STUB_LOG']}}.failed{{start}}"
+    if str(start) in os.environ.get("STUB_FAIL_ALWAYS", "").split(","):
+        sys.exit(1)
+    if str(start) in os.environ.get("STUB_FAIL_ONCE", "").split(",") and not os.path.exists(marker):
+        open(marker, "w").close()
+        sys.exit(1)
+    comments = [
+        {{"_id": f"c{{sec}}-{{k}}", "content_offset_seconds": sec + k / 2,
+          "commenter": {{"name": "viewer"}}, "message": {{"body": "POG"}}}}
+        for sec in range(start, end + 1) for k in range(2)
+    ]
+    header = {{"FileInfo": {{"Version": {{"Major": 1}}}}, "video": {{"id": opt("--id"), "start": start, "end": end}}}}
+    with open(opt("-o"), "w") as f:
+        f.write(json.dumps(header)[:-1] + ',"comments":' + json.dumps(comments) + ',"embeddedData":null}}')
+""")
+
+
+@pytest.fixture
+def cli(tmp_path, monkeypatch):
+    path = tmp_path / "TwitchDownloaderCLI"
+    path.write_text(STUB.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    log = tmp_path / "calls.log"
+    monkeypatch.setattr(chat_download, "TWITCH_DOWNLOADER_CLI", str(path))
+    monkeypatch.setenv("STUB_LOG", str(log))
+    # Retries back off with time.sleep; don't wait in tests
+    monkeypatch.setattr(chat_download.time, "sleep", lambda seconds: None)
+    return log
+
+
+def calls(log):
+    return [int(line) for line in log.read_text().split()]
+
+
+def test_split_range():
+    assert chat_download.split_range(0, 250, 100) == [(0, 100), (100, 200), (200, 250)]
+    assert chat_download.split_range(30, 40, 100) == [(30, 40)]
+    assert chat_download.split_range(5, 5, 100) == []
+
+
+def test_chunks_are_merged_in_order_without_boundary_duplicates(cli, tmp_path):
+    output = tmp_path / "chat.json"
+    chat_download.download_chat_range("123", 0, 250, str(output), chunk_seconds=100, workers=3)
+
+    assert sorted(calls(cli)) == [0, 100, 200]
+    comments = list(iter_comments(str(output)))
+    ids = [c["_id"] for c in comments]
+    # Seconds 100 and 200 were in two chunks each but appear once
+    assert len(ids) == len(set(ids)) == 251 * 2
+    offsets = [c["content_offset_seconds"] for c in comments]
+    assert offsets == sorted(offsets)
+    with open(output, encoding="utf-8") as f:
+        merged = json.load(f)
+    assert merged["video"]["id"] == "123"
+    # Chunk files are cleaned up
+    assert sorted(os.listdir(tmp_path)) == ["TwitchDownloaderCLI", "calls.log", "chat.json"]
+
+
+def test_failing_chunk_is_retried(cli, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_FAIL_ONCE", "100")
+    output = tmp_path / "chat.json"
+    done = []
+    chat_download.download_chat_range("123", 0, 250, str(output), chunk_seconds=100,
+                                      on_chunk_done=lambda finished, total: done.append((finished, total)))
+
+    assert sorted(calls(cli)) == [0, 100, 100, 200]
+    assert len(list(iter_comments(str(output)))) == 251 * 2
+    assert sorted(done) == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_chunk_failing_every_retry_fails_the_download(cli, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_FAIL_ALWAYS", "200")
+    output = tmp_path / "chat.json"
+    with pytest.raises(subprocess.CalledProcessError):
+        chat_download.download_chat_range("123", 0, 250, str(output), chunk_seconds=100, retries=2)
+
+    assert calls(cli).count(200) == 3
+    assert not output.exists()
+    assert not [name for name in os.listdir(tmp_path) if ".part" in name]
+
+
+def test_short_range_is_a_single_download(cli, tmp_path):
+    output = tmp_path / "chat.json"
+    chat_download.download_chat_range("123", 10, 40, str(output), chunk_seconds=100)
+
+    assert calls(cli) == [10]
+    assert len(list(iter_comments(str(output)))) == 31 * 2
@@ -0,0 +1,103 @@
+import json
+
+import numpy as np
+import pytest
+
+from chat_stream import iter_comments, read_chat_signals, read_offsets
+
+TRICKY_BODIES = [
+    'he said "clip it"',
+    "backslash at the end \\",
+    '\\"escaped\\" and \\\\ doubled',
+    # Looks like the key, but inside a string it's always escaped
+    '"content_offset_seconds": 99999',
+    '{"content_offset_seconds":12345.5}',
+    "unicode ✓ and emoji 🎉",
+]
+
+
+def write_chat(path, comments, indent=None):
+    doc = {
+        "FileInfo": {"Version": {"Major": 1}},
+        "video": {"id": "1", "start": 0, "end": 100, "title": '"comments": [ not here'},
+        "comments": comments,
+        "embeddedData": None,
+    }
+    path.write_text(json.dumps(doc, indent=indent, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def make_comments(n=40):
+    return [
+        {
+            "_id": f"c{i}",
+            "content_offset_seconds": round(i * 1.37, 3) if i % 3 else i,
+            "commenter": {"_id": str(100 + i % 5)},
+            "message": {
+                "body": TRICKY_BODIES[i % len(TRICKY_BODIES)],
+                "fragments": [{"text": "LUL", "emoticon": {"emoticon_id": "1"}}] * (i % 3),
+            },
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 31, 64, 1 << 20])
+def test_offsets_survive_any_chunk_split(tmp_path, indent, chunk_size):
+    comments = make_comments()
+    path = write_chat(tmp_path / "chat.json", comments, indent)
+    expected = [float(c["content_offset_seconds"]) for c in comments]
+    assert read_offsets(path, chunk_size=chunk_size).tolist() == expected
+    assert list(iter_comments(path, chunk_size=chunk_size)) == comments
+
+
+def test_key_inside_message_text_is_not_an_offset(tmp_path):
+    comments = make_comments(len(TRICKY_BODIES))
+    path = write_chat(tmp_path / "chat.json", comments)
+    offsets = read_offsets(path, chunk_size=5)
+    assert 99999 not in offsets and 12345.5 not in offsets
+    assert len(offsets) == len(comments)
+
+
+def test_long_numbers_split_across_chunks(tmp_path):
+    comments = [{"content_offset_seconds": 123456.789012}, {"content_offset_seconds": 1.5e3}]
+    path = write_chat(tmp_path / "chat.json", comments)
+    for chunk_size in range(1, 40):
+        assert read_offsets(path, chunk_size=chunk_size).tolist() == [123456.789012, 1500.0]
+
+
+@pytest.mark.parametrize("text", [
+    '{"video": {}, "comments": [], "embeddedData": null}',
+    '{"video": {}, "comments" : [ \n ], "embeddedData": null}',
+    '{"video": {}, "embeddedData": null}',
+])
+def test_empty_comments(tmp_path, text):
+    path = tmp_path / "chat.json"
+    path.write_text(text)
+    for chunk_size in (1, 3, 1 << 20):
+        offsets = read_offsets(str(path), chunk_size=chunk_size)
+        assert offsets.dtype == np.float64 and offsets.size == 0
+        assert list(iter_comments(str(path), chunk_size=chunk_size)) == []
+    signals = read_chat_signals(str(path), commenters=True, emotes=True)
+    assert all(values.size == 0 for values in signals.values())
+
+
+def test_truncated_file_raises(tmp_path):
+    path = tmp_path / "chat.json"
+    path.write_text(json.dumps({"comments": make_comments(3)})[:-40])
+    with pytest.raises(ValueError):
+        list(iter_comments(str(path), chunk_size=16))
+
+
+def test_signals_are_parallel_arrays(tmp_path):
+    comments = make_comments(12)
+    comments[4]["commenter"] = None
+    path = write_chat(tmp_path / "chat.json", comments)
+    signals = read_chat_signals(path, commenters=True, emotes=True, chunk_size=9)
+    assert signals["offsets"].tolist() == [float(c["content_offset_seconds"]) for c in comments]
+    assert signals["commenters"].tolist() == [
+        -1 if i == 4 else 100 + i % 5 for i in range(12)
+    ]
+    assert signals["emotes"].tolist() == [i % 3 for i in range(12)]
+    assert list(read_chat_signals(path)) == ["offsets"]
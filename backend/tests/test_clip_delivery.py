@@ -0,0 +1,53 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import clip_delivery
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    import main
+
+    root = tmp_path / "clips"
+    for project in ("done", "running"):
+        os.makedirs(root / "user" / project)
+        (root / "user" / project / "clip_1.mp4").write_bytes(bytes(range(256)) * 4)
+    monkeypatch.setattr(main, "clips_dir", str(root))
+    monkeypatch.setattr(main, "project_job_active", lambda project_id: project_id == "running")
+    return TestClient(main.app)
+
+
+def test_finished_clips_are_immutable(client):
+    response = client.get("/clips/user/done/clip_1.mp4")
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == clip_delivery.CACHE_CONTROL
+    assert response.headers["content-type"] == "video/mp4"
+
+    again = client.get("/clips/user/done/clip_1.mp4", headers={"If-None-Match": response.headers["etag"]})
+    assert again.status_code == 304
+
+
+def test_clips_of_a_running_job_must_be_revalidated(client):
+    response = client.get("/clips/user/running/clip_1.mp4")
+    assert response.status_code == 200
+    assert "immutable" not in response.headers["cache-control"]
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.headers["etag"]
+
+
+def test_byte_ranges(client):
+    response = client.get("/clips/user/done/clip_1.mp4", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == bytes(range(10, 20))
+
+
+def test_paths_outside_the_clips_tree_are_not_served(client):
+    assert client.get("/clips/user/done/missing.mp4").status_code == 404
+    assert client.get("/clips/..%2F..%2Fetc%2Fpasswd").status_code == 404
+
+
+@pytest.mark.skipif("CLIP_SPRITES" in os.environ, reason="CLIP_SPRITES set in the environment")
+def test_sprites_are_opt_in():
+    assert clip_delivery.CLIP_SPRITES is False
@@ -0,0 +1,71 @@
+import os
+import threading
+
+from clip_index import ClipIndex
+
+
+def write(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"clip")
+
+
+class PausedWalkIndex(ClipIndex):
+    """ClipIndex whose walk stops after listing the disk until released."""
+
+    def __init__(self, root):
+        super().__init__(root, rescan_seconds=3600)
+        self.walked = threading.Event()
+        self.release = threading.Event()
+
+    def _walk(self):
+        found = super()._walk()
+        if self.release is not None:
+            self.walked.set()
+            self.release.wait(5)
+        return found
+
+
+def scan_in_background(index):
+    thread = threading.Thread(target=index.build)
+    thread.start()
+    assert index.walked.wait(5)
+    return thread
+
+
+def test_changes_made_during_a_scan_survive_it(tmp_path):
+    root = str(tmp_path / "clips")
+    old = os.path.join(root, "u", "p", "clip_1.mp4")
+    new = os.path.join(root, "u", "p", "clip_2.mp4")
+    write(old)
+    index = PausedWalkIndex(root)
+
+    thread = scan_in_background(index)
+    # The walk has already listed the directory: it saw clip_1 but not clip_2
+    write(new)
+    index.add(new)
+    os.remove(old)
+    index.discard(old)
+    index.release.set()
+    thread.join()
+
+    index.release = None
+    assert index.exists(new)
+    assert not index.exists(old)
+
+
+def test_removed_tree_during_a_scan_stays_removed(tmp_path):
+    root = str(tmp_path / "clips")
+    clip = os.path.join(root, "u", "p", "clip_1.mp4")
+    write(clip)
+    index = PausedWalkIndex(root)
+
+    thread = scan_in_background(index)
+    index.add(clip)
+    index.discard_tree(os.path.join(root, "u", "p"))
+    index.release.set()
+    thread.join()
+
+    index.release = None
+    assert not index.exists(clip)
+    assert len(index) == 0
@@ -0,0 +1,110 @@
+import subprocess
+import sys
+
+import pytest
+
+import clip_pipeline
+import generate_clips
+from clip_pipeline import encode_command, pipe_section
+
+FFMPEG_STUB = """#!{python}
+# ffmpeg stand-in: drains stdin into $STUB_OUT, then exits with $STUB_EXIT
+import os, sys
+data = sys.stdin.buffer.read()
+with open(os.environ["STUB_OUT"], "wb") as f:
+    f.write(data)
+sys.exit(int(os.environ.get("STUB_EXIT", "0")))
+"""
+
+
+def option(cmd, name, occurrence=0):
+    positions = [i for i, arg in enumerate(cmd) if arg == name]
+    return cmd[positions[occurrence] + 1]
+
+
+def test_encode_command_seeks_and_cuts_each_output():
+    cmd = encode_command([("a.mp4", 2.5, 32.5), ("b.mp4", 60, 75.25)], threads=3)
+    assert cmd[:4] == [clip_pipeline.FFMPEG, "-y", "-i", "pipe:0"]
+    # Output-side seek and duration, per clip, in stream seconds
+    assert [option(cmd, "-ss", i) for i in range(2)] == ["2.500", "60.000"]
+    assert [option(cmd, "-t", i) for i in range(2)] == ["30.000", "15.250"]
+    assert [option(cmd, "-threads", i) for i in range(2)] == ["3", "3"]
+    # Every option of a clip comes before its output path
+    assert cmd.index("b.mp4") == len(cmd) - 1
+    assert cmd.index("a.mp4") < cmd.index("60.000")
+    assert cmd.count("-i") == 1
+
+
+def test_encode_command_without_a_thread_budget():
+    cmd = encode_command([("a.mp4", 0, 30)])
+    assert "-threads" not in cmd
+    assert cmd[-1] == "a.mp4"
+
+
+@pytest.fixture
+def stub_ffmpeg(tmp_path, monkeypatch):
+    script = tmp_path / "ffmpeg"
+    script.write_text(FFMPEG_STUB.format(python=sys.executable))
+    script.chmod(0o755)
+    monkeypatch.setattr(clip_pipeline, "FFMPEG", str(script))
+    monkeypatch.setenv("STUB_OUT", str(tmp_path / "stdin.bin"))
+    return tmp_path / "stdin.bin"
+
+
+@pytest.fixture
+def fragments(monkeypatch):
+    # Fragment cache path: 1.5s of lead-in before the section's first keyframe
+    calls = []
+
+    def iter_range(playlist, vod_id, start, end, workers=None, job=None):
+        calls.append((vod_id, start, end))
+        return 1.5, iter([b"frag1", b"frag2"])
+
+    monkeypatch.setattr(clip_pipeline, "USE_FRAGMENT_CACHE", True)
+    monkeypatch.setattr(clip_pipeline, "vod_playlist", lambda url, job=None: "playlist")
+    monkeypatch.setattr(clip_pipeline, "iter_range", iter_range)
+    return calls
+
+
+def test_fragments_are_piped_with_clip_offsets_from_the_lead_in(stub_ffmpeg, fragments, monkeypatch):
+    commands = []
+    real_encode_command = clip_pipeline.encode_command
+    monkeypatch.setattr(clip_pipeline, "encode_command",
+                        lambda outputs, threads=None: commands.append(outputs) or real_encode_command(outputs, threads))
+    paths = pipe_section("https://www.twitch.tv/videos/1", "1", 100, 200,
+                         [("a.mp4", 100, 130), ("b.mp4", 170, 200)])
+    assert paths == ["a.mp4", "b.mp4"]
+    assert stub_ffmpeg.read_bytes() == b"frag1frag2"
+    assert commands == [[("a.mp4", 1.5, 31.5), ("b.mp4", 71.5, 101.5)]]
+
+
+def test_failed_encode_raises(stub_ffmpeg, fragments, monkeypatch):
+    monkeypatch.setenv("STUB_EXIT", "1")
+    with pytest.raises(subprocess.CalledProcessError):
+        pipe_section("https://www.twitch.tv/videos/1", "1", 100, 200, [("a.mp4", 100, 130)])
+
+
+def test_failed_pipelined_encode_falls_back_to_download_then_cut(tmp_path, monkeypatch):
+    def failing_pipe(*args, **kwargs):
+        raise subprocess.CalledProcessError(1, ["ffmpeg"])
+
+    steps = []
+
+    def download_section(twitch_url, start_sec, end_sec, output_file, job=None):
+        steps.append(("download", start_sec, end_sec))
+        open(output_file, "wb").close()
+        return 0.5
+
+    def encode_clip(input_path, output_path, start=0.0, end=None, **kwargs):
+        steps.append(("encode", start, end))
+
+    monkeypatch.setattr(generate_clips, "CLIP_PIPELINE", True)
+    monkeypatch.setattr(generate_clips, "pipe_section", failing_pipe)
+    monkeypatch.setattr(generate_clips, "download_section", download_section)
+    monkeypatch.setattr(generate_clips, "encode_clip", encode_clip)
+
+    output = generate_clips.download_clip("https://www.twitch.tv/videos/1", 100, 130, 0,
+                                          workspace=str(tmp_path), output_dir=str(tmp_path),
+                                          progress=lambda *args, **kwargs: None)
+    assert output == str(tmp_path / "clip_1.mp4")
+    assert steps == [("download", 100, 130), ("encode", 0.5, 30.5)]
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from fastapi.testclient import TestClient
+
+import twitch_client
+from helix_scheduler import BACKGROUND, INTERACTIVE, HelixRateLimiter, background, helix_priority
+from ttl_cache import TTLCache
+from twitch_client import CoalescedCache, HelixThrottled, TwitchClient
+
+
+class MockHelix:
+    """Helix stand-in with a token bucket of ``limit`` points refilled over ``window`` seconds."""
+
+    def __init__(self, limit, window=1.0, always_throttle=False):
+        self.limit = limit
+        self.window = window
+        self.always_throttle = always_throttle
+        self.tokens = float(limit)
+        self.refilled_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.seen = []
+        self.throttled = 0
+
+    def take(self):
+        """(granted, remaining, reset unix time) for one request."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.limit, self.tokens + (now - self.refilled_at) * self.limit / self.window)
+            self.refilled_at = now
+            granted = not self.always_throttle and self.tokens >= 1
+            if granted:
+                self.tokens -= 1
+            else:
+                self.throttled += 1
+            full_in = (self.limit - self.tokens) * self.window / self.limit if self.limit else 0.1
+            return granted, int(self.tokens), time.time() + full_in
+
+    def handler(self):
+        helix = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body, headers=()):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self.reply(200, {"access_token": "token", "expires_in": 3600})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                granted, remaining, reset = helix.take()
+                headers = [("Ratelimit-Limit", str(helix.limit)), ("Ratelimit-Remaining", str(remaining)),
+                           ("Ratelimit-Reset", f"{reset:.3f}")]
+                if not granted:
+                    self.reply(429, {"error": "Too Many Requests"}, headers)
+                    return
+                helix.seen.append((url.path, query))
+                if url.path.endswith("/users"):
+                    body = {"data": [{"id": "7", "login": query["login"], "display_name": query["login"],
+                                      "profile_image_url": "https://example.invalid/p.png"}]}
+                elif url.path.endswith("/channels/followers"):
+                    body = {"data": [], "total": 42}
+                else:
+                    after = int(query.get("after", 0))
+                    body = {"data": [{"id": str(after + i), "thumbnail_url": ""} for i in range(2)],
+                            "pagination": {"cursor": str(after + 2)}}
+                self.reply(200, body, headers)
+
+        return Handler
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    servers = []
+
+    def start(helix):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), helix.handler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        monkeypatch.setattr(twitch_client, "HELIX_URL", f"{base}/helix")
+        monkeypatch.setattr(twitch_client, "TOKEN_URL", f"{base}/oauth2/token")
+        return helix
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_client(limit, window=1.0):
+    client = TwitchClient(client_id="id", client_secret="secret")
+    client.limiter = HelixRateLimiter(limit=limit, window=window)
+    return client
+
+
+async def run_and_close(client, coro):
+    try:
+        return await coro
+    finally:
+        await client.aclose()
+
+
+def test_bursts_are_paced_to_the_limit(serve):
+    helix = serve(MockHelix(limit=5))
+    client = make_client(limit=5)
+
+    async def burst():
+        return await asyncio.gather(*(client.get_videos(id=str(i)) for i in range(15)))
+
+    started = time.monotonic()
+    results = asyncio.run(run_and_close(client, burst()))
+    assert len(results) == 15
+    assert helix.throttled == 0
+    # 5 right away, then 5 a second
+    assert time.monotonic() - started >= 1.5
+
+
+def test_client_adapts_to_a_lower_server_limit(serve):
+    helix = serve(MockHelix(limit=3))
+    client = make_client(limit=100)
+
+    async def burst():
+        return await asyncio.gather(*(client.get_videos(id=str(i)) for i in range(9)))
+
+    assert len(asyncio.run(run_and_close(client, burst()))) == 9
+    assert helix.throttled > 0
+    assert client.limiter.limit == 3
+    assert client.limiter.stats()["throttled_responses"] > 0
+
+
+def test_interactive_requests_are_served_before_background(serve):
+    helix = serve(MockHelix(limit=1, window=0.3))
+    client = make_client(limit=1, window=0.3)
+
+    async def mixed():
+        with background():
+            queued = [asyncio.ensure_future(client.get_videos(id=f"b{i}")) for i in range(3)]
+        await asyncio.sleep(0.05)
+        interactive = asyncio.ensure_future(client.get_videos(id="interactive"))
+        await asyncio.gather(interactive, *queued)
+
+    asyncio.run(run_and_close(client, mixed()))
+    order = [query["id"] for path, query in helix.seen if path.endswith("/videos")]
+    assert order[0] == "b0"
+    assert order[1] == "interactive"
+    classes = client.limiter.stats()["classes"]
+    assert classes["background"]["granted"] == 3 and classes["interactive"]["granted"] >= 1
+
+
+def test_throttled_after_retries_raises(serve, monkeypatch):
+    serve(MockHelix(limit=5, always_throttle=True))
+    monkeypatch.setattr(twitch_client, "HELIX_THROTTLE_RETRIES", 1)
+    client = make_client(limit=5)
+    with pytest.raises(HelixThrottled) as e:
+        asyncio.run(run_and_close(client, client.get_videos(id="1")))
+    assert e.value.response.status_code == 429
+    assert e.value.retry_after >= 0
+
+
+def test_channel_endpoint_answers_503_with_retry_after(serve, monkeypatch):
+    import main
+
+    serve(MockHelix(limit=5, always_throttle=True))
+    monkeypatch.setattr(twitch_client, "HELIX_THROTTLE_RETRIES", 1)
+    monkeypatch.setattr(main, "twitch", make_client(limit=5))
+    response = TestClient(main.app).get("/api/get-channel-vods", params={"username": "someone"})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_next_archive_page_is_prefetched_in_the_background(serve, monkeypatch):
+    import main
+
+    helix = serve(MockHelix(limit=50))
+    client = make_client(limit=50)
+    monkeypatch.setattr(main, "twitch", client)
+
+    async def load_channel():
+        result = await main._channel_vods("someone")
+        await asyncio.gather(*client._prefetches)
+        return result
+
+    result = asyncio.run(run_and_close(client, load_channel()))
+    assert result["next_cursor"] == "2"
+    pages = [query.get("after") for path, query in helix.seen if path.endswith("/videos")]
+    assert pages == [None, "2"]
+    assert client.limiter.stats()["classes"]["background"]["granted"] == 1
+    # "Load more" is now served from the cache
+    assert client.vod_pages.cache.get(("7", "2", twitch_client.VODS_PAGE_SIZE)) is not None
+
+
+def test_interactive_callers_dont_wait_on_a_background_load():
+    cache = CoalescedCache(TTLCache(10, 60, name="test"))
+    release = asyncio.Event()
+    priorities = []
+
+    async def loader():
+        priorities.append(helix_priority.get())
+        await release.wait()
+        return helix_priority.get()
+
+    async def run():
+        with background():
+            prefetch = asyncio.ensure_future(cache.get("page", loader))
+        await asyncio.sleep(0)
+        callers = [asyncio.ensure_future(cache.get("page", loader)) for _ in range(2)]
+        with background():
+            callers.append(asyncio.ensure_future(cache.get("page", loader)))
+        await asyncio.sleep(0)
+        release.set()
+        return await prefetch, await asyncio.gather(*callers)
+
+    prefetched, results = asyncio.run(run())
+    # One extra load at interactive priority, shared by every later caller
+    assert priorities == [BACKGROUND, INTERACTIVE]
+    assert prefetched == BACKGROUND and results == [INTERACTIVE] * 3
+    assert cache.coalesced == 2
+    assert cache.stats()["in_flight"] == 0
@@ -0,0 +1,145 @@
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import hls_fetcher
+from fragment_cache import FragmentCache
+from job_scheduler import Job
+from ttl_cache import TTLCache
+
+SEGMENTS = 6
+SEGMENT_SECONDS = 2.0
+
+
+def segment_bytes(sequence):
+    return f"segment-{sequence};".encode() * 100
+
+
+class HLSHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+    fail_once = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests_seen.append(self.path)
+        if self.path in self.fail_once:
+            self.fail_once.discard(self.path)
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.path == "/vod/720p30/index.m3u8":
+            lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:2", "#EXT-X-MEDIA-SEQUENCE:10"]
+            for i in range(SEGMENTS):
+                lines += [f"#EXTINF:{SEGMENT_SECONDS:.3f},", f"{10 + i}.ts"]
+            body = ("\n".join(lines + ["#EXT-X-ENDLIST"]) + "\n").encode()
+        elif self.path.startswith("/vod/720p30/") and self.path.endswith(".ts"):
+            body = segment_bytes(int(self.path.rsplit("/", 1)[1][:-3]))
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def hls_server():
+    HLSHandler.requests_seen = []
+    HLSHandler.fail_once = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), HLSHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_and_fetch_range_through_the_cache(hls_server, tmp_path):
+    playlist = hls_fetcher.load_playlist(f"{hls_server}/vod/720p30/index.m3u8", "720p30")
+    assert [s.sequence for s in playlist.segments] == list(range(10, 16))
+    assert playlist.segments[3].start == 6.0
+    assert playlist.segments[0].url == f"{hls_server}/vod/720p30/10.ts"
+
+    cache = FragmentCache(str(tmp_path / "fragments"))
+    output = tmp_path / "section.ts"
+    # 3s..7s lies in the fragments starting at 2s, 4s and 6s
+    lead_in = hls_fetcher.fetch_range(playlist, "42", 3.0, 7.0, str(output), cache=cache, workers=2)
+    assert lead_in == 1.0
+    assert output.read_bytes() == b"".join(segment_bytes(seq) for seq in (11, 12, 13))
+    assert cache.stats()["misses"] == 3
+
+    # The second fetch is served from disk
+    fetched = len(HLSHandler.requests_seen)
+    hls_fetcher.fetch_range(playlist, "42", 3.0, 7.0, str(output), cache=cache)
+    assert len(HLSHandler.requests_seen) == fetched
+    assert cache.stats()["hits"] == 3
+
+
+def test_fragment_errors_are_retried(hls_server, tmp_path):
+    playlist = hls_fetcher.load_playlist(f"{hls_server}/vod/720p30/index.m3u8", "720p30")
+    HLSHandler.fail_once = {"/vod/720p30/10.ts"}
+    cache = FragmentCache(str(tmp_path / "fragments"))
+    output = tmp_path / "section.ts"
+    hls_fetcher.fetch_range(playlist, "42", 0.0, 1.0, str(output), cache=cache)
+    assert output.read_bytes() == segment_bytes(10)
+    assert HLSHandler.requests_seen.count("/vod/720p30/10.ts") == 2
+
+
+def test_missing_playlist_raises(hls_server):
+    with pytest.raises(requests.HTTPError):
+        hls_fetcher.load_playlist(f"{hls_server}/vod/160p30/index.m3u8", "160p30")
+
+
+def test_vod_playlist_is_cached_with_a_ttl(hls_server, monkeypatch):
+    resolved = []
+
+    def resolve(twitch_url, fmt=hls_fetcher.HLS_FORMAT, job=None):
+        resolved.append(twitch_url)
+        return "720p30", f"{hls_server}/vod/720p30/index.m3u8"
+
+    monkeypatch.setattr(hls_fetcher, "resolve_playlist", resolve)
+    monkeypatch.setattr(hls_fetcher, "_playlists", TTLCache(maxsize=1, ttl=60))
+    url = "https://www.twitch.tv/videos/42"
+    assert hls_fetcher.vod_playlist(url) is hls_fetcher.vod_playlist(url)
+    assert resolved == [url]
+    # Bounded: a second VOD pushes the first one out
+    hls_fetcher.vod_playlist("https://www.twitch.tv/videos/43")
+    hls_fetcher.vod_playlist(url)
+    assert resolved == [url, "https://www.twitch.tv/videos/43", url]
+
+
+@pytest.fixture
+def stub_ytdlp(tmp_path, monkeypatch):
+    script = tmp_path / "yt-dlp"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import os, sys, time\n"
+        "time.sleep(float(os.environ.get('STUB_SLEEP', '0')))\n"
+        "print('720p30')\n"
+        "print('https://example.invalid/vod/720p30/index.m3u8')\n"
+    )
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+
+def test_resolve_playlist_through_a_job(stub_ytdlp):
+    job = Job("resolve", None, ())
+    rendition, url = hls_fetcher.resolve_playlist("https://www.twitch.tv/videos/42", job=job)
+    assert rendition == "720p30"
+    assert url.endswith("index.m3u8")
+
+
+def test_resolve_playlist_times_out(stub_ytdlp, monkeypatch):
+    monkeypatch.setenv("STUB_SLEEP", "5")
+    monkeypatch.setattr(hls_fetcher, "RESOLVE_TIMEOUT", 0.5)
+    with pytest.raises(subprocess.TimeoutExpired):
+        hls_fetcher.resolve_playlist("https://www.twitch.tv/videos/42")
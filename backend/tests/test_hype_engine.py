@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.bench_hype_engine import legacy_hybrid_peaks
+from chat_stream import read_offsets
+from generate_clips import merge_clip_windows
+from hype_engine import find_hype_peaks, message_histogram
+
+# 1300 seconds of chat with bursts spread so both the global top 5 and the
+# per-segment top 2 drop peaks, and two of them straddle segment boundaries
+CHAT_FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "chat_small.json")
+
+
+def test_fixture_chat_matches_the_loop_based_analysis():
+    offsets = read_offsets(CHAT_FIXTURE)
+    expected = legacy_hybrid_peaks(offsets)
+    got = find_hype_peaks(message_histogram(offsets))
+    assert got == expected
+    assert got == [(790, 18), (300, 15), (905, 15), (1199, 15), (600, 14), (40, 11), (1260, 11)]
+    assert merge_clip_windows(got) == merge_clip_windows(expected)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_random_histograms_match_the_loop_based_analysis(seed):
+    rng = np.random.default_rng(seed)
+    # Small, spiky histograms hit the segment edge and plateau cases most often
+    duration = int(rng.integers(1, 3000))
+    offsets = np.repeat(np.arange(duration), rng.poisson(rng.uniform(0.5, 12), size=duration))
+    if rng.random() < 0.5:
+        offsets = np.concatenate((offsets, np.repeat(rng.integers(0, duration, 20), 15)))
+    if offsets.size == 0:
+        pytest.skip("empty histogram")
+    expected = legacy_hybrid_peaks(offsets)
+    got = find_hype_peaks(message_histogram(offsets))
+    assert got == expected
+    assert merge_clip_windows(got) == merge_clip_windows(expected)
+
+
+def test_flat_peaks_are_reported_at_their_middle_second():
+    counts = [0, 0, 10, 20, 30, 30, 30, 5, 0]
+    # derivative 0 0 10 10 10 0 0 -25 -5: a three second plateau at 2..4
+    assert find_hype_peaks(counts) == legacy_hybrid_peaks(np.repeat(np.arange(len(counts)), counts))
+    assert find_hype_peaks(counts)[0] == (3, 10)
+
+
+def test_empty_and_quiet_chats_have_no_peaks():
+    assert find_hype_peaks([]) == []
+    assert find_hype_peaks(np.ones(1000, dtype=np.int64)) == []
@@ -0,0 +1,183 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import job_scheduler
+from job_scheduler import (
+    JobScheduler, JobCancelled, RUNNING, DONE, FAILED, CANCELLED, TIMED_OUT,
+)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(**kwargs):
+        kwargs.setdefault("max_workers", 1)
+        kwargs.setdefault("default_timeout", 0)
+        scheduler = JobScheduler(**kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.shutdown()
+
+
+def blocker(job, release):
+    release.wait(5)
+
+
+def until_cancelled(job):
+    while True:
+        job.check()
+        time.sleep(0.01)
+
+
+def test_jobs_run_by_priority_then_fifo(make_scheduler):
+    scheduler = make_scheduler()
+    release = threading.Event()
+    order = []
+    first = scheduler.submit("first", blocker, release)
+    wait_for(lambda: first.status == RUNNING)
+    jobs = [
+        scheduler.submit("batch-1", lambda job: order.append(job.id), priority=1),
+        scheduler.submit("clip-1", lambda job: order.append(job.id), priority=0),
+        scheduler.submit("batch-2", lambda job: order.append(job.id), priority=1),
+        scheduler.submit("clip-2", lambda job: order.append(job.id), priority=0),
+    ]
+    release.set()
+    wait_for(lambda: all(job.status == DONE for job in jobs))
+    assert order == ["clip-1", "clip-2", "batch-1", "batch-2"]
+
+
+def test_queue_position_counts_only_waiting_jobs(make_scheduler):
+    scheduler = make_scheduler()
+    release = threading.Event()
+    first = scheduler.submit("first", blocker, release)
+    wait_for(lambda: first.status == RUNNING)
+    scheduler.submit("batch", blocker, release, priority=1)
+    scheduler.submit("a", blocker, release)
+    scheduler.submit("b", blocker, release)
+    assert scheduler.queue_position("first") is None
+    assert [scheduler.queue_position(j) for j in ("a", "b", "batch")] == [1, 2, 3]
+
+    scheduler.cancel("a")
+    assert [scheduler.queue_position(j) for j in ("b", "batch")] == [1, 2]
+    assert scheduler.stats()["queued"] == 2
+    release.set()
+
+
+def test_cancelled_queued_job_never_runs(make_scheduler):
+    scheduler = make_scheduler()
+    release = threading.Event()
+    ran = []
+    first = scheduler.submit("first", blocker, release)
+    wait_for(lambda: first.status == RUNNING)
+    queued = scheduler.submit("queued", lambda job: ran.append(job.id))
+    assert scheduler.cancel("queued")
+    assert queued.status == CANCELLED
+    release.set()
+    wait_for(lambda: scheduler.get("first") is None and scheduler.get("queued") is None)
+    assert ran == []
+    # Finished jobs can't be cancelled again
+    assert not queued.cancel()
+
+
+def test_cancelled_running_job_stops(make_scheduler):
+    scheduler = make_scheduler()
+    job = scheduler.submit("running", until_cancelled)
+    wait_for(lambda: job.status == RUNNING)
+    assert scheduler.cancel("running")
+    wait_for(lambda: job.finished_at is not None)
+    assert job.status == CANCELLED
+    assert isinstance(job.error, JobCancelled)
+    assert scheduler.get("running") is None
+
+
+def test_job_cancelled_without_cancel_still_finishes(make_scheduler):
+    # e.g. a batch whose pool work raised JobCancelled on its behalf
+    def gives_up(job):
+        raise JobCancelled("stopped")
+
+    scheduler = make_scheduler()
+    job = scheduler.submit("batch", gives_up)
+    wait_for(lambda: job.finished_at is not None)
+    assert job.status == CANCELLED
+
+
+def test_timeout_stops_the_job(make_scheduler):
+    scheduler = make_scheduler()
+    job = scheduler.submit("slow", until_cancelled, timeout=0.2)
+    wait_for(lambda: job.finished_at is not None)
+    assert job.status == TIMED_OUT
+
+
+def test_failures_and_results_are_recorded(make_scheduler):
+    def fails(job):
+        raise ValueError("boom")
+
+    scheduler = make_scheduler()
+    failed = scheduler.submit("fails", fails)
+    done = scheduler.submit("done", lambda job, x: x * 2, 21)
+    wait_for(lambda: done.finished_at is not None and failed.finished_at is not None)
+    assert failed.status == FAILED and str(failed.error) == "boom"
+    assert done.status == DONE and done.result == 42
+
+
+def test_process_started_while_cancelling_is_killed(make_scheduler, monkeypatch):
+    scheduler = make_scheduler()
+    release = threading.Event()
+    job = scheduler.submit("job", blocker, release)
+    wait_for(lambda: job.status == RUNNING)
+    popen = subprocess.Popen
+
+    def cancel_during_spawn(*args, **kwargs):
+        # cancel() runs after check() passed but before the process is registered
+        proc = popen(*args, **kwargs)
+        job.cancel()
+        return proc
+
+    monkeypatch.setattr(job_scheduler.subprocess, "Popen", cancel_during_spawn)
+    with job.process([sys.executable, "-c", "import time; time.sleep(30)"]) as proc:
+        assert proc.wait(timeout=5) != 0
+    with pytest.raises(JobCancelled):
+        job.check()
+    release.set()
+
+
+def test_run_kills_its_process_on_cancel(make_scheduler):
+    scheduler = make_scheduler()
+    release = threading.Event()
+    job = scheduler.submit("job", blocker, release)
+    wait_for(lambda: job.status == RUNNING)
+    threading.Timer(0.2, job.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(JobCancelled):
+        job.run([sys.executable, "-c", "import time; time.sleep(30)"])
+    assert time.monotonic() - started < 5
+    release.set()
+
+
+def test_shutdown_returns_the_cancelled_queue(make_scheduler):
+    scheduler = make_scheduler()
+    release = threading.Event()
+    first = scheduler.submit("first", blocker, release)
+    wait_for(lambda: first.status == RUNNING)
+    queued = scheduler.submit("queued", blocker, release)
+    assert scheduler.shutdown() == [queued]
+    assert queued.status == CANCELLED
+    with pytest.raises(RuntimeError):
+        scheduler.submit("late", blocker, release)
+    release.set()
+    wait_for(lambda: first.status == DONE)
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pytest
+from scipy.signal import find_peaks
+
+from chat_stream import read_offsets
+from generate_clips import merge_clip_windows
+from hype_engine import message_histogram
+from live_detector import StreamingHypeDetector, detect_from_replay
+
+CHAT_FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "chat_small.json")
+
+
+def offline_peaks(offsets, min_height=7):
+    counts = message_histogram(offsets)
+    derivative = np.diff(counts, prepend=0)
+    peaks, _ = find_peaks(derivative, height=min_height)
+    return [(int(p), int(derivative[p])) for p in peaks]
+
+
+def stream(offsets, **kwargs):
+    detector = StreamingHypeDetector(**kwargs)
+    for offset in offsets:
+        detector.add(offset)
+    detector.flush()
+    return detector
+
+
+def test_replayed_fixture_matches_the_offline_analysis():
+    offsets = read_offsets(CHAT_FIXTURE)
+    expected = merge_clip_windows(offline_peaks(offsets))
+    assert detect_from_replay(CHAT_FIXTURE) == expected
+    assert stream(offsets).peaks == offline_peaks(offsets)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_chats_match_the_offline_analysis(seed):
+    rng = np.random.default_rng(seed)
+    duration = int(rng.integers(1, 2000))
+    offsets = np.repeat(np.arange(duration), rng.poisson(rng.uniform(0.5, 10), size=duration))
+    if rng.random() < 0.5:
+        offsets = np.sort(np.concatenate((offsets, np.repeat(rng.integers(0, duration, 15), 12))))
+    offsets = offsets + rng.uniform(0, 1, size=offsets.size).round(3)
+    offsets.sort()
+    if offsets.size == 0:
+        pytest.skip("empty chat")
+    detector = stream(offsets)
+    assert detector.peaks == offline_peaks(offsets)
+    assert detector.windows == merge_clip_windows(offline_peaks(offsets))
+
+
+def test_windows_are_emitted_once_nothing_can_merge_into_them():
+    emitted = []
+    detector = StreamingHypeDetector(on_window=lambda window, score: emitted.append((window, score)))
+    offsets = read_offsets(CHAT_FIXTURE)
+    for offset in offsets[offsets < 330]:
+        detector.add(offset)
+    # The 300s burst is still pending: a peak up to 30s after its window could extend it
+    assert [w for w, _ in emitted] == [(25, 55), (135, 165)]
+    for offset in offsets[(offsets >= 330) & (offsets < 400)]:
+        detector.add(offset)
+    assert emitted[-1] == ((285, 315), 15)
+    # Long before the offline analysis would have seen the rest of the chat
+    assert len(emitted) == 3
+
+
+def test_late_messages_are_counted_not_applied():
+    detector = StreamingHypeDetector()
+    for offset in [0.5, 1.5, 2.5]:
+        detector.add(offset)
+    detector.add(0.9)
+    assert detector.late_messages == 1
+
+
+def test_sensitivity_skips_bumps_of_a_busy_chat():
+    rng = np.random.default_rng(3)
+    offsets = np.repeat(np.arange(3000), rng.poisson(30, size=3000)).astype(np.float64)
+    plain = stream(offsets)
+    adaptive = stream(offsets, sensitivity=3)
+    assert len(plain.peaks) > len(adaptive.peaks)
+    assert set(adaptive.peaks) <= set(plain.peaks)
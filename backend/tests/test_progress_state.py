@@ -0,0 +1,53 @@
+import threading
+
+from progress_state import ProgressHub, ProjectProgress, current_progress
+
+
+class RecordingHub(ProgressHub):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def publish(self, project_id, event):
+        self.events.append(event)
+        super().publish(project_id, event)
+
+
+def test_percent_only_moves_forward():
+    hub = RecordingHub()
+    progress = ProjectProgress("p1", hub)
+    progress("Downloading chat", stage="chat", fraction=0.5)
+    progress("Chat chunk finished late", stage="chat", fraction=0.2)
+    progress("Analyzing", stage="analysis")
+    assert [e["percent"] for e in hub.events] == [15.0, 15.0, 30.0]
+    assert hub.last_event("p1")["stage"] == "analysis"
+
+
+def test_parallel_reports_publish_in_order():
+    hub = RecordingHub()
+    progress = ProjectProgress("p1", hub)
+    progress("Clipping", stage="clipping")
+    start = threading.Barrier(8)
+
+    def report(worker):
+        start.wait()
+        for i in range(200):
+            progress(f"clip {worker}", stage="clipping", fraction=(i * 8 + worker) / 1600)
+
+    threads = [threading.Thread(target=report, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    percents = [e["percent"] for e in hub.events]
+    assert percents == sorted(percents)
+    assert 40.0 < percents[-1] <= 95.0
+
+
+def test_project_progress_leaves_the_global_status_alone():
+    current_progress["message"] = "legacy"
+    hub = RecordingHub()
+    ProjectProgress("p1", hub)("Downloading chat...", stage="chat")
+    assert current_progress["message"] == "legacy"
+    assert hub.last_event("p1")["message"] == "Downloading chat..."
@@ -0,0 +1,100 @@
+import pytest
+
+import project_cache
+from project_cache import Generations
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    for cache in (project_cache.project_rows, project_cache.project_clips, project_cache.user_listings,
+                  project_cache.project_owners):
+        cache.clear()
+
+
+def test_generations_track_invalidations_after_a_token():
+    generations = Generations(maxsize=10)
+    since = generations.token()
+    assert not generations.changed_since("a", since)
+    generations.bump("a")
+    assert generations.changed_since("a", since)
+    assert not generations.changed_since("b", since)
+    assert not generations.changed_since("a", generations.token())
+
+
+def test_forgotten_keys_count_as_changed():
+    generations = Generations(maxsize=2)
+    since = generations.token()
+    generations.bump("a")
+    generations.bump("b")
+    generations.bump("c")
+    # "a" fell out; a load that started before its bump must still be skipped
+    assert generations.changed_since("a", since)
+    assert not generations.changed_since("a", generations.token())
+
+
+def test_fill_racing_an_invalidation_is_dropped():
+    row = {"id": "p1", "user_id": "u1", "status": "Processing"}
+    since = project_cache.token()
+    # The pipeline writes a new status while the query above is in flight
+    project_cache.invalidate_project("p1", "u1")
+    project_cache.remember_rows([row], since)
+    project_cache.remember_clips("p1", ["clips/u1/p1/clip_1.mp4"], since)
+    project_cache.remember_listing("u1", {(None, None): ([row], None)}, since)
+    assert project_cache.project_rows.get("p1") is None
+    assert project_cache.project_clips.get("p1") is None
+    assert project_cache.user_listings.get("u1") is None
+    # The owner is still known, so the next write of p1 reaches u1's listings
+    assert project_cache.project_owners.get("p1") == "u1"
+
+    since = project_cache.token()
+    project_cache.remember_rows([row], since)
+    project_cache.remember_clips("p1", [], since)
+    assert project_cache.project_rows.get("p1") == row
+    assert project_cache.project_clips.get("p1") == []
+
+
+class RacingQuery:
+    """Stand-in for supabase.table(...).select(...)...; runs ``during`` while "querying"."""
+
+    def __init__(self, data, during):
+        self.data = data
+        self.during = during
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        self.during()
+        return self
+
+
+class RacingSupabase:
+    def __init__(self, data, during):
+        self.data = data
+        self.during = during
+
+    def table(self, name):
+        return RacingQuery(self.data, self.during)
+
+
+def test_get_project_row_does_not_cache_a_row_invalidated_mid_query(monkeypatch):
+    import main
+
+    row = {"id": "p1", "user_id": "u1", "status": "Processing"}
+    monkeypatch.setattr(main, "supabase", RacingSupabase(row, lambda: project_cache.invalidate_project("p1")))
+    assert main.get_project_row("p1") == row
+    assert project_cache.project_rows.get("p1") is None
+
+    monkeypatch.setattr(main, "supabase", RacingSupabase(row, lambda: None))
+    main.get_project_row("p1")
+    assert project_cache.project_rows.get("p1") == row
+
+
+def test_raced_row_still_lets_later_writes_invalidate_the_listing():
+    row = {"id": "p1", "user_id": "u1", "status": "Processing"}
+    since = project_cache.token()
+    project_cache.invalidate_project("p1")
+    project_cache.remember_rows([row], since)
+    project_cache.remember_listing("u1", {(None, None): ([row], None)}, project_cache.token())
+    project_cache.invalidate_project("p1")
+    assert project_cache.user_listings.get("u1") is None
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from job_scheduler import Job, JobCancelled
+from resource_scheduler import INTERACTIVE, PIPELINE, ResourcePool, ResourceScheduler
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting"
+        time.sleep(0.01)
+
+
+def acquire_in_thread(pool, amount, order, label, **kwargs):
+    def run():
+        try:
+            pool.acquire(amount, **kwargs)
+            order.append(label)
+        except JobCancelled:
+            order.append(f"{label} cancelled")
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_budgets_are_accounted_per_pool():
+    scheduler = ResourceScheduler(cpu_threads=8, network_slots=4, encode_threads=3, download_slots=2)
+    with scheduler.cpu() as threads, scheduler.network() as slots:
+        assert (threads, slots) == (3, 2)
+        with scheduler.cpu(threads=5) as more:
+            assert more == 5
+            stats = scheduler.stats()
+            assert stats["cpu"]["in_use"] == 8 and stats["network"]["in_use"] == 2
+    stats = scheduler.stats()
+    assert stats["cpu"]["in_use"] == 0 and stats["network"]["in_use"] == 0
+    assert stats["cpu"]["grants"] == 2 and stats["cpu"]["peak_in_use"] == 8
+
+
+def test_requests_are_clamped_to_the_pool():
+    pool = ResourcePool("cpu", 4)
+    assert pool.acquire(100) == 4
+    pool.release(4)
+    assert pool.acquire(0) == 1
+
+
+def test_waiters_block_until_released_in_fifo_order():
+    pool = ResourcePool("cpu", 4)
+    pool.acquire(3)
+    order = []
+    big = acquire_in_thread(pool, 4, order, "big")
+    wait_for(lambda: pool.stats()["waiting"] == 1)
+    # Fits in what's left, but queued behind the big request, so it waits too
+    small = acquire_in_thread(pool, 1, order, "small")
+    wait_for(lambda: pool.stats()["waiting"] == 2)
+    time.sleep(0.05)
+    assert order == []
+
+    pool.release(3)
+    big.join(5)
+    assert order == ["big"]
+    pool.release(4)
+    small.join(5)
+    assert order == ["big", "small"]
+    assert pool.stats()["max_wait_seconds"] > 0
+
+
+def test_higher_priority_goes_first():
+    pool = ResourcePool("cpu", 2)
+    pool.acquire(2)
+    order = []
+    threads = [acquire_in_thread(pool, 2, order, "pipeline")]
+    wait_for(lambda: pool.stats()["waiting"] == 1)
+    threads.append(acquire_in_thread(pool, 2, order, "interactive", priority=INTERACTIVE))
+    wait_for(lambda: pool.stats()["waiting"] == 2)
+    pool.release(2)
+    wait_for(lambda: order)
+    assert order == ["interactive"]
+    pool.release(2)
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive", "pipeline"]
+
+
+def test_cancelled_job_stops_waiting_and_frees_its_place():
+    pool = ResourcePool("cpu", 2)
+    pool.acquire(2)
+    job = Job("j1", None, ())
+    order = []
+    cancelled = acquire_in_thread(pool, 2, order, "j1", job=job)
+    wait_for(lambda: pool.stats()["waiting"] == 1)
+    behind = acquire_in_thread(pool, 1, order, "behind")
+    wait_for(lambda: pool.stats()["waiting"] == 2)
+
+    job.cancel()
+    cancelled.join(5)
+    assert order == ["j1 cancelled"]
+    pool.release(1)
+    behind.join(5)
+    assert order == ["j1 cancelled", "behind"]
+    assert pool.in_use == 2
+
+
+def test_async_acquire_waits_without_a_thread_and_can_be_cancelled():
+    pool = ResourcePool("cpu", 2)
+
+    async def run():
+        pool.acquire(2)
+        waiter = asyncio.ensure_future(pool.acquire_async(2, PIPELINE))
+        second = asyncio.ensure_future(pool.acquire_async(1))
+        while pool.stats()["waiting"] < 2:
+            await asyncio.sleep(0.01)
+        # A client that went away gives up its place
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert pool.stats()["waiting"] == 1
+        # Released from another thread, as pipeline encodes do
+        threading.Thread(target=pool.release, args=(1,)).start()
+        return await asyncio.wait_for(second, 5)
+
+    assert asyncio.run(run()) == 1
+    assert pool.in_use == 2
+    assert pool.stats()["waiting"] == 0
+
+
+def test_utilization_reflects_time_held():
+    pool = ResourcePool("cpu", 2)
+    with pool.hold(2):
+        time.sleep(0.1)
+    time.sleep(0.1)
+    assert 0.2 < pool.stats()["utilization"] < 0.8
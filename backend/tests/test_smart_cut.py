@@ -0,0 +1,61 @@
+import shutil
+import subprocess
+
+import pytest
+
+import smart_cut
+
+needs_ffmpeg = pytest.mark.skipif(
+    shutil.which(smart_cut.FFMPEG) is None or shutil.which(smart_cut.FFPROBE) is None,
+    reason="ffmpeg not installed",
+)
+
+
+def test_keyframes_are_relative_to_the_file_start(monkeypatch):
+    probe = {
+        "format": {"start_time": "7201.400000"},
+        "packets": [
+            {"pts_time": "7203.400000", "flags": "K__"},
+            {"pts_time": "7201.400000", "flags": "K__"},
+            {"pts_time": "7202.000000", "flags": "___"},
+            {"pts_time": "N/A", "flags": "K__"},
+        ],
+    }
+    monkeypatch.setattr(smart_cut, "_probe_json", lambda args: probe)
+    assert smart_cut.probe_keyframes("clip.ts") == pytest.approx([0.0, 2.0])
+    # And a full GOP inside the clip range is found
+    assert smart_cut.plan_smart_cut(smart_cut.probe_keyframes("clip.ts"), 0.0, 3.0) == pytest.approx((0.0, 2.0))
+
+
+def test_keyframes_without_a_start_time(monkeypatch):
+    probe = {"packets": [{"pts_time": "0.000000", "flags": "K_"}, {"pts_time": "2.000000", "flags": "K_"}]}
+    monkeypatch.setattr(smart_cut, "_probe_json", lambda args: probe)
+    assert smart_cut.probe_keyframes("clip.mp4") == [0.0, 2.0]
+
+
+@needs_ffmpeg
+def test_smart_cut_of_ts_with_nonzero_start_time(tmp_path):
+    from benchmarks.bench_smart_cut import make_test_video
+
+    mp4, ts = str(tmp_path / "source.mp4"), str(tmp_path / "source.ts")
+    make_test_video(mp4, 10, 240, 30, 60)
+    # Continuous stream timestamps, as in the fragment cache's sections
+    subprocess.run([smart_cut.FFMPEG, "-v", "error", "-y", "-i", mp4, "-c", "copy",
+                    "-output_ts_offset", "3600", "-f", "mpegts", ts], check=True)
+    assert float(smart_cut._probe_json(["-show_entries", "format=start_time", ts])["format"]["start_time"]) > 3600
+
+    keyframes = smart_cut.probe_keyframes(ts)
+    assert keyframes[0] == pytest.approx(0.0, abs=0.1)
+    assert smart_cut.plan_smart_cut(keyframes, 1.0, 7.0) is not None
+
+    commands = []
+
+    def run(cmd):
+        commands.append(cmd)
+        return subprocess.run(cmd[:1] + ["-v", "error"] + cmd[1:], check=True)
+
+    output = str(tmp_path / "clip.mp4")
+    smart_cut.smart_cut(ts, output, 1.0, 7.0, run=run)
+    # The middle was stream-copied rather than falling back to a full re-encode
+    assert any("copy" in cmd and "h264_mp4toannexb" in cmd for cmd in commands)
+    assert smart_cut.probe_video(output)["duration"] == pytest.approx(6.0, abs=0.2)
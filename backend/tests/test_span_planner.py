@@ -0,0 +1,68 @@
+import pytest
+
+from span_planner import DownloadSpan, gap_cost_seconds, plan_download_spans, plan_summary
+
+# 8000 kbps over 100 Mbps: a second of gap costs 0.08s of transfer, so with a
+# 4s request overhead gaps shorter than 50s are worth downloading
+COST = {"request_overhead": 4, "bitrate_kbps": 8000, "bandwidth_mbps": 100}
+
+
+def test_gap_cost_is_transfer_time():
+    assert gap_cost_seconds(50, 8000, 100) == pytest.approx(4.0)
+    assert gap_cost_seconds(0, 8000, 100) == 0
+
+
+@pytest.mark.parametrize("gap, joined", [(0, True), (49, True), (50, False), (200, False)])
+def test_windows_join_while_the_gap_is_cheaper_than_a_request(gap, joined):
+    spans = plan_download_spans([(100, 130), (130 + gap, 160 + gap)], max_span=600, **COST)
+    if joined:
+        assert [(s.start, s.end) for s in spans] == [(100, 160 + gap)]
+    else:
+        assert [(s.start, s.end) for s in spans] == [(100, 130), (130 + gap, 160 + gap)]
+
+
+def test_spans_stop_at_the_maximum_length():
+    windows = [(0, 30), (40, 70), (80, 100), (101, 130)]
+    spans = plan_download_spans(windows, max_span=100, **COST)
+    # (0, 100) is exactly 100s long; adding the next window would exceed it
+    assert [(s.start, s.end) for s in spans] == [(0, 100), (101, 130)]
+    assert all(s.length <= 100 for s in spans)
+
+
+def test_window_longer_than_the_maximum_gets_its_own_span():
+    spans = plan_download_spans([(0, 30), (35, 900)], max_span=600, **COST)
+    assert [(s.start, s.end) for s in spans] == [(0, 30), (35, 900)]
+
+
+def test_windows_keep_their_index_and_are_taken_in_time_order():
+    windows = [(500, 530), (0, 30), (20, 50), (40, 40), (1000, 1030)]
+    spans = plan_download_spans(windows, max_span=600, **COST)
+    assert [s.windows for s in spans] == [
+        [(1, 0, 30), (2, 20, 50)],
+        [(0, 500, 530)],
+        [(4, 1000, 1030)],
+    ]
+    # (40, 40) is empty and skipped
+    assert sum(len(s.windows) for s in spans) == 4
+
+
+def test_clip_range_maps_vod_time_into_the_span_download():
+    span = DownloadSpan(600, 700, [(0, 600, 630), (1, 660, 700)])
+    assert span.clip_range(600, 630) == (0, 30)
+    assert span.clip_range(660, 700) == (60, 100)
+    # The download began 2.5s early, on the keyframe before the span
+    assert span.clip_range(660, 700, lead_in=2.5) == (62.5, 102.5)
+
+
+def test_summary_counts_requests_and_unrequested_bytes():
+    spans = plan_download_spans([(0, 30), (20, 50), (70, 100), (1000, 1030)], max_span=600, **COST)
+    summary = plan_summary(spans, bitrate_kbps=8000)
+    assert summary["windows"] == 4
+    assert summary["requests"] == 2 and summary["requests_saved"] == 2
+    # Only the 20s gap between 50 and 70 was fetched without being asked for
+    assert summary["wasted_bytes"] == 20 * 8000 * 125
+
+
+def test_no_windows_no_spans():
+    assert plan_download_spans([], **COST) == []
+    assert plan_summary([])["requests"] == 0
@@ -0,0 +1,50 @@
+import os
+import time
+
+from storage_janitor import StorageJanitor
+
+
+def write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def test_build_counts_project_directories_only(tmp_path):
+    root = str(tmp_path / "clips")
+    write(os.path.join(root, "user", "project", "clip_1.mp4"), 100)
+    write(os.path.join(root, "user", "project", "clip_1.assets", "sprite.jpg"), 10)
+    # clips/<uuid>/clip_N.mp4 from runs without a project sits at project depth
+    loose = write(os.path.join(root, "0123abcd", "clip_1.mp4"), 1000)
+
+    janitor = StorageJanitor(root, ttl_days=0, quota_bytes=0)
+    janitor.build()
+    stats = janitor.stats()
+    assert stats["projects"] == 1
+    assert stats["total_bytes"] == 110
+    assert janitor.usage("user") == 110
+    assert janitor.usage("0123abcd") == 0
+
+    # Writes of loose files aren't projects either
+    janitor.record(write(os.path.join(root, "0123abcd", "clip_2.mp4"), 1000))
+    assert janitor.stats()["projects"] == 1
+    assert os.path.exists(loose)
+
+
+def test_quota_sweep_leaves_loose_files_alone(tmp_path):
+    root = str(tmp_path / "clips")
+    old = write(os.path.join(root, "user", "old", "clip_1.mp4"), 600)
+    write(os.path.join(root, "user", "new", "clip_1.mp4"), 600)
+    loose = write(os.path.join(root, "0123abcd", "clip_1.mp4"), 5000)
+    past = time.time() - 3600
+    os.utime(os.path.dirname(old), (past, past))
+
+    janitor = StorageJanitor(root, ttl_days=0, quota_bytes=1000)
+    janitor.build()
+    assert janitor.sweep() == 1
+    janitor.close()
+    assert not os.path.exists(os.path.dirname(old))
+    assert os.path.exists(os.path.join(root, "user", "new"))
+    assert os.path.exists(loose)
+    assert janitor.stats()["delete_errors"] == 0
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+import trim_cache
+from resource_scheduler import ResourceScheduler
+from trim_cache import TrimCache, start_trim
+
+FFMPEG_STUB = """#!{python}
+# ffmpeg stand-in: logs its arguments, then writes MP4-ish bytes to stdout (or fails)
+import os, sys
+with open(os.environ["STUB_LOG"], "a") as log:
+    log.write(" ".join(sys.argv[1:]) + "\\n")
+if os.environ.get("STUB_FAIL"):
+    sys.exit(1)
+for i in range(4):
+    sys.stdout.buffer.write(bytes([i]) * 100000)
+"""
+
+
+@pytest.fixture
+def stub_ffmpeg(tmp_path, monkeypatch):
+    script = tmp_path / "ffmpeg"
+    script.write_text(FFMPEG_STUB.format(python=sys.executable))
+    script.chmod(0o755)
+    monkeypatch.setattr(trim_cache, "FFMPEG", str(script))
+    monkeypatch.setenv("STUB_LOG", str(tmp_path / "ffmpeg.log"))
+    return tmp_path / "ffmpeg.log"
+
+
+@pytest.fixture
+def clip(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"source")
+    return str(path)
+
+
+async def consume(body):
+    return b"".join([chunk async for chunk in body])
+
+
+def test_trim_holds_encoder_threads_and_commits(stub_ffmpeg, clip, tmp_path):
+    cache = TrimCache(str(tmp_path / "trims"))
+    scheduler = ResourceScheduler(cpu_threads=8, encode_threads=3)
+    key = cache.key(clip, "00:00:01", "00:00:05")
+
+    async def run():
+        body = await start_trim(clip, "00:00:01", "00:00:05", key, cache, scheduler)
+        assert scheduler.cpu_pool.in_use == 3
+        return await consume(body)
+
+    data = asyncio.run(run())
+    assert len(data) == 400000
+    assert scheduler.cpu_pool.in_use == 0
+    assert "-threads 3" in stub_ffmpeg.read_text()
+    with open(cache.get(key), "rb") as f:
+        assert f.read() == data
+
+
+def test_failed_trim_releases_threads(stub_ffmpeg, clip, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_FAIL", "1")
+    cache = TrimCache(str(tmp_path / "trims"))
+    scheduler = ResourceScheduler(cpu_threads=8, encode_threads=3)
+    key = cache.key(clip, "00:00:01", "00:00:05")
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(start_trim(clip, "00:00:01", "00:00:05", key, cache, scheduler))
+    assert scheduler.cpu_pool.in_use == 0
+    assert cache.get(key) is None
+
+
+def test_abandoned_stream_keeps_nothing(stub_ffmpeg, clip, tmp_path):
+    cache = TrimCache(str(tmp_path / "trims"))
+    scheduler = ResourceScheduler(cpu_threads=8, encode_threads=3)
+    key = cache.key(clip, "00:00:01", "00:00:05")
+
+    async def run():
+        body = await start_trim(clip, "00:00:01", "00:00:05", key, cache, scheduler)
+        chunks = body.__aiter__()
+        await chunks.__anext__()
+        await chunks.aclose()
+
+    asyncio.run(run())
+    assert scheduler.cpu_pool.in_use == 0
+    assert cache.get(key) is None
+    assert not [name for name in os.listdir(cache.cache_dir) if name.endswith(".part")]
+
+
+def test_unread_stream_is_released_by_close(stub_ffmpeg, clip, tmp_path):
+    # A client that disconnects before the body is iterated: only the response's background task runs
+    cache = TrimCache(str(tmp_path / "trims"))
+    scheduler = ResourceScheduler(cpu_threads=8, encode_threads=3)
+    key = cache.key(clip, "00:00:01", "00:00:05")
+
+    async def run():
+        body = await start_trim(clip, "00:00:01", "00:00:05", key, cache, scheduler)
+        await body.close()
+        await body.close()
+        return body._proc.returncode
+
+    assert asyncio.run(run()) is not None
+    assert scheduler.cpu_pool.in_use == 0
+    assert cache.get(key) is None
+
+
+def test_trim_waits_on_the_event_loop_ahead_of_pipeline_encodes(stub_ffmpeg, clip, tmp_path):
+    cache = TrimCache(str(tmp_path / "trims"))
+    scheduler = ResourceScheduler(cpu_threads=3, encode_threads=3)
+    key = cache.key(clip, "00:00:01", "00:00:05")
+    order = []
+
+    async def run():
+        scheduler.cpu_pool.acquire(3)
+        # A pipeline encode queued first, blocking a thread
+        encode = asyncio.get_running_loop().run_in_executor(
+            None, lambda: (scheduler.cpu_pool.acquire(3), order.append("encode")))
+        while scheduler.cpu_pool.stats()["waiting"] < 1:
+            await asyncio.sleep(0.01)
+        trim = asyncio.ensure_future(start_trim(clip, "00:00:01", "00:00:05", key, cache, scheduler))
+        while scheduler.cpu_pool.stats()["waiting"] < 2:
+            await asyncio.sleep(0.01)
+        scheduler.cpu_pool.release(3)
+        body = await trim
+        order.append("trim")
+        await consume(body)
+        await encode
+        scheduler.cpu_pool.release(3)
+
+    asyncio.run(run())
+    assert order == ["trim", "encode"]
+    assert scheduler.cpu_pool.in_use == 0
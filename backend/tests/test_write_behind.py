@@ -0,0 +1,199 @@
+import time
+
+import pytest
+
+import write_behind
+from write_behind import WriteBehind
+
+
+class FakeQuery:
+    def __init__(self, client, table, op, payload):
+        self.client = client
+        self.request = {"table": table, "op": op, "payload": payload}
+
+    def eq(self, column, value):
+        self.request["where"] = (column, value)
+        return self
+
+    def execute(self):
+        return self.client.execute(self.request)
+
+
+class FakeTable:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def insert(self, rows):
+        return FakeQuery(self.client, self.name, "insert", rows)
+
+    def update(self, values):
+        return FakeQuery(self.client, self.name, "update", values)
+
+
+class FakeSupabase:
+    """Records the requests that went through; the next ``failures`` requests raise,
+    and so does every request ``reject(request)`` is true for."""
+
+    def __init__(self, failures=0, reject=None):
+        self.failures = failures
+        self.reject = reject
+        self.requests = []
+        self.attempts = 0
+
+    def table(self, name):
+        return FakeTable(self, name)
+
+    def execute(self, request):
+        self.attempts += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("supabase unavailable")
+        if self.reject and self.reject(request):
+            raise ValueError("rejected")
+        self.requests.append(request)
+
+
+@pytest.fixture
+def make_buffer():
+    buffers = []
+
+    def make(client, **kwargs):
+        kwargs.setdefault("interval", 60)
+        buffer = WriteBehind(client, **kwargs)
+        buffers.append(buffer)
+        return buffer
+
+    yield make
+    for buffer in buffers:
+        buffer.close()
+
+
+def test_inserts_are_bulk_and_updates_are_merged(make_buffer):
+    client = FakeSupabase()
+    written = []
+    buffer = make_buffer(client, on_write=lambda table, rows=None, where=None: written.append((table, where)))
+    for i in range(5):
+        buffer.insert("project_clips", {"project_id": "p1", "clip_index": i + 1})
+    buffer.update("user_projects", {"status": "Processing"}, "p1")
+    buffer.update("user_projects", {"status": "Expires in 7 days", "vod_title": "t"}, "p1")
+
+    assert buffer.flush()
+    assert client.requests == [
+        {"table": "project_clips", "op": "insert",
+         "payload": [{"project_id": "p1", "clip_index": i + 1} for i in range(5)]},
+        {"table": "user_projects", "op": "update", "where": ("id", "p1"),
+         "payload": {"status": "Expires in 7 days", "vod_title": "t"}},
+    ]
+    assert written == [("project_clips", None), ("user_projects", ("id", "p1"))]
+    stats = buffer.stats()
+    assert stats["insert_requests"] == 1 and stats["updates_sent"] == 1 and stats["updates_queued"] == 2
+
+
+def test_large_inserts_are_split_into_batches(make_buffer):
+    client = FakeSupabase()
+    buffer = make_buffer(client, batch_size=3)
+    buffer.insert("project_clips", [{"clip_index": i} for i in range(7)])
+    buffer.flush()
+    assert [len(r["payload"]) for r in client.requests] == [3, 3, 1]
+
+
+def test_updates_wait_for_failed_inserts(make_buffer):
+    client = FakeSupabase(failures=1)
+    buffer = make_buffer(client)
+    buffer.insert("project_clips", {"clip_index": 1})
+    buffer.update("user_projects", {"status": "Expires in 7 days"}, "p1")
+
+    assert not buffer.flush()
+    # The status never shows up before the clips it announces
+    assert client.requests == []
+
+    buffer.insert("project_clips", {"clip_index": 2})
+    buffer.update("user_projects", {"vod_title": "t"}, "p1")
+    assert buffer.flush()
+    assert [r["op"] for r in client.requests] == ["insert", "update"]
+    assert client.requests[0]["payload"] == [{"clip_index": 1}, {"clip_index": 2}]
+    assert client.requests[1]["payload"] == {"status": "Expires in 7 days", "vod_title": "t"}
+
+
+def test_failed_writes_are_retried_then_dropped(make_buffer):
+    client = FakeSupabase(failures=100)
+    buffer = make_buffer(client, retries=2)
+    buffer.insert("project_clips", {"clip_index": 1})
+    assert not buffer.flush()
+    assert not buffer.flush()
+    assert buffer.stats()["dropped"] == 1
+    assert buffer.stats()["pending_rows"] == 0
+    client.failures = 0
+    assert buffer.flush()
+    assert client.requests == []
+
+
+def test_flush_retrying_recovers_from_a_blip(make_buffer, monkeypatch):
+    client = FakeSupabase(failures=2)
+    buffer = make_buffer(client)
+    sleeps, checks = [], []
+    monkeypatch.setattr(write_behind.time, "sleep", sleeps.append)
+    buffer.update("user_projects", {"status": "Expires in 7 days"}, "p1")
+    assert buffer.flush_retrying(check=lambda: checks.append(1))
+    assert len(checks) == 2 and sleeps == [60, 60]
+    assert client.requests[0]["payload"] == {"status": "Expires in 7 days"}
+
+
+def test_flush_retrying_reports_dropped_writes(make_buffer, monkeypatch):
+    client = FakeSupabase(failures=100)
+    buffer = make_buffer(client, retries=2)
+    monkeypatch.setattr(write_behind.time, "sleep", lambda seconds: None)
+    buffer.update("user_projects", {"status": "Expires in 7 days"}, "p1")
+    assert not buffer.flush_retrying(attempts=5)
+    assert client.attempts == 2
+    assert buffer.stats()["dropped"] == 1
+
+
+def test_one_projects_failures_dont_fail_another(make_buffer, monkeypatch):
+    # p2's rows are rejected every time; p1's job must still see its own writes succeed
+    client = FakeSupabase(reject=lambda r: r["op"] == "insert" and r["payload"][0]["project_id"] == "p2")
+    buffer = make_buffer(client, retries=2)
+    monkeypatch.setattr(write_behind.time, "sleep", lambda seconds: None)
+    buffer.insert("project_clips", {"project_id": "p2", "clip_index": 1}, owner="p2")
+    buffer.update("user_projects", {"status": "Expires in 7 days"}, "p2", owner="p2")
+    buffer.insert("project_clips", {"project_id": "p1", "clip_index": 1}, owner="p1")
+    buffer.update("user_projects", {"status": "Expires in 7 days"}, "p1", owner="p1")
+
+    assert buffer.flush_retrying(owner="p1")
+    assert [(r["op"], r.get("where")) for r in client.requests] == [("insert", None), ("update", ("id", "p1"))]
+    # p2's status is still held back behind its failing clips
+    assert buffer.stats()["pending_updates"] == 1
+    assert not buffer.flush_retrying(owner="p2")
+
+
+def test_drops_in_a_background_flush_are_reported_to_their_owner(make_buffer):
+    client = FakeSupabase(failures=1)
+    buffer = make_buffer(client, retries=1)
+    buffer.insert("project_clips", {"project_id": "p1", "clip_index": 1}, owner="p1")
+    # A flush that isn't the job's own drops the rows
+    assert not buffer.flush()
+    assert buffer.stats()["pending_rows"] == 0
+    assert not buffer.flush_retrying(owner="p1")
+    # Reported once
+    assert buffer.flush("p1")
+
+
+def test_close_flushes_what_is_queued(make_buffer):
+    client = FakeSupabase()
+    buffer = make_buffer(client)
+    buffer.insert("project_clips", {"clip_index": 1})
+    buffer.update("user_projects", {"status": "Cancelled"}, "p1")
+    buffer.close()
+    assert [r["op"] for r in client.requests] == ["insert", "update"]
+
+
+def test_background_thread_flushes_on_its_own(make_buffer):
+    client = FakeSupabase()
+    buffer = make_buffer(client, interval=0.01)
+    buffer.insert("project_clips", {"clip_index": 1})
+    for _ in range(500):
+        if client.requests:
+            break
+        time.sleep(0.01)
+    assert client.requests[0]["payload"] == [{"clip_index": 1}]
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import os
+import threading
+from subprocess import CalledProcessError
+
+from fastapi.concurrency import run_in_threadpool
+
+from resource_scheduler import resources, INTERACTIVE
+from smart_cut import FFMPEG
+
+# Results of POST /download_clip, keyed by what determines their bytes:
+#
+#   trim_cache/<sha256(source path, mtime, size, start, end, profile)>.mp4
+#
+# A re-export of the same range of an unchanged clip is served from disk, and
+# editing or regenerating the source clip changes its key. The file mtime is
+# the last access time used for LRU eviction.
+
+TRIM_CACHE_DIR = os.getenv("TRIM_CACHE_DIR", "trim_cache")
+TRIM_CACHE_MAX_BYTES = int(os.getenv("TRIM_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+TRIM_CHUNK_SIZE = 64 * 1024
+
+# Encoder settings of a trim; part of the cache key, so changing them here
+# never serves stale results
+TRIM_PROFILE = [
+    "-c:v", "libx264",
+    "-preset", "ultrafast",
+    "-c:a", "aac",
+    "-b:a", "128k",
+]
+# Fragmented MP4 can be written to a pipe and played while it downloads
+FRAGMENTED_MP4 = ["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"]
+
+
+class TrimCache:
+    def __init__(self, cache_dir=TRIM_CACHE_DIR, max_bytes=TRIM_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, source_path, start, end, profile=TRIM_PROFILE):
+        st = os.stat(source_path)
+        raw = "|".join([os.path.realpath(source_path), str(st.st_mtime_ns), str(st.st_size),
+                        str(start), str(end), " ".join(profile)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp4")
+
+    def get(self, key):
+        """Path of the cached result, or None on a miss."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+        with self._lock:
+            self.counters["hits"] += 1
+        return path
+
+    def temp_path(self, key):
+        # Unique per writer, so concurrent trims of the same range don't collide
+        return os.path.join(self.cache_dir, f"{key}.{os.getpid()}.{os.urandom(4).hex()}.part")
+
+    def commit(self, temp_path, key):
+        os.replace(temp_path, self.path(key))
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Drop least recently used results until the cache fits in ``max_bytes``."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".mp4"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((name, st.st_size, st.st_mtime))
+            total = sum(size for _, size, _ in entries)
+            for name, size, _ in sorted(entries, key=lambda e: e[2]):
+                if total <= self.max_bytes:
+                    break
+                if name == f"{keep}.mp4":
+                    continue
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+            return total
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else None
+        counters["bytes"] = sum(
+            os.path.getsize(os.path.join(self.cache_dir, name))
+            for name in os.listdir(self.cache_dir) if name.endswith(".mp4")
+        )
+        counters["max_bytes"] = self.max_bytes
+        return counters
+
+
+trim_cache = TrimCache()
+
+
+def trim_command(input_path, start, end, profile=TRIM_PROFILE, threads=None):
+    # Seeking before -i with a re-encode is frame accurate, so one pass is enough
+    cmd = [FFMPEG, "-y", "-ss", start, "-to", end, "-i", input_path, *profile]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    return cmd + [*FRAGMENTED_MP4, "pipe:1"]
+
+
+class TrimStream:
+    """MP4 bytes of a running trim encode, written to the cache as they're read.
+
+    Holds encoder threads and an ffmpeg process until ``close()``, which the
+    stream calls itself when it ends and which the response also runs as a
+    background task, so a client that disconnects before the body is ever
+    iterated doesn't leak either. ``close()`` is idempotent.
+    """
+
+    def __init__(self, proc, first, threads, key, cache, scheduler):
+        self._proc = proc
+        self._first = first
+        self._threads = threads
+        self._key = key
+        self._cache = cache
+        self._scheduler = scheduler
+        self._temp_path = cache.temp_path(key)
+        self._complete = False
+        self._closed = False
+
+    async def __aiter__(self):
+        try:
+            with open(self._temp_path, "wb") as out:
+                chunk = self._first
+                while chunk:
+                    out.write(chunk)
+                    yield chunk
+                    chunk = await self._proc.stdout.read(TRIM_CHUNK_SIZE)
+            self._complete = await self._proc.wait() == 0
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        # Client went away or ffmpeg failed: stop encoding, keep nothing
+        try:
+            if self._proc.returncode is None:
+                self._proc.kill()
+                await self._proc.wait()
+        finally:
+            self._scheduler.cpu_pool.release(self._threads)
+        # Renaming and the eviction scan touch the disk; keep them off the event loop
+        if self._complete:
+            await run_in_threadpool(self._cache.commit, self._temp_path, self._key)
+        elif os.path.exists(self._temp_path):
+            await run_in_threadpool(os.remove, self._temp_path)
+
+    def __del__(self):
+        # Last resort for a response that was dropped without running close()
+        if self._closed:
+            return
+        self._closed = True
+        if self._proc.returncode is None:
+            try:
+                self._proc.kill()
+            except ProcessLookupError:
+                pass
+        self._scheduler.cpu_pool.release(self._threads)
+
+
+async def start_trim(input_path, start, end, key, cache=trim_cache, scheduler=resources):
+    """Start encoding [start, end) of ``input_path``; returns a ``TrimStream``.
+
+    The encode holds encoder threads from the shared CPU budget, waiting for
+    them on the event loop ahead of pipeline encodes. The first chunk is read
+    before returning, so an ffmpeg failure surfaces here as
+    CalledProcessError instead of as a truncated response. The bytes are
+    also written to the cache and committed once ffmpeg succeeds.
+    """
+    threads = await scheduler.cpu_pool.acquire_async(scheduler.encode_threads, INTERACTIVE)
+    proc = None
+    try:
+        cmd = trim_command(input_path, start, end, threads=threads)
+        proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                    stderr=asyncio.subprocess.DEVNULL)
+        first = await proc.stdout.read(TRIM_CHUNK_SIZE)
+        if not first:
+            returncode = await proc.wait()
+            raise CalledProcessError(returncode, cmd)
+    except BaseException:
+        try:
+            if proc is not None and proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+        finally:
+            scheduler.cpu_pool.release(threads)
+        raise
+    return TrimStream(proc, first, threads, key, cache, scheduler)
@@ -0,0 +1,277 @@
+import asyncio
+import os
+import time
+
+import httpx
+
+from helix_scheduler import HELIX_THROTTLE_RETRIES, HelixRateLimiter, background, helix_priority
+from ttl_cache import TTLCache
+
+# Shared Twitch Helix client: one pooled HTTP/1.1 keep-alive connection set
+# for the whole server, async so fan-out calls run concurrently on the event
+# loop, with timeouts and retries in one place.
+TWITCH_CLIENT_ID = os.getenv("TWITCH_CLIENT_ID", "j6hsb1u060lxdhbyz8n5lmwgl2rxq0")
+TWITCH_CLIENT_SECRET = os.getenv("TWITCH_CLIENT_SECRET", "7du2zywv9ioy5fsah9r6vm29loy5yy")
+TWITCH_HTTP_TIMEOUT = float(os.getenv("TWITCH_HTTP_TIMEOUT", "10"))
+TWITCH_HTTP_RETRIES = int(os.getenv("TWITCH_HTTP_RETRIES", "2"))
+TWITCH_MAX_CONNECTIONS = int(os.getenv("TWITCH_MAX_CONNECTIONS", "20"))
+
+HELIX_URL = "https://api.twitch.tv/helix"
+TOKEN_URL = "https://id.twitch.tv/oauth2/token"
+# Refresh the app token this long before Twitch says it expires
+TOKEN_REFRESH_MARGIN = 60
+RETRY_STATUSES = {500, 502, 503, 504}
+
+# How long lookups are reused across searches, in seconds
+TWITCH_USER_TTL = float(os.getenv("TWITCH_USER_TTL", "3600"))
+TWITCH_FOLLOWERS_TTL = float(os.getenv("TWITCH_FOLLOWERS_TTL", "300"))
+TWITCH_VODS_TTL = float(os.getenv("TWITCH_VODS_TTL", "120"))
+TWITCH_CACHE_SIZE = int(os.getenv("TWITCH_CACHE_SIZE", "5000"))
+VODS_PAGE_SIZE = 20
+
+_MISSING = object()
+
+
+class CoalescedCache:
+    """TTL cache in front of an async loader.
+
+    Concurrent misses for the same key share one in-flight call instead of
+    each going upstream. Failed loads aren't cached. An interactive caller
+    never waits on a background-priority load (a prefetch still queued
+    behind the rate limiter's interactive requests); it starts its own,
+    which later callers then share.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._inflight = {}   # key -> (task, Helix priority it runs at)
+        self.coalesced = 0
+
+    async def get(self, key, loader):
+        value = self.cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        priority = helix_priority.get()
+        task, task_priority = self._inflight.get(key, (None, None))
+        if task is None or priority < task_priority:
+            # Runs in this caller's context, so at this caller's priority
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = (task, priority)
+
+            def done(t, key=key):
+                if self._inflight.get(key, (None,))[0] is t:
+                    self._inflight.pop(key)
+                if not t.cancelled() and t.exception() is None:
+                    self.cache.set(key, t.result())
+
+            task.add_done_callback(done)
+        else:
+            self.coalesced += 1
+        # shield: one caller giving up mustn't cancel the call the others wait on
+        return await asyncio.shield(task)
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats["coalesced"] = self.coalesced
+        stats["in_flight"] = len(self._inflight)
+        return stats
+
+
+class HelixThrottled(httpx.HTTPStatusError):
+    """Helix still answered 429 after HELIX_THROTTLE_RETRIES retries.
+
+    ``retry_after`` is how many seconds until the bucket should have room again.
+    """
+
+    def __init__(self, response, retry_after):
+        super().__init__(f"Helix rate limit reached, retry in {retry_after:.0f}s",
+                         request=response.request, response=response)
+        self.retry_after = retry_after
+
+
+class TwitchClient:
+    def __init__(self, client_id=TWITCH_CLIENT_ID, client_secret=TWITCH_CLIENT_SECRET,
+                 timeout=TWITCH_HTTP_TIMEOUT, retries=TWITCH_HTTP_RETRIES,
+                 max_connections=TWITCH_MAX_CONNECTIONS, transport=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = timeout
+        self.retries = retries
+        self.max_connections = max_connections
+        self.transport = transport
+        self._http = None
+        self._token = None
+        self._token_expiry = 0.0
+        self._token_lock = asyncio.Lock()
+        self.counters = {"requests": 0, "retries": 0, "token_refreshes": 0, "prefetches": 0}
+        self._prefetches = set()
+        self.limiter = HelixRateLimiter()
+        self.users = CoalescedCache(TTLCache(TWITCH_CACHE_SIZE, TWITCH_USER_TTL, name="users"))
+        self.followers = CoalescedCache(TTLCache(TWITCH_CACHE_SIZE, TWITCH_FOLLOWERS_TTL, name="followers"))
+        self.vod_pages = CoalescedCache(TTLCache(TWITCH_CACHE_SIZE, TWITCH_VODS_TTL, name="vod_pages"))
+
+    @property
+    def http(self):
+        # Created on first use so it belongs to the server's event loop
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                transport=self.transport,
+            )
+        return self._http
+
+    async def aclose(self):
+        for task in list(self._prefetches):
+            task.cancel()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _send(self, method, url, before=None, **kwargs):
+        for attempt in range(self.retries + 1):
+            if before is not None:
+                await before()
+            self.counters["requests"] += 1
+            try:
+                resp = await self.http.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return resp
+            self.counters["retries"] += 1
+            await asyncio.sleep(0.25 * 2 ** attempt)
+
+    def _token_valid(self, rejected=None):
+        return self._token and self._token != rejected and time.time() < self._token_expiry
+
+    async def app_token(self, rejected=None):
+        """App access token, refreshed at most once at a time however many requests need it.
+
+        ``rejected`` is a token Twitch just refused; it is replaced even if
+        it hasn't reached its expiry yet.
+        """
+        if self._token_valid(rejected):
+            return self._token
+        async with self._token_lock:
+            # Whoever held the lock before us may have refreshed it already
+            if self._token_valid(rejected):
+                return self._token
+            resp = await self._send("POST", TOKEN_URL, params={
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "grant_type": "client_credentials",
+            })
+            resp.raise_for_status()
+            data = resp.json()
+            if "access_token" not in data:
+                raise RuntimeError("Failed to get Twitch access token")
+            self.counters["token_refreshes"] += 1
+            self._token = data["access_token"]
+            self._token_expiry = time.time() + data["expires_in"] - TOKEN_REFRESH_MARGIN
+            return self._token
+
+    async def helix(self, path, params=None, priority=None):
+        """GET a Helix endpoint and return its JSON body.
+
+        Every attempt waits for rate-limit budget first, at ``priority``
+        (default: the caller's context, see helix_scheduler.background). A 429
+        puts the request back in the queue until the bucket resets.
+        """
+        priority = helix_priority.get() if priority is None else priority
+        token = await self.app_token()
+        refreshed = False
+        throttled = 0
+        while True:
+            resp = await self._send("GET", f"{HELIX_URL}/{path}", params=params, headers={
+                "Client-ID": self.client_id,
+                "Authorization": f"Bearer {token}",
+            }, before=lambda: self.limiter.acquire(priority))
+            await self.limiter.update(resp.headers, throttled=resp.status_code == 429)
+            if resp.status_code == 429 and throttled < HELIX_THROTTLE_RETRIES:
+                throttled += 1
+                continue
+            if resp.status_code == 401 and not refreshed:
+                # Token revoked or expired early
+                token = await self.app_token(rejected=token)
+                refreshed = True
+                continue
+            if resp.status_code == 429:
+                raise HelixThrottled(resp, self.limiter.retry_after())
+            resp.raise_for_status()
+            return resp.json()
+
+    async def get_user(self, login):
+        async def load():
+            data = (await self.helix("users", {"login": login}))["data"]
+            return data[0] if data else None
+        return await self.users.get(login.lower(), load)
+
+    async def get_follower_count(self, broadcaster_id):
+        async def load():
+            data = await self.helix("channels/followers", {"broadcaster_id": broadcaster_id, "first": 1})
+            return data.get("total", 0)
+        try:
+            return await self.followers.get(broadcaster_id, load)
+        except httpx.HTTPStatusError:
+            # The count is decoration; a channel page still works without it
+            return 0
+
+    async def get_videos(self, **params):
+        return (await self.helix("videos", params))["data"]
+
+    async def get_archive_page(self, user_id, cursor=None, first=VODS_PAGE_SIZE):
+        """(videos, next cursor or None) for one page of a channel's past broadcasts.
+
+        The listing already carries the full video objects, so no per-id
+        detail lookup is needed.
+        """
+        async def load():
+            params = {"user_id": user_id, "type": "archive", "first": first}
+            if cursor:
+                params["after"] = cursor
+            data = await self.helix("videos", params)
+            videos = data["data"]
+            next_cursor = (data.get("pagination") or {}).get("cursor") if videos else None
+            return videos, next_cursor
+        return await self.vod_pages.get((user_id, cursor, first), load)
+
+    def prefetch_archive_page(self, user_id, cursor, first=VODS_PAGE_SIZE):
+        """Load the page after one just served into the cache, at background priority.
+
+        Returns the task; a failed prefetch is dropped, the page is simply
+        loaded on demand instead.
+        """
+        async def prefetch():
+            try:
+                await self.get_archive_page(user_id, cursor, first)
+            except httpx.HTTPError:
+                pass
+
+        self.counters["prefetches"] += 1
+        # The task copies the context, and with it the background priority
+        with background():
+            task = asyncio.ensure_future(prefetch())
+        self._prefetches.add(task)
+        task.add_done_callback(self._prefetches.discard)
+        return task
+
+    def stats(self):
+        return {
+            **self.counters,
+            "rate_limit": self.limiter.stats(),
+            "users": self.users.stats(),
+            "followers": self.followers.stats(),
+            "vod_pages": self.vod_pages.stats(),
+        }
+
+
+twitch = TwitchClient()
+
+
+def sized_thumbnail(url, size="320x180"):
+    # Helix thumbnails are templates like ...-%{width}x%{height}.jpg
+    return url.replace("%{width}x%{height}", size) if url else url
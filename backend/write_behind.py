@@ -0,0 +1,248 @@
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+# Pipeline writes to Supabase are queued here and sent in the background:
+# inserts into the same table are sent as one bulk insert, and successive
+# updates of the same row are merged so only the latest values go out.
+# A flush happens every WRITE_BEHIND_INTERVAL seconds, as soon as
+# WRITE_BEHIND_BATCH_SIZE rows are waiting, and on flush()/close().
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.5"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+# Attempts per flushed batch before its rows are dropped
+WRITE_BEHIND_RETRIES = int(os.getenv("WRITE_BEHIND_RETRIES", "3"))
+
+
+class WriteBehind:
+    """Coalescing write buffer in front of a Supabase client.
+
+    Only ``client.table(name).insert(rows).execute()`` and
+    ``client.table(name).update(values).eq(column, value).execute()`` are
+    used, so any stand-in with that shape works. Pending inserts are sent
+    before pending updates, so a status written after a job's clips never
+    becomes visible before them.
+
+    ``on_write(table, rows=None, where=None)`` is called after every write
+    that went through: with the inserted ``rows``, or with ``where`` set to
+    the (column, value) of an update.
+
+    Writes can be tagged with an ``owner`` (the project a job writes for),
+    so ``flush(owner)`` and ``flush_retrying(owner=...)`` report on that
+    owner's writes only: another project's failure doesn't fail this job,
+    and rows of this owner that a background flush dropped still do.
+    """
+
+    def __init__(self, client, interval=WRITE_BEHIND_INTERVAL, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 retries=WRITE_BEHIND_RETRIES, on_write=None):
+        self.client = client
+        self.on_write = on_write
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.retries = retries
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._inserts = defaultdict(list)     # table -> [(row, attempts, owner)]
+        self._updates = OrderedDict()         # (table, column, value) -> (values, attempts, owner)
+        self._dropped_owners = set()          # owners with dropped writes nobody has been told about
+        self._pending_rows = 0
+        self._closed = False
+        self._thread = None
+        self.counters = {
+            "rows_inserted": 0, "insert_requests": 0,
+            "updates_queued": 0, "updates_sent": 0,
+            "flushes": 0, "errors": 0, "dropped": 0,
+        }
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="supabase-write-behind", daemon=True)
+            self._thread.start()
+
+    def insert(self, table, rows, owner=None):
+        if isinstance(rows, dict):
+            rows = [rows]
+        with self._cond:
+            self._inserts[table].extend((row, 0, owner) for row in rows)
+            self._pending_rows += len(rows)
+            if self._pending_rows >= self.batch_size:
+                self._cond.notify_all()
+        self._ensure_thread()
+
+    def update(self, table, values, value, column="id", owner=None):
+        """Queue ``UPDATE table SET values WHERE column = value``, merged with earlier pending ones."""
+        key = (table, column, value)
+        with self._cond:
+            pending, _, _ = self._updates.pop(key, ({}, 0, None))
+            self._updates[key] = ({**pending, **values}, 0, owner)
+            self.counters["updates_queued"] += 1
+        self._ensure_thread()
+
+    def _take(self):
+        with self._cond:
+            inserts, self._inserts = self._inserts, defaultdict(list)
+            updates, self._updates = self._updates, OrderedDict()
+            self._pending_rows = 0
+        return inserts, updates
+
+    def _requeue_inserts(self, table, entries):
+        keep = [entry for entry in entries if entry[1] < self.retries]
+        with self._cond:
+            if len(keep) < len(entries):
+                self._dropped_owners.update(
+                    owner for _, attempts, owner in entries if attempts >= self.retries and owner is not None
+                )
+                self.counters["dropped"] += len(entries) - len(keep)
+                print(f"❌ Dropped {len(entries) - len(keep)} rows for {table} after {self.retries} attempts")
+            self._inserts[table][:0] = keep
+            self._pending_rows += len(keep)
+
+    def _requeue_update(self, key, values, attempts, owner):
+        with self._cond:
+            if attempts >= self.retries:
+                if owner is not None:
+                    self._dropped_owners.add(owner)
+                self.counters["dropped"] += 1
+                print(f"❌ Dropped update of {key[0]}.{key[1]}={key[2]} after {attempts} attempts")
+                return
+            # Anything queued meanwhile is newer and wins
+            newer, _, newer_owner = self._updates.pop(key, ({}, 0, owner))
+            self._updates[key] = ({**values, **newer}, attempts, newer_owner)
+            self._updates.move_to_end(key, last=False)
+
+    def _pending_for(self, owner):
+        # Called with the condition held
+        return (any(o == owner for entries in self._inserts.values() for _, _, o in entries)
+                or any(o == owner for _, _, o in self._updates.values()))
+
+    def _outcome(self, owner):
+        """"sent", "pending" or "dropped" for ``owner``'s writes; reports a drop once."""
+        with self._cond:
+            if owner in self._dropped_owners:
+                self._dropped_owners.discard(owner)
+                return "dropped"
+            return "pending" if self._pending_for(owner) else "sent"
+
+    def flush(self, owner=None):
+        """Send everything queued so far. Failed writes stay queued for the next flush.
+
+        Returns whether every write went through, or with ``owner`` set,
+        whether all of that owner's writes have (including ones flushed
+        earlier in the background).
+        """
+        ok = self._flush()
+        return ok if owner is None else self._outcome(owner) == "sent"
+
+    def _flush(self):
+        with self._flush_lock:
+            inserts, updates = self._take()
+            failed = set()   # owners with inserts that didn't go through
+            for table, entries in inserts.items():
+                # Batched per owner, so one project's bad rows don't hold back another's
+                by_owner = defaultdict(list)
+                for entry in entries:
+                    by_owner[entry[2]].append(entry)
+                for owner, owned in by_owner.items():
+                    for i in range(0, len(owned), self.batch_size):
+                        batch = owned[i:i + self.batch_size]
+                        rows = [row for row, _, _ in batch]
+                        try:
+                            self.client.table(table).insert(rows).execute()
+                        except Exception as e:
+                            failed.add(owner)
+                            print(f"⚠️ Bulk insert of {len(rows)} rows into {table} failed: {e}")
+                            with self._cond:
+                                self.counters["errors"] += 1
+                            # Keep the unsent rows in order, ahead of anything newer
+                            self._requeue_inserts(table, [(row, a + 1, o) for row, a, o in batch] + owned[i + len(batch):])
+                            break
+                        with self._cond:
+                            self.counters["rows_inserted"] += len(rows)
+                            self.counters["insert_requests"] += 1
+                        if self.on_write:
+                            self.on_write(table, rows=rows)
+            ok = not failed
+            if failed:
+                # Hold the updates back until the inserts they follow went through;
+                # untagged writes may follow anyone's
+                held = [key for key, (_, _, owner) in updates.items()
+                        if owner is None or owner in failed or None in failed]
+                for key in reversed(held):
+                    self._requeue_update(key, *updates.pop(key))
+            for key, (values, attempts, owner) in updates.items():
+                table, column, value = key
+                try:
+                    self.client.table(table).update(values).eq(column, value).execute()
+                except Exception as e:
+                    ok = False
+                    print(f"⚠️ Update of {table}.{column}={value} failed: {e}")
+                    with self._cond:
+                        self.counters["errors"] += 1
+                    self._requeue_update(key, values, attempts + 1, owner)
+                    continue
+                with self._cond:
+                    self.counters["updates_sent"] += 1
+                if self.on_write:
+                    self.on_write(table, where=(column, value))
+            with self._cond:
+                self.counters["flushes"] += 1
+            return ok
+
+    def flush_retrying(self, owner=None, attempts=None, check=None):
+        """flush() until a flush goes through, at most ``attempts`` times (default ``retries + 1``).
+
+        With ``owner`` set, only that owner's writes have to go through.
+        Waits ``interval`` between attempts, calling ``check()`` first so a
+        job can stop waiting. Returns False if the writes are still failing
+        or were dropped after their last attempt.
+        """
+        attempts = self.retries + 1 if attempts is None else max(1, attempts)
+        for attempt in range(attempts):
+            if attempt:
+                if check:
+                    check()
+                time.sleep(self.interval)
+            ok = self._flush()
+            if owner is not None:
+                outcome = self._outcome(owner)
+                if outcome != "pending":
+                    return outcome == "sent"
+                continue
+            if ok:
+                return True
+            with self._cond:
+                if not self._pending_rows and not self._updates:
+                    # Nothing left to retry: what failed was dropped
+                    return False
+        return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and self._pending_rows < self.batch_size:
+                    self._cond.wait(timeout=self.interval)
+                closed = self._closed
+                idle = not self._inserts and not self._updates
+            if not idle:
+                self._flush()
+                if self._pending_rows or self._updates:
+                    # Failed writes were requeued; don't spin on a dead connection
+                    time.sleep(self.interval)
+            if closed:
+                return
+
+    def close(self):
+        """Stop the background thread and flush what's left."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self._flush()
+
+    def stats(self):
+        with self._cond:
+            counters = dict(self.counters)
+            counters["pending_rows"] = self._pending_rows
+            counters["pending_updates"] = len(self._updates)
+        return counters
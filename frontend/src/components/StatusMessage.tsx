@@ -1,30 +1,47 @@
 import { useState, useEffect } from "react";
 
 interface StatusMessageProps {
-    active: boolean;
+    projectId: string | null;
+    onDone?: () => void;
 }
 
-function StatusMessage({ active }: StatusMessageProps) {
+interface ProgressEvent {
+    stage: string;
+    percent: number;
+    message: string;
+}
+
+// Stages after which the server closes the stream
+const TERMINAL_STAGES = ["done", "failed", "cancelled", "timed_out"];
+
+function StatusMessage({ projectId, onDone }: StatusMessageProps) {
     const [status, setStatus] = useState("");
 
     useEffect(() => {
-        if (!active) {
+        if (!projectId) {
             setStatus(""); // reset when not active
             return;
         }
 
-        const interval = setInterval(async () => {
-            try {
-                const res = await fetch("http://localhost:8000/status");
-                const data = await res.json();
-                setStatus(data.status);
-            } catch (error) {
-                setStatus("Error fetching status");
+        // Pushed by the server as the project's pipeline moves, instead of polling
+        const events = new EventSource(`http://localhost:8000/project-events/${projectId}`);
+        events.addEventListener("progress", (e) => {
+            const event: ProgressEvent = JSON.parse((e as MessageEvent).data);
+            setStatus(`${event.message} (${Math.round(event.percent)}%)`);
+            if (TERMINAL_STAGES.includes(event.stage)) {
+                events.close();
+                if (event.stage === "done" && onDone) {
+                    onDone();
+                }
             }
-        }, 1000);
+        });
+        events.onerror = () => {
+            // EventSource reconnects on its own; the server replays the latest event
+            setStatus((current) => current || "Waiting for status...");
+        };
 
-        return () => clearInterval(interval);
-    }, [active]);
+        return () => events.close();
+    }, [projectId]);
 
     return <div>{status}</div>;
 }
@@ -26,6 +26,9 @@ const Channel = () => {
     const [vods, setVods] = useState<VodData[]>([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
+    // Cursor of the next page of the archive; null once it has all been shown
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => {
         const fetchData = async () => {
@@ -46,6 +49,7 @@ const Channel = () => {
 
                 setUserData(data.user);
                 setVods(data.vods);
+                setNextCursor(data.next_cursor ?? null);
                 setLoading(false);
             } catch (err: unknown) {
                 console.error(err);
@@ -61,6 +65,40 @@ const Channel = () => {
         fetchData();
     }, [username]);
 
+    const loadMoreVods = async () => {
+        if (!nextCursor || loadingMore) return;
+        setLoadingMore(true);
+        try {
+            const response = await fetch(
+                `http://localhost:8000/api/get-channel-vods?username=${username}&cursor=${encodeURIComponent(nextCursor)}`
+            );
+
+            if (!response.ok)
+                throw new Error(
+                    `API error: ${response.status} ${response.statusText}`
+                );
+
+            const data = await response.json();
+
+            if (data.error) throw new Error(data.error);
+
+            // Skip any VOD already shown, in case the archive shifted between pages
+            setVods((current) => {
+                const seen = new Set(current.map((vod) => vod.id));
+                return [
+                    ...current,
+                    ...(data.vods as VodData[]).filter((vod) => !seen.has(vod.id)),
+                ];
+            });
+            setNextCursor(data.next_cursor ?? null);
+        } catch (err: unknown) {
+            console.error(err);
+            alert('Could not load more VODs. Please try again.');
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleVodClick = (vod: VodData) => {
         navigate(`/workflow`, { state: { vodData: { ...vod, display_name: userData?.display_name } } });
     };
@@ -243,6 +281,21 @@ const Channel = () => {
                     </div>
                 ))}
             </div>
+
+            {nextCursor && (
+                <div className="flex justify-center pb-8">
+                    <button
+                        onClick={loadMoreVods}
+                        disabled={loadingMore}
+                        className="flex items-center px-4 py-2 text-sm bg-zinc-900 border border-zinc-700 rounded-lg hover:bg-zinc-800 transition-colors disabled:opacity-50"
+                    >
+                        {loadingMore && (
+                            <ArrowPathIcon className="w-4 h-4 mr-2 text-zinc-400 animate-spin" />
+                        )}
+                        {loadingMore ? 'Loading...' : 'Load more'}
+                    </button>
+                </div>
+            )}
         </div>
     );
 };
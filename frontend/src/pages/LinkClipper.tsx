@@ -6,12 +6,10 @@ function LinkClipper() {
     const [twitchURL, setTwitchURL] = useState('');
     const [startTime, setStartTime] = useState('');
     const [endTime, setEndTime] = useState('');
-    const [statusActive, setStatusActive] = useState(false);
+    const [projectId, setProjectId] = useState<string | null>(null);
     const navigate = useNavigate();
 
     const handleSubmit = async () => {
-        setStatusActive(true);
-
         try {
             const response = await fetch("http://localhost:8000/clips", {
                 method: "POST",
@@ -37,7 +35,8 @@ function LinkClipper() {
 
             const data = await response.json();
             console.log("Got response:", data);
-            navigate("/clips", { state: { clips: data.clips } });
+            // The clips are generated in the background; follow the project's progress
+            setProjectId(data.project_id);
         } catch (err) {
             console.error("Failed to submit:", err);
         }
@@ -83,7 +82,10 @@ function LinkClipper() {
                     Get Hype Moments
                 </button>
 
-                <StatusMessage active={statusActive} />
+                <StatusMessage
+                    projectId={projectId}
+                    onDone={() => navigate('/dashboard', { state: { newProjectId: projectId } })}
+                />
             </div>
         </div>
     );